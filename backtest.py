@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+Событийный бэктест стратегии скальпинга на исторических свечах
+Свечи прогоняются через ScalpingStrategy с симулированными часами,
+исполнением по следующей свече, комиссией и проскальзыванием
+"""
+
+import argparse
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from batch_indicators import analyze_batch
+from candle_store import CandleStore
+from config import Config
+from market_recorder import candles_from_recording
+from market_data import interval_to_ms
+from position_book import PositionBook
+from scalping_strategy import EXIT_STOP_LOSS, EXIT_TAKE_PROFIT, EXIT_TIMEOUT, ScalpingStrategy
+
+CANDLE_COLUMNS = ("start", "open", "high", "low", "close", "volume")
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def to_datetime(timestamp_ms: int) -> datetime:
+    """Переводит время свечи (мс, UTC) в наивный datetime, как datetime.now() стратегии"""
+    return _EPOCH + timedelta(milliseconds=int(timestamp_ms))
+
+
+def load_candles(path: str) -> Dict[str, np.ndarray]:
+    """Загружает свечи из CSV (start,open,high,low,close,volume) или .npz с такими же колонками"""
+    if path.endswith(".npz"):
+        with np.load(path) as data:
+            return {column: data[column] for column in CANDLE_COLUMNS}
+
+    with open(path) as f:
+        has_header = not f.readline().split(",")[0].strip().isdigit()
+    table = np.loadtxt(path, delimiter=",", skiprows=1 if has_header else 0, ndmin=2)
+    candles = {column: table[:, i] for i, column in enumerate(CANDLE_COLUMNS)}
+    candles["start"] = candles["start"].astype(np.int64)
+
+    # Выгрузки REST идут от новых свечей к старым
+    if len(candles["start"]) > 1 and candles["start"][0] > candles["start"][-1]:
+        candles = {column: values[::-1] for column, values in candles.items()}
+    return candles
+
+
+def read_candles(source: str, from_store: bool = False, from_recording: bool = False) -> Dict[str, np.ndarray]:
+    """Свечи из файла или символа: из локального хранилища (без копирования) или из записи потоков"""
+    if from_recording:
+        candles = candles_from_recording(source, Config.CANDLE_INTERVAL)
+        if not len(candles["start"]):
+            raise ValueError(f"В записи нет закрытых свечей {source} {Config.CANDLE_INTERVAL}")
+        return candles
+    if not from_store:
+        return load_candles(source)
+    candles = CandleStore().load(source, Config.CANDLE_INTERVAL)
+    if not len(candles["start"]):
+        raise ValueError(f"В хранилище нет свечей {source} {Config.CANDLE_INTERVAL}")
+    return candles
+
+
+class SimulatedExchange:
+    """Симулятор исполнения: рыночные ордера с проскальзыванием и комиссией"""
+
+    def __init__(self, fee_rate: float = 0.00055, slippage: float = 0.0001):
+        self.fee_rate = fee_rate
+        self.slippage = slippage
+        self.order_seq = 0
+        self.fees_paid = 0.0
+        # Книга позиций, как у BybitClient (без приватных потоков)
+        self.positions = PositionBook()
+
+    def fill_price(self, side: str, price: float) -> float:
+        """Цена исполнения рыночного ордера с учетом проскальзывания"""
+        return price * (1 + self.slippage) if side == "Buy" else price * (1 - self.slippage)
+
+    def fill(self, side: str, quantity: float, price: float) -> Dict:
+        """Исполняет рыночный ордер"""
+        self.order_seq += 1
+        avg_price = self.fill_price(side, price)
+        fee = avg_price * quantity * self.fee_rate
+        self.fees_paid += fee
+        return {"orderId": f"bt-{self.order_seq}", "avgPrice": avg_price, "qty": quantity, "fee": fee}
+
+
+class Backtester:
+    """Прогоняет историю свечей одного символа через ScalpingStrategy"""
+
+    def __init__(self, candles: Dict[str, np.ndarray], config: Optional[Config] = None,
+                 fee_rate: float = 0.00055, slippage: float = 0.0001, symbol: Optional[str] = None):
+        self.config = config or Config()
+        self.candles = candles
+        self.symbol = symbol or self.config.SYMBOL
+        self.exchange = SimulatedExchange(fee_rate, slippage)
+        self.interval_ms = interval_to_ms(self.config.CANDLE_INTERVAL) or 60_000
+
+        # Вместо клиента биржи — симулятор; решения о выходе и лимиты берутся из кода стратегии
+        self.strategy = ScalpingStrategy(client=self.exchange, symbol=self.symbol, config=self.config)
+        self.now_ms = 0
+        self.strategy.clock = lambda: to_datetime(self.now_ms)
+
+        self.trades: List[Dict] = []
+
+    def run(self, signals: Optional[np.ndarray] = None) -> Dict:
+        """Выполняет бэктест и возвращает статистику (сигналы можно передать заранее рассчитанными)"""
+        started = time.perf_counter()
+        start = self.candles["start"]
+        open_ = self.candles["open"]
+        high = self.candles["high"]
+        low = self.candles["low"]
+        close = self.candles["close"]
+        total = len(close)
+
+        # Сигналы на закрытии каждой свечи одним векторным проходом
+        if signals is None:
+            signals = self.compute_signals(self.candles, self.config)
+        entries = np.flatnonzero(signals[:-1])
+
+        positions = self.strategy.positions
+        i = 0
+        while i < total:
+            if not positions:
+                # Без позиций пропускаем свечи до следующего сигнала
+                nxt = np.searchsorted(entries, i)
+                if nxt >= len(entries):
+                    break
+                i = int(entries[nxt])
+            else:
+                self._process_exits(i, start[i], open_[i], high[i], low[i], close[i])
+
+            if i + 1 < total and signals[i]:
+                self.now_ms = start[i] + self.interval_ms
+                can_open, _ = self.strategy.can_open_position()
+                if can_open:
+                    self.strategy.last_signal_time = self.strategy.clock()
+                    self._open_position(i + 1, "Buy" if signals[i] > 0 else "Sell", start[i + 1], open_[i + 1])
+            i += 1
+
+        # Закрываем оставшиеся позиции по последней цене
+        self.now_ms = start[-1] + self.interval_ms
+        for position in list(positions.values()):
+            self._close_position(position, close[-1], "end_of_data")
+
+        stats = self.statistics()
+        stats["candles"] = total
+        stats["elapsed"] = time.perf_counter() - started
+        return stats
+
+    @staticmethod
+    def compute_signals(candles: Dict[str, np.ndarray], config: Config) -> np.ndarray:
+        """Сигналы стратегии на закрытии каждой свечи"""
+        table = analyze_batch(candles["close"][None, :], candles["volume"][None, :], config)
+        return table["signal"][0]
+
+    def _open_position(self, index: int, side: str, start_ms: int, price: float):
+        fill = self.exchange.fill(side, self.config.QUANTITY, price)
+        self.now_ms = start_ms
+        self.strategy.book.add({
+            "symbol": self.symbol,
+            "side": side,
+            "size": self.config.QUANTITY,
+            "entry_price": fill["avgPrice"],
+            "open_time": self.strategy.clock().isoformat(),
+            "order_id": fill["orderId"],
+            "entry_fee": fill["fee"],
+            "entry_index": index,
+        })
+
+    def _process_exits(self, index: int, start_ms: int, open_: float, high: float, low: float, close: float):
+        """Проверяет выходы внутри свечи: сначала худшая цена, затем лучшая, затем закрытие"""
+        for position in list(self.strategy.positions.values()):
+            if position["entry_index"] > index:
+                continue
+            is_long = position["side"] == "Buy"
+            adverse, favorable = (low, high) if is_long else (high, low)
+
+            self.now_ms = start_ms
+            reason, _ = self.strategy.exit_reason(position, adverse)
+            if reason == EXIT_STOP_LOSS:
+                self._close_position(position, self._exit_level(position, -self.config.STOP_LOSS, open_), reason)
+                continue
+            reason, _ = self.strategy.exit_reason(position, favorable)
+            if reason == EXIT_TAKE_PROFIT:
+                self._close_position(position, self._exit_level(position, self.config.PROFIT_TARGET, open_), reason)
+                continue
+
+            self.now_ms = start_ms + self.interval_ms
+            reason, _ = self.strategy.exit_reason(position, close)
+            if reason == EXIT_TIMEOUT:
+                self._close_position(position, close, reason)
+
+    @staticmethod
+    def _exit_level(position: Dict, pnl_percent: float, open_: float) -> float:
+        """Цена срабатывания TP/SL; при гэпе через уровень — цена открытия свечи"""
+        entry = position["entry_price"]
+        if position["side"] == "Buy":
+            level = entry * (1 + pnl_percent)
+            return min(level, open_) if pnl_percent < 0 else max(level, open_)
+        level = entry * (1 - pnl_percent)
+        return max(level, open_) if pnl_percent < 0 else min(level, open_)
+
+    def _close_position(self, position: Dict, price: float, reason: str):
+        close_side = "Sell" if position["side"] == "Buy" else "Buy"
+        fill = self.exchange.fill(close_side, position["size"], price)
+        direction = 1 if position["side"] == "Buy" else -1
+        gross = (fill["avgPrice"] - position["entry_price"]) * position["size"] * direction
+        self.trades.append({
+            "side": position["side"],
+            "entry_time": position["open_time"],
+            "exit_time": self.strategy.clock().isoformat(),
+            "entry_price": position["entry_price"],
+            "exit_price": fill["avgPrice"],
+            "pnl": gross - position["entry_fee"] - fill["fee"],
+            "reason": reason,
+        })
+        self.strategy.book.remove(position["order_id"])
+
+    def statistics(self) -> Dict:
+        """Считает P&L, просадку и статистику сделок"""
+        pnl = np.array([trade["pnl"] for trade in self.trades])
+        if len(pnl) == 0:
+            return {"trades": 0, "total_pnl": 0.0, "max_drawdown": 0.0, "win_rate": 0.0,
+                    "profit_factor": 0.0, "avg_trade": 0.0, "fees": 0.0, "exit_reasons": {}}
+
+        equity = np.cumsum(pnl)
+        drawdown = np.maximum.accumulate(np.maximum(equity, 0)) - equity
+        gains = pnl[pnl > 0].sum()
+        losses = -pnl[pnl < 0].sum()
+        reasons: Dict[str, int] = {}
+        for trade in self.trades:
+            reasons[trade["reason"]] = reasons.get(trade["reason"], 0) + 1
+
+        return {
+            "trades": len(pnl),
+            "total_pnl": float(equity[-1]),
+            "max_drawdown": float(drawdown.max()),
+            "win_rate": float((pnl > 0).mean()),
+            "profit_factor": float(gains / losses) if losses > 0 else float("inf"),
+            "avg_trade": float(pnl.mean()),
+            "fees": self.exchange.fees_paid,
+            "exit_reasons": reasons,
+        }
+
+
+def print_report(stats: Dict):
+    """Выводит отчет бэктеста"""
+    print(f"📊 Свечей: {stats['candles']}, время: {stats['elapsed']:.2f} с")
+    print(f"   Сделок: {stats['trades']}")
+    print(f"   P&L: {stats['total_pnl']:.4f} (комиссии {stats['fees']:.4f})")
+    print(f"   Макс. просадка: {stats['max_drawdown']:.4f}")
+    print(f"   Доля прибыльных: {stats['win_rate']:.2%}")
+    print(f"   Profit factor: {stats['profit_factor']:.2f}")
+    print(f"   Средняя сделка: {stats['avg_trade']:.6f}")
+    print(f"   Причины выхода: {stats['exit_reasons']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бэктест стратегии скальпинга")
+    parser.add_argument("candles", help="CSV или .npz со свечами: start,open,high,low,close,volume (или символ с --store/--recording)")
+    parser.add_argument("--store", action="store_true", help="читать свечи символа из локального хранилища")
+    parser.add_argument("--recording", action="store_true", help="читать закрытые свечи символа из записи потоков")
+    parser.add_argument("--fee", type=float, default=0.00055, help="комиссия taker, доля")
+    parser.add_argument("--slippage", type=float, default=0.0001, help="проскальзывание, доля")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    candles = read_candles(args.candles, args.store, args.recording)
+    print_report(Backtester(candles, fee_rate=args.fee, slippage=args.slippage).run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+from typing import Dict, Optional
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from config import Config
+
+# Размер блока для рекуррентных фильтров: внутри блока EMA считается одним
+# матричным умножением, между блоками переносится только последнее значение
+EMA_BLOCK = 256
+
+# Коды сигналов в таблице
+HOLD, BUY, SELL = 0, 1, -1
+
+MIN_CANDLES = 50
+VOLUME_PERIOD = 20
+
+_weights_cache = {}
+
+
+def _ema_weights(alpha: float, size: int):
+    """Матрица весов EMA для блока и множители переносимого значения"""
+    key = (alpha, size)
+    if key not in _weights_cache:
+        decay = 1 - alpha
+        lags = np.arange(size)[:, None] - np.arange(size)[None, :]
+        weights = np.where(lags >= 0, alpha * decay ** np.maximum(lags, 0), 0.0)
+        carry = decay ** np.arange(1, size + 1)
+        _weights_cache[key] = (weights.T.copy(), carry)
+    return _weights_cache[key]
+
+
+def ema(values: np.ndarray, alpha: float, initial: Optional[np.ndarray] = None) -> np.ndarray:
+    """Рекуррентная EMA по последней оси: y[t] = alpha * x[t] + (1 - alpha) * y[t - 1]
+
+    Без initial ряд инициализируется первым значением, как в ScalpingStrategy.calculate_ema.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    result = np.empty_like(values)
+    if values.shape[-1] == 0:
+        return result
+    prev = values[..., 0].copy() if initial is None else np.asarray(initial, dtype=np.float64)
+
+    for start in range(0, values.shape[-1], EMA_BLOCK):
+        block = values[..., start:start + EMA_BLOCK]
+        weights, carry = _ema_weights(alpha, block.shape[-1])
+        out = block @ weights + prev[..., None] * carry
+        result[..., start:start + EMA_BLOCK] = out
+        prev = out[..., -1]
+    return result
+
+
+def wilder(values: np.ndarray, period: int) -> np.ndarray:
+    """Сглаживание Уайлдера: SMA первых period значений, далее EMA с alpha = 1 / period
+
+    Значения до завершения инициализации равны NaN.
+    """
+    result = np.full(values.shape, np.nan)
+    if values.shape[-1] < period:
+        return result
+    seed = values[..., :period].mean(axis=-1)
+    result[..., period - 1] = seed
+    result[..., period:] = ema(values[..., period:], 1 / period, initial=seed)
+    return result
+
+
+def rsi(close: np.ndarray, period: int = 14) -> np.ndarray:
+    """RSI Уайлдера для каждой свечи; 50 до накопления period + 1 цен"""
+    deltas = np.diff(close, axis=-1)
+    avg_gain = wilder(np.where(deltas > 0, deltas, 0.0), period)
+    avg_loss = wilder(np.where(deltas < 0, -deltas, 0.0), period)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        values = 100 - 100 / (1 + avg_gain / avg_loss)
+    values = np.where(avg_loss == 0, 100.0, values)
+    values = np.where(np.isnan(avg_gain), 50.0, values)
+
+    # Для первой свечи изменения нет
+    first = np.full(close.shape[:-1] + (1,), 50.0)
+    return np.concatenate([first, values], axis=-1)
+
+
+def rolling_mean_std(values: np.ndarray, period: int, chunk: int = 4096):
+    """Скользящие среднее и стандартное отклонение (ddof=0); NaN до заполнения окна"""
+    mean = np.full(values.shape, np.nan)
+    std = np.full(values.shape, np.nan)
+    total = values.shape[-1]
+    if total < period:
+        return mean, std
+
+    # Окна обрабатываются кусками, чтобы ограничить временную память
+    for start in range(period - 1, total, chunk):
+        stop = min(start + chunk, total)
+        windows = sliding_window_view(values[..., start - period + 1:stop], period, axis=-1)
+        mean[..., start:stop] = windows.mean(axis=-1)
+        std[..., start:stop] = windows.std(axis=-1)
+    return mean, std
+
+
+def expanding_tail_mean(values: np.ndarray, period: int) -> np.ndarray:
+    """Среднее последних min(t + 1, period) значений, как np.mean(values[-period:])"""
+    cumsum = np.cumsum(values, axis=-1)
+    shifted = np.zeros_like(cumsum)
+    shifted[..., period:] = cumsum[..., :-period]
+    counts = np.minimum(np.arange(1, values.shape[-1] + 1), period)
+    return (cumsum - shifted) / counts
+
+
+def compute_indicators(close: np.ndarray, volume: np.ndarray, config: Optional[Config] = None,
+                       bb_period: int = 20, bb_std: float = 2,
+                       fast: int = 12, slow: int = 26, signal: int = 9) -> Dict[str, np.ndarray]:
+    """Рассчитывает индикаторы стратегии для массивов (символы x свечи) за один проход
+
+    Значение в столбце t совпадает с тем, что ScalpingStrategy.analyze_market
+    вернула бы для свечей [0..t] этого символа.
+    """
+    config = config or Config()
+    close = np.atleast_2d(np.asarray(close, dtype=np.float64))
+    volume = np.atleast_2d(np.asarray(volume, dtype=np.float64))
+    candles = close.shape[-1]
+    index = np.arange(candles)
+
+    # RSI
+    rsi_values = rsi(close, config.RSI_PERIOD)
+
+    # Полосы Боллинджера (до заполнения окна все полосы равны цене)
+    middle, std = rolling_mean_std(close, bb_period)
+    warm = index < bb_period - 1
+    middle = np.where(warm, close, middle)
+    std = np.where(warm, 0.0, std)
+
+    # MACD и сигнальная линия как EMA от ряда MACD
+    macd_line = ema(close, 2 / (fast + 1)) - ema(close, 2 / (slow + 1))
+    signal_line = ema(macd_line, 2 / (signal + 1))
+    macd_ready = index >= slow - 1
+    macd_line = np.where(macd_ready, macd_line, 0.0)
+    signal_line = np.where(macd_ready, signal_line, 0.0)
+
+    return {
+        "close": close,
+        "rsi": rsi_values,
+        "bb_upper": middle + std * bb_std,
+        "bb_middle": middle,
+        "bb_lower": middle - std * bb_std,
+        "macd_line": macd_line,
+        "macd_signal": signal_line,
+        "macd_histogram": macd_line - signal_line,
+        "volume": volume,
+        "volume_avg": expanding_tail_mean(volume, VOLUME_PERIOD),
+    }
+
+
+def compute_signals(indicators: Dict[str, np.ndarray], config: Optional[Config] = None) -> Dict[str, np.ndarray]:
+    """Векторная версия ScalpingStrategy.evaluate_signals для таблицы индикаторов: те же сигналы и сила"""
+    config = config or Config()
+    close = indicators["close"]
+    rsi_values = indicators["rsi"]
+    macd_line = indicators["macd_line"]
+    signal_line = indicators["macd_signal"]
+    histogram = indicators["macd_histogram"]
+
+    strength = np.zeros(close.shape)
+    strength += np.where(rsi_values < config.RSI_OVERSOLD, 2,
+                         np.where(rsi_values > config.RSI_OVERBOUGHT, -2, 0))
+    strength += np.where(close < indicators["bb_lower"], 1,
+                         np.where(close > indicators["bb_upper"], -1, 0))
+    strength += np.where((macd_line > signal_line) & (histogram > 0), 1,
+                         np.where((macd_line < signal_line) & (histogram < 0), -1, 0))
+    strength += np.where(indicators["volume"] > indicators["volume_avg"] * 1.5, 0.5, 0)
+
+    signal = np.where(strength >= 2, BUY, np.where(strength <= -2, SELL, HOLD)).astype(np.int8)
+
+    # analyze_market не дает сигналов, пока свечей меньше MIN_CANDLES
+    warm = np.arange(close.shape[-1]) < MIN_CANDLES - 1
+    signal[..., warm] = HOLD
+    strength[..., warm] = 0
+
+    return {"signal": signal, "strength": np.abs(strength)}
+
+
+def analyze_batch(close: np.ndarray, volume: np.ndarray, config: Optional[Config] = None) -> Dict[str, np.ndarray]:
+    """Полные таблицы индикаторов и сигналов для массивов (символы x свечи)"""
+    indicators = compute_indicators(close, volume, config)
+    indicators.update(compute_signals(indicators, config))
+    return indicators
+
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Нагрузочный бенчмарк бота на локальном симуляторе биржи
+Запускает exchange_simulator в отдельном процессе и полный ScalpingBot против него;
+измеряет задержку и пропускную способность цикла стратегии без сети
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import statistics
+import time
+import urllib.request
+from collections import defaultdict
+
+
+def run_simulator(port: int, symbols: list, options: dict):
+    """Точка входа процесса симулятора"""
+    from exchange_simulator import build_simulator, serve
+
+    simulator = build_simulator(symbols, options.pop("interval"), seed=options.pop("seed"),
+                                speed=options.pop("speed"), **options)
+    try:
+        asyncio.run(serve(simulator, "127.0.0.1", port))
+    except KeyboardInterrupt:
+        pass
+
+
+def wait_for_server(url: str, timeout: float = 10.0):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            with urllib.request.urlopen(f"{url}/sim/stats", timeout=1) as response:
+                return json.load(response)
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.1)
+
+
+def percentile(ordered: list, share: float) -> float:
+    return ordered[min(len(ordered) - 1, int(len(ordered) * share))]
+
+
+async def run_bot(duration: float) -> dict:
+    """Работает duration секунд и возвращает задержки циклов по символам"""
+    from main import ScalpingBot
+
+    bot = ScalpingBot()
+    samples = defaultdict(list)
+    cycle = bot.run_strategy_cycle
+
+    async def timed_cycle(symbol: str):
+        started = time.perf_counter()
+        await cycle(symbol)
+        samples[symbol].append((time.perf_counter() - started) * 1000)
+
+    bot.run_strategy_cycle = timed_cycle
+    task = asyncio.create_task(bot.run())
+    await asyncio.sleep(duration)
+    bot.running = False
+    await task
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк бота на локальном симуляторе биржи")
+    parser.add_argument("--symbols", type=int, default=5, help="число символов")
+    parser.add_argument("--duration", type=float, default=30, help="длительность, секунды")
+    parser.add_argument("--port", type=int, default=8091)
+    parser.add_argument("--latency", type=float, default=0.02, help="задержка ответа REST, секунды")
+    parser.add_argument("--jitter", type=float, default=0.01)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--speed", type=float, default=1.0, help="ускорение времени симулятора")
+    parser.add_argument("--rest", action="store_true", help="цикл по таймеру через REST вместо WebSocket")
+    args = parser.parse_args()
+
+    symbols = [f"SIM{i}USDT" for i in range(args.symbols)]
+    url = f"http://127.0.0.1:{args.port}"
+    options = {"interval": "1", "seed": 1, "speed": args.speed, "latency": args.latency,
+               "jitter": args.jitter, "error_rate": args.error_rate}
+    simulator = multiprocessing.Process(target=run_simulator, args=(args.port, symbols, options), daemon=True)
+    simulator.start()
+
+    # Config читает окружение при импорте, поэтому оно задается до импорта бота
+    os.environ.update({
+        "BYBIT_API_KEY": "bench",
+        "BYBIT_SECRET_KEY": "bench",
+        "BYBIT_REST_URL": url,
+        "BYBIT_WS_URL": f"ws://127.0.0.1:{args.port}/v5/public/linear",
+        "BYBIT_WS_PRIVATE_URL": f"ws://127.0.0.1:{args.port}/v5/private",
+        "SYMBOLS": ",".join(symbols),
+        "USE_WEBSOCKET": "false" if args.rest else "true",
+        "USE_CANDLE_STORE": "false",
+        "CYCLE_INTERVAL": "1",
+        "API_RATE_LIMIT": "1000",
+        "API_RATE_BURST": "1000",
+        "LOG_LEVEL": "WARNING",
+    })
+    try:
+        wait_for_server(url)
+        print(f"🧪 Симулятор {url}: {len(symbols)} символов, задержка {args.latency * 1000:.0f} ms, "
+              f"ошибки {args.error_rate:.1%}, режим {'REST' if args.rest else 'WebSocket'}")
+        samples = asyncio.run(run_bot(args.duration))
+        stats = wait_for_server(url)
+    finally:
+        simulator.terminate()
+        simulator.join()
+
+    from latency import recorder
+
+    latencies = sorted(value for values in samples.values() for value in values)
+    if not latencies:
+        print("❌ Ни одного цикла стратегии")
+        return
+    requests = sum(stats["requests"].values())
+    print(f"   Циклов: {len(latencies)} ({len(latencies) / args.duration:.1f}/с)")
+    print(f"   Задержка цикла: median={statistics.median(latencies):.2f} ms  "
+          f"p95={percentile(latencies, 0.95):.2f} ms  p99={percentile(latencies, 0.99):.2f} ms")
+    print("   Стадии:")
+    for line in recorder.summary():
+        print(f"     {line}")
+    print(f"   REST-запросов: {requests} ({requests / args.duration:.1f}/с), WS-сообщений: {stats['ws_messages']}")
+    print(f"   Исполнений: {stats['executions']}, ошибок внедрено: {stats['errors_injected']}")
+    for path, count in sorted(stats["requests"].items()):
+        print(f"     {path}: {count}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк REST-транспорта BybitClient на локальном stub-сервере
+Сравнивает задержку цикла: последовательные блокирующие вызовы pybit
+против параллельных запросов через пул потоков
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+os.environ.setdefault('BYBIT_API_KEY', 'bench')
+os.environ.setdefault('BYBIT_SECRET_KEY', 'bench')
+
+from config import Config
+
+STUB_RESPONSES = {
+    "/v5/market/tickers": {"list": [{"symbol": "BTCUSDT", "lastPrice": "50000.0"}]},
+    "/v5/market/kline": {"list": [["1700000000000", "1", "2", "0.5", "1.5", "10", "15"]] * 100},
+    "/v5/position/list": {"list": [{"symbol": "BTCUSDT", "size": "0"}]},
+}
+
+
+def make_handler(latency: float):
+    """Создает обработчик stub-сервера с заданной задержкой ответа"""
+
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            time.sleep(latency)
+            result = STUB_RESPONSES.get(urlparse(self.path).path, {})
+            body = json.dumps({"retCode": 0, "retMsg": "OK", "result": result, "time": 0}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    return StubHandler
+
+
+async def sequential_cycle(client, symbol: str):
+    """Старое поведение: блокирующие вызовы pybit прямо из корутины"""
+    client.session.get_positions(category="linear", symbol=symbol)
+    client.session.get_tickers(category="linear", symbol=symbol)
+    client.session.get_kline(category="linear", symbol=symbol, interval="1", limit=100)
+
+
+async def pooled_cycle(client, symbol: str):
+    """Новое поведение: независимые запросы выполняются параллельно в пуле"""
+    await asyncio.gather(
+        client.get_open_positions(symbol),
+        client.get_market_price(symbol),
+        client.get_kline_data(symbol, "1", 100)
+    )
+
+
+async def measure(cycle, client, symbol: str, iterations: int) -> list:
+    """Замеряет задержку цикла в миллисекундах"""
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        await cycle(client, symbol)
+        samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+
+def report(name: str, samples: list):
+    """Выводит статистику задержек"""
+    ordered = sorted(samples)
+    p95 = ordered[int(len(ordered) * 0.95) - 1]
+    print(f"{name:<24} median={statistics.median(ordered):8.2f} ms  p95={p95:8.2f} ms")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк REST-транспорта BybitClient")
+    parser.add_argument("--latency", type=float, default=0.05, help="задержка stub-сервера, секунды")
+    parser.add_argument("--iterations", type=int, default=20)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(args.latency))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    Config.BYBIT_REST_URL = f"http://127.0.0.1:{server.server_address[1]}"
+
+    from bybit_client import BybitClient
+    client = BybitClient()
+    symbol = Config.SYMBOL
+
+    print(f"⏱ Stub-сервер {Config.BYBIT_REST_URL}, задержка {args.latency * 1000:.0f} ms")
+    sequential = await measure(sequential_cycle, client, symbol, args.iterations)
+    pooled = await measure(pooled_cycle, client, symbol, args.iterations)
+    report("последовательно", sequential)
+    report("пул соединений", pooled)
+    print(f"📉 Снижение задержки цикла: {statistics.median(sequential) / statistics.median(pooled):.2f}x")
+
+    client.close_connection()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
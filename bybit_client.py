@@ -1,30 +1,215 @@
 import asyncio
 import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from functools import partial
 from typing import Dict, List, Optional, Tuple
+import numpy as np
+from requests.adapters import HTTPAdapter
+from pybit.exceptions import InvalidRequestError
 from pybit.unified_trading import HTTP
 from pybit.unified_trading import WebSocket
 from config import Config
+from decoding import klines_from_rest, loads
+from kline_cache import KLINE_PAGE_SIZE, KlineRing, interval_to_ms
+from latency import recorder
+from order_tracker import OrderTracker
+from position_book import PositionBook
+from rate_limiter import PRIORITY_ACCOUNT, PRIORITY_MARKET, PRIORITY_TRADE, RequestScheduler
+
+# Код отказа Bybit по лимиту запросов
+RET_RATE_LIMIT = 10006
+
+# Ордеров в одном пакетном запросе create/amend/cancel (linear)
+BATCH_ORDER_LIMIT = 10
+
+# Приоритет методов pybit в очереди запросов: торговые операции обгоняют чтение рыночных данных
+REQUEST_PRIORITIES = {
+    "place_order": PRIORITY_TRADE,
+    "cancel_order": PRIORITY_TRADE,
+    "cancel_all_orders": PRIORITY_TRADE,
+    "place_batch_order": PRIORITY_TRADE,
+    "amend_batch_order": PRIORITY_TRADE,
+    "cancel_batch_order": PRIORITY_TRADE,
+    "get_open_orders": PRIORITY_ACCOUNT,
+    "get_positions": PRIORITY_ACCOUNT,
+    "get_wallet_balance": PRIORITY_ACCOUNT,
+}
+
+def tick_decimals(tick: float) -> int:
+    """Число знаков после запятой в шаге цены"""
+    return max(0, -Decimal(str(tick)).normalize().as_tuple().exponent)
+
+
+def round_to_tick(price: float, tick: float) -> float:
+    """Округляет цену до шага инструмента"""
+    return round(round(price / tick) * tick, tick_decimals(tick))
+
+
+def format_price(price: float, tick: Optional[float] = None) -> str:
+    """Цена строкой для API: столько знаков, сколько в шаге цены"""
+    if not tick:
+        return str(price)
+    return f"{round_to_tick(price, tick):.{tick_decimals(tick)}f}"
+
+
+class EndpointWebSocket(WebSocket):
+    """pybit WebSocket с явным адресом (локальный симулятор, стенды) и уведомлением о (пере)подключении
+    
+    Сообщения разбираются быстрым парсером JSON (decoding.loads). Сообщения стакана
+    передаются колбэку как есть: локальный стакан ведет OrderBook, а собственная копия
+    pybit (списки уровней и deepcopy на каждую дельту) не нужна.
+    """
+    
+    def __init__(self, url: Optional[str] = None, on_open=None, **kwargs):
+        self.endpoint_url = url
+        self.on_open = on_open
+        super().__init__(**kwargs)
+    
+    def _connect(self, url):
+        super()._connect(self.endpoint_url or url)
+    
+    def _on_open(self):
+        super()._on_open()
+        # Вызывается из потока WebSocket при каждом подключении, в том числе после обрыва
+        if self.on_open:
+            self.on_open()
+    
+    def _on_message(self, message):
+        # Разбор сообщения через orjson, если он установлен (pybit всегда берет json)
+        message = loads(message)
+        if self._is_custom_pong(message):
+            return
+        self.callback(message)
+    
+    def _process_normal_message(self, message):
+        if message["topic"].startswith("orderbook."):
+            self._get_callback(message["topic"])(message)
+        else:
+            super()._process_normal_message(message)
 
 class BybitClient:
+    """Соединение с Bybit: пул HTTP с планировщиком запросов, публичный и приватный WebSocket,
+    кэши свечей и шага цены, трекер ордеров и книга позиций
+    
+    Бот, стратегии и потоки данных всех символов процесса работают через один клиент
+    (BybitClient.shared()), поэтому число соединений и память не растут с числом стратегий.
+    """
+    
+    _shared: Optional["BybitClient"] = None
+    
+    @classmethod
+    def shared(cls) -> "BybitClient":
+        """Общий клиент процесса; создается при первом обращении"""
+        if cls._shared is None:
+            cls._shared = cls()
+        return cls._shared
+    
     def __init__(self):
         self.config = Config()
         self.session = HTTP(
             testnet=self.config.BYBIT_TESTNET,
             api_key=self.config.BYBIT_API_KEY,
-            api_secret=self.config.BYBIT_SECRET_KEY
+            api_secret=self.config.BYBIT_SECRET_KEY,
+            # Заголовки X-Bapi-Limit-* нужны планировщику запросов
+            return_response_headers=True
         )
+        # Отказ по лимиту повторяет планировщик, не занимая поток пула сном pybit
+        self.session.retry_codes.discard(RET_RATE_LIMIT)
+        if self.config.BYBIT_REST_URL:
+            self.session.endpoint = self.config.BYBIT_REST_URL
         
-        self.ws = WebSocket(
-            testnet=self.config.BYBIT_TESTNET,
-            channel_type="linear"
-        )
+        # pybit блокирующий, поэтому REST-запросы выполняются в ограниченном пуле
+        # потоков, а keep-alive соединения переиспользуются через общий пул requests
+        pool_size = self.config.HTTP_POOL_SIZE
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.client.mount("https://", adapter)
+        self.session.client.mount("http://", adapter)
+        self.executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="bybit-http")
+        
+        # Общий бюджет запросов для всех символов, работающих через этот клиент,
+        # с приоритетами и лимитами endpoint из ответов биржи
+        self.scheduler = RequestScheduler(self.config.API_RATE_LIMIT, self.config.API_RATE_BURST,
+                                          self.config.API_LIMIT_RESERVE)
+        
+        # Кэш свечей по (символ, интервал): повторные запросы догружают только новые свечи
+        self._klines: Dict[Tuple[str, str], KlineRing] = {}
+        self._kline_locks: Dict[Tuple[str, str], asyncio.Lock] = {}
+        # Шаг цены по символам: уровни TP/SL округляются до него
+        self._tick_sizes: Dict[str, float] = {}
+        
+        # WebSocket создается при первой подписке. На топик биржи подписываемся один раз,
+        # сообщения раздаются всем подписчикам клиента; топики запоминаются для переподключения
+        self._ws = None
+        # топик → [подписка у биржи, кортеж колбэков]
+        self._topics: Dict[str, List] = {}
+        self.ws_reconnected_at = 0.0
+        
+        # Приватный WebSocket: исполнения ордеров без дополнительных REST-запросов
+        self._private_ws = None
+        self.orders = OrderTracker()
+        # Позиции и кошелек из потоков position и wallet; REST — только при (пере)подключении
+        self.positions = PositionBook()
         
         self.logger = logging.getLogger(__name__)
+    
+    @property
+    def ws(self) -> WebSocket:
+        """Публичный WebSocket, открывается лениво"""
+        if self._ws is None:
+            self._ws = EndpointWebSocket(self.config.BYBIT_WS_URL or None, testnet=self.config.BYBIT_TESTNET,
+                                        channel_type="linear")
+        return self._ws
+    
+    @property
+    def private_ws(self) -> WebSocket:
+        """Приватный WebSocket (ордера, исполнения, позиции, кошелек), открывается лениво"""
+        if self._private_ws is None:
+            self._private_ws = EndpointWebSocket(self.config.BYBIT_WS_PRIVATE_URL or None,
+                                                 on_open=self._on_private_open,
+                                                 testnet=self.config.BYBIT_TESTNET, channel_type="private",
+                                                 api_key=self.config.BYBIT_API_KEY,
+                                                 api_secret=self.config.BYBIT_SECRET_KEY)
+        return self._private_ws
+    
+    def _on_private_open(self):
+        """Пока приватный поток был отключен, обновления могли потеряться: сверяемся через REST"""
+        loop = self.positions._loop
+        if self.positions.streaming and not loop.is_closed():
+            loop.call_soon_threadsafe(lambda: asyncio.ensure_future(self.sync_account()))
+    
+    async def _request(self, method: str, **params) -> Dict:
+        """Выполняет вызов pybit в пуле потоков, не блокируя event loop
+        
+        Очередность задает планировщик запросов; отказ по лимиту (10006) повторяется
+        после сброса окна endpoint, но не больше RATE_LIMIT_RETRIES раз.
+        """
+        priority = REQUEST_PRIORITIES.get(method, PRIORITY_MARKET)
+        loop = asyncio.get_running_loop()
+        for attempt in range(self.config.RATE_LIMIT_RETRIES + 1):
+            with recorder.measure("rate_limit_wait"):
+                await self.scheduler.acquire(method, priority)
+            try:
+                # Полный круг запроса: ожидание потока пула, HTTP и разбор ответа
+                with recorder.measure(f"rest.{method}"):
+                    response, _, headers = await loop.run_in_executor(
+                        self.executor,
+                        partial(getattr(self.session, method), **params)
+                    )
+            except InvalidRequestError as e:
+                if e.status_code != RET_RATE_LIMIT or attempt == self.config.RATE_LIMIT_RETRIES:
+                    raise
+                wait = self.scheduler.throttled(method, e.resp_headers)
+                self.logger.warning("Лимит запросов %s исчерпан, повтор через %.2f с", method, wait)
+                continue
+            self.scheduler.update(method, headers)
+            return response
         
     async def get_account_info(self) -> Dict:
         """Получает информацию об аккаунте"""
         try:
-            response = self.session.get_wallet_balance(accountType="UNIFIED", coin="USDT")
+            response = await self._request("get_wallet_balance", accountType="UNIFIED", coin="USDT")
             return response
         except Exception as e:
             self.logger.error(f"Ошибка при получении информации об аккаунте: {e}")
@@ -33,7 +218,7 @@ class BybitClient:
     async def get_market_price(self, symbol: str) -> Optional[float]:
         """Получает текущую рыночную цену"""
         try:
-            response = self.session.get_tickers(category="linear", symbol=symbol)
+            response = await self._request("get_tickers", category="linear", symbol=symbol)
             if response and 'result' in response and response['result'] and 'list' in response['result']:
                 return float(response['result']['list'][0]['lastPrice'])
             return None
@@ -41,15 +226,27 @@ class BybitClient:
             self.logger.error(f"Ошибка при получении рыночной цены: {e}")
             return None
     
-    async def get_kline_data(self, symbol: str, interval: str, limit: int = 100) -> List[Dict]:
-        """Получает данные свечей"""
+    async def get_orderbook(self, symbol: str, limit: int = 50) -> Dict:
+        """Снимок стакана: {"s", "b", "a", "u", "seq"}, уровни [[цена, объем], ...] от лучшей цены"""
         try:
-            response = self.session.get_kline(
-                category="linear",
-                symbol=symbol,
-                interval=interval,
-                limit=limit
-            )
+            response = await self._request("get_orderbook", category="linear", symbol=symbol, limit=limit)
+            if response and response.get('result'):
+                return response['result']
+            return {}
+        except Exception as e:
+            self.logger.error(f"Ошибка при получении стакана: {e}")
+            return {}
+    
+    async def get_kline_data(self, symbol: str, interval: str, limit: int = 100,
+                             start: Optional[int] = None, end: Optional[int] = None) -> List[Dict]:
+        """Получает данные свечей (от новых к старым), при необходимости в окне [start, end] мс"""
+        try:
+            params = {"category": "linear", "symbol": symbol, "interval": interval, "limit": limit}
+            if start is not None:
+                params["start"] = start
+            if end is not None:
+                params["end"] = end
+            response = await self._request("get_kline", **params)
             if response and 'result' in response and 'list' in response['result']:
                 return response['result']['list']
             return []
@@ -57,45 +254,243 @@ class BybitClient:
             self.logger.error(f"Ошибка при получении данных свечей: {e}")
             return []
     
-    async def place_order(self, symbol: str, side: str, quantity: float, 
-                         order_type: str = "Market", price: Optional[float] = None) -> Dict:
-        """Размещает ордер"""
-        try:
-            order_params = {
-                "category": "linear",
-                "symbol": symbol,
-                "side": side,
-                "orderType": order_type,
-                "qty": str(quantity),
-                "timeInForce": "GTC"
-            }
-            
-            if price and order_type == "Limit":
-                order_params["price"] = str(price)
+    async def get_klines(self, symbol: str, interval: str, limit: int = 100,
+                         start: Optional[int] = None, end: Optional[int] = None) -> np.ndarray:
+        """Свечи массивом decoding.KLINE_DTYPE по возрастанию времени (последняя может формироваться)"""
+        return klines_from_rest(await self.get_kline_data(symbol, interval, limit, start=start, end=end))
+    
+    async def get_kline_window(self, symbol: str, interval: str, limit: int = 100) -> Dict[str, np.ndarray]:
+        """Последние limit свечей по колонкам (по возрастанию времени) через кэш клиента
+        
+        Первый вызов загружает окно целиком, следующие запрашивают только свечи начиная
+        с последней незакрытой. Последняя свеча окна может еще формироваться.
+        """
+        key = (symbol, interval)
+        lock = self._kline_locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            ring = self._klines.get(key)
+            interval_ms = interval_to_ms(interval)
+            fetch = limit
+            start = None
+            if ring is not None and ring.size and ring.capacity >= limit and interval_ms:
+                # Сколько свечей могло измениться с момента прошлого запроса
+                elapsed = (int(time.time() * 1000) - ring.last_start) // interval_ms + 1
+                if elapsed < ring.capacity:
+                    # Ответ ограничен началом окна, limit лишь страхует от расхождения часов
+                    fetch = ring.capacity
+                    start = ring.last_start
             
-            response = self.session.place_order(**order_params)
-            self.logger.info(f"Ордер размещен: {response}")
+            rows = await self.get_kline_data(symbol, interval, min(fetch, KLINE_PAGE_SIZE), start=start)
+            if start is None:
+                if not rows:
+                    return ring.window(limit) if ring is not None else {}
+                ring = KlineRing(max(limit, ring.capacity if ring is not None else 0))
+                self._klines[key] = ring
+            ring.merge(rows)
+            return ring.window(limit)
+    
+    async def get_linear_symbols(self) -> List[str]:
+        """Получает список торгуемых линейных контрактов"""
+        symbols = []
+        cursor = ""
+        try:
+            while True:
+                response = await self._request(
+                    "get_instruments_info",
+                    category="linear",
+                    limit=1000,
+                    cursor=cursor
+                )
+                result = response.get('result', {}) if response else {}
+                symbols.extend(item['symbol'] for item in result.get('list', [])
+                               if item.get('status') == "Trading")
+                cursor = result.get('nextPageCursor')
+                if not cursor:
+                    return symbols
+        except Exception as e:
+            self.logger.error(f"Ошибка при получении списка инструментов: {e}")
+            return symbols
+    
+    async def get_tick_size(self, symbol: str) -> Optional[float]:
+        """Получает шаг цены инструмента (кэшируется)"""
+        if symbol in self._tick_sizes:
+            return self._tick_sizes[symbol]
+        try:
+            response = await self._request("get_instruments_info", category="linear", symbol=symbol)
+            instruments = response.get('result', {}).get('list', []) if response else []
+            if not instruments:
+                return None
+            tick = float(instruments[0]['priceFilter']['tickSize'])
+            self._tick_sizes[symbol] = tick
+            return tick
+        except Exception as e:
+            self.logger.error(f"Ошибка при получении шага цены {symbol}: {e}")
+            return None
+    
+    def _order_params(self, symbol: str, side: str, quantity: float,
+                      order_type: str = "Market", price: Optional[float] = None,
+                      take_profit: Optional[float] = None, stop_loss: Optional[float] = None,
+                      reduce_only: bool = False, trigger_price: Optional[float] = None,
+                      trigger_direction: Optional[int] = None, order_link_id: Optional[str] = None) -> Dict:
+        """Параметры ордера Bybit (без category) для одиночного и пакетного создания"""
+        tick = self._tick_sizes.get(symbol)
+        order_params = {
+            "symbol": symbol,
+            "side": side,
+            "orderType": order_type,
+            "qty": str(quantity),
+            "timeInForce": "GTC"
+        }
+        
+        if price and order_type == "Limit":
+            order_params["price"] = format_price(price, tick)
+        
+        if take_profit or stop_loss:
+            order_params["tpslMode"] = "Partial"
+            if take_profit:
+                order_params.update(takeProfit=format_price(take_profit, tick),
+                                    tpTriggerBy="LastPrice", tpOrderType="Market")
+            if stop_loss:
+                order_params.update(stopLoss=format_price(stop_loss, tick),
+                                    slTriggerBy="LastPrice", slOrderType="Market")
+        
+        if trigger_price:
+            order_params.update(triggerPrice=format_price(trigger_price, tick),
+                                triggerDirection=trigger_direction, triggerBy="LastPrice")
+        
+        if reduce_only:
+            order_params["reduceOnly"] = True
+        
+        if order_link_id:
+            order_params["orderLinkId"] = order_link_id
+        return order_params
+    
+    async def place_order(self, symbol: str, side: str, quantity: float, 
+                         order_type: str = "Market", price: Optional[float] = None,
+                         take_profit: Optional[float] = None, stop_loss: Optional[float] = None,
+                         reduce_only: bool = False, trigger_price: Optional[float] = None,
+                         trigger_direction: Optional[int] = None, order_link_id: Optional[str] = None) -> Dict:
+        """Размещает ордер
+        
+        take_profit/stop_loss выставляют на бирже условные ордера выхода на исполненный объем
+        (режим Partial: у каждого входа свои уровни). trigger_price делает ордер условным:
+        он активируется, когда цена дойдет до уровня снизу (trigger_direction=1) или сверху (2).
+        """
+        try:
+            order_params = self._order_params(symbol, side, quantity, order_type, price, take_profit, stop_loss,
+                                              reduce_only, trigger_price, trigger_direction, order_link_id)
+            response = await self._request("place_order", category="linear", **order_params)
+            self.logger.info("Ордер размещен: %s", response)
             return response
         except Exception as e:
             self.logger.error(f"Ошибка при размещении ордера: {e}")
             return {}
     
+    async def _batch(self, method: str, items: List[Dict]) -> List[Dict]:
+        """Пакетные запросы по BATCH_ORDER_LIMIT ордеров, пакеты уходят параллельно
+        
+        Результат по каждому ордеру в порядке items: symbol, orderId, orderLinkId,
+        code (0 — успех) и msg. Ошибка всего пакета дает code -1 всем его ордерам.
+        """
+        chunks = [items[i:i + BATCH_ORDER_LIMIT] for i in range(0, len(items), BATCH_ORDER_LIMIT)]
+        responses = await asyncio.gather(*(self._request(method, category="linear", request=chunk)
+                                           for chunk in chunks), return_exceptions=True)
+        results = []
+        for chunk, response in zip(chunks, responses):
+            if isinstance(response, Exception):
+                self.logger.error(f"Ошибка пакетного запроса {method}: {response}")
+                results.extend({"symbol": item.get("symbol"), "orderId": item.get("orderId", ""),
+                                "orderLinkId": item.get("orderLinkId", ""), "code": -1, "msg": str(response)}
+                               for item in chunk)
+                continue
+            orders = response.get('result', {}).get('list', [])
+            codes = (response.get('retExtInfo') or {}).get('list', [])
+            for i, item in enumerate(chunk):
+                order = orders[i] if i < len(orders) else {}
+                code = codes[i] if i < len(codes) else {"code": 0 if order.get('orderId') else -1, "msg": ""}
+                results.append({"symbol": item.get("symbol"),
+                                "orderId": order.get('orderId') or item.get("orderId", ""),
+                                "orderLinkId": order.get('orderLinkId') or item.get("orderLinkId", ""),
+                                "code": int(code.get('code', 0)), "msg": code.get('msg', "")})
+        failed = [result for result in results if result['code']]
+        if failed:
+            self.logger.error(f"Пакетный запрос {method}: отклонено {len(failed)} из {len(results)}, "
+                              f"первые: {failed[:3]}")
+        return results
+    
+    async def place_batch_orders(self, orders: List[Dict]) -> List[Dict]:
+        """Размещает ордера пакетами (один запрос на BATCH_ORDER_LIMIT ордеров)
+        
+        Каждый ордер — аргументы place_order в виде словаря. Результат по каждому
+        ордеру в том же порядке: orderId, orderLinkId, code (0 — успех) и msg.
+        """
+        if not orders:
+            return []
+        results = await self._batch("place_batch_order", [self._order_params(**order) for order in orders])
+        self.logger.info("Пакет ордеров размещен: %s", results)
+        return results
+    
+    async def amend_batch_orders(self, amendments: List[Dict]) -> List[Dict]:
+        """Меняет активные ордера пакетами
+        
+        Каждое изменение — словарь с symbol, order_id и новыми quantity, price или trigger_price.
+        """
+        if not amendments:
+            return []
+        items = []
+        for amendment in amendments:
+            tick = self._tick_sizes.get(amendment['symbol'])
+            item = {"symbol": amendment['symbol'], "orderId": amendment['order_id']}
+            if amendment.get('quantity'):
+                item["qty"] = str(amendment['quantity'])
+            if amendment.get('price'):
+                item["price"] = format_price(amendment['price'], tick)
+            if amendment.get('trigger_price'):
+                item["triggerPrice"] = format_price(amendment['trigger_price'], tick)
+            items.append(item)
+        return await self._batch("amend_batch_order", items)
+    
+    async def cancel_batch_orders(self, orders: List[Dict]) -> List[Dict]:
+        """Отменяет ордера пакетами; каждый ордер — словарь с symbol и order_id"""
+        if not orders:
+            return []
+        return await self._batch("cancel_batch_order", [{"symbol": order['symbol'], "orderId": order['order_id']}
+                                                        for order in orders])
+    
+    async def cancel_order(self, symbol: str, order_id: str) -> bool:
+        """Отменяет ордер (в том числе условный)"""
+        try:
+            await self._request("cancel_order", category="linear", symbol=symbol, orderId=order_id)
+            return True
+        except Exception as e:
+            self.logger.error(f"Ошибка при отмене ордера {order_id}: {e}")
+            return False
+    
     async def close_position(self, symbol: str, side: str, quantity: float) -> Dict:
         """Закрывает позицию"""
         try:
-            # Для закрытия позиции используем противоположную сторону
+            # Для закрытия позиции используем противоположную сторону; reduce-only не даст
+            # открыть встречную позицию, если биржа уже закрыла ее по TP/SL
             close_side = "Sell" if side == "Buy" else "Buy"
-            response = await self.place_order(symbol, close_side, quantity)
-            self.logger.info(f"Позиция закрыта: {response}")
+            response = await self.place_order(symbol, close_side, quantity, reduce_only=True)
+            self.logger.info("Позиция закрыта: %s", response)
             return response
         except Exception as e:
             self.logger.error(f"Ошибка при закрытии позиции: {e}")
             return {}
     
+    async def close_positions(self, positions: List[Dict]) -> List[Dict]:
+        """Закрывает позиции reduce-only ордерами пакетами: N позиций за один круг запросов"""
+        return await self.place_batch_orders([
+            {"symbol": position['symbol'], "side": "Sell" if position['side'] == "Buy" else "Buy",
+             "quantity": position['size'], "reduce_only": True}
+            for position in positions
+        ])
+    
     async def get_open_positions(self, symbol: str) -> List[Dict]:
         """Получает открытые позиции"""
         try:
-            response = self.session.get_positions(category="linear", symbol=symbol)
+            response = await self._request("get_positions", category="linear", symbol=symbol)
             if response and 'result' in response and 'list' in response['result']:
                 positions = []
                 for pos in response['result']['list']:
@@ -107,20 +502,55 @@ class BybitClient:
             self.logger.error(f"Ошибка при получении открытых позиций: {e}")
             return []
     
+    async def sync_account(self) -> bool:
+        """Снимок позиций и кошелька через REST для книги позиций (при подключении приватного потока)"""
+        try:
+            positions, wallet = await asyncio.gather(
+                self._request("get_positions", category="linear", settleCoin="USDT"),
+                self._request("get_wallet_balance", accountType="UNIFIED", coin="USDT"),
+            )
+            self.positions.apply_positions(positions.get('result', {}).get('list', []), snapshot=True)
+            self.positions.apply_wallet(wallet.get('result', {}).get('list', []))
+            return True
+        except Exception as e:
+            self.logger.error(f"Ошибка при сверке позиций: {e}")
+            return False
+    
     async def cancel_all_orders(self, symbol: str) -> bool:
         """Отменяет все ордера для символа"""
         try:
-            response = self.session.cancel_all_orders(category="linear", symbol=symbol)
-            self.logger.info(f"Все ордера отменены: {response}")
+            response = await self._request("cancel_all_orders", category="linear", symbol=symbol)
+            self.logger.info("Все ордера отменены: %s", response)
             return True
         except Exception as e:
             self.logger.error(f"Ошибка при отмене ордеров: {e}")
             return False
     
+    async def get_order(self, symbol: str, order_id: str) -> Optional[Dict]:
+        """Получает состояние ордера (активного или недавно исполненного)"""
+        try:
+            response = await self._request("get_open_orders", category="linear", symbol=symbol, orderId=order_id)
+            orders = response.get('result', {}).get('list', []) if response else []
+            return orders[0] if orders else None
+        except Exception as e:
+            self.logger.error(f"Ошибка при получении ордера {order_id}: {e}")
+            return None
+    
+    async def wait_for_fill(self, symbol: str, order_id: str, timeout: Optional[float] = None) -> Optional[Dict]:
+        """Ждет исполнения ордера из приватного потока; без потока или по таймауту — один запрос REST"""
+        fill = await self.orders.wait_fill(order_id, timeout or self.config.FILL_TIMEOUT)
+        if fill is not None:
+            return fill
+        order = await self.get_order(symbol, order_id)
+        if order:
+            self.orders.apply_orders([order])
+        return self.orders.fill(order_id)
+    
     async def get_order_history(self, symbol: str, limit: int = 50) -> List[Dict]:
         """Получает историю ордеров"""
         try:
-            response = self.session.get_open_orders(
+            response = await self._request(
+                "get_open_orders",
                 category="linear",
                 symbol=symbol,
                 limit=limit
@@ -132,22 +562,144 @@ class BybitClient:
             self.logger.error(f"Ошибка при получении истории ордеров: {e}")
             return []
     
-    def subscribe_to_ticker(self, symbol: str, callback):
-        """Подписывается на обновления тикера"""
+    def _stream(self, method: str, callback, **params):
+        """Подписка у биржи через текущий публичный WebSocket (после переподключения — новый)"""
+        getattr(self.ws, method)(callback=callback, **params)
+    
+    def _fan_out(self, entry: List, message: Dict):
+        """Раздает сообщение топика подписчикам клиента (из потока WebSocket)
+        
+        Сообщение общее: подписчики его не меняют. Ошибка одного подписчика не мешает
+        остальным и не рвет соединение (исключение из колбэка pybit считает обрывом).
+        """
+        for callback in entry[1]:
+            try:
+                callback(message)
+            except Exception as e:
+                self.logger.error(f"Ошибка обработчика {message.get('topic')}: {e}")
+    
+    def _subscribe_topic(self, topic: str, subscribe, callback, name: str) -> str:
+        """Добавляет подписчика топика; у биржи топик подписывается только первым подписчиком"""
+        entry = self._topics.get(topic)
+        if entry is not None:
+            # Кортеж заменяется целиком: поток WebSocket читает его без блокировки
+            entry[1] = entry[1] + (callback,)
+            return topic
+        entry = [subscribe, (callback,)]
         try:
-            self.ws.ticker_stream(
-                symbol=symbol,
-                callback=callback
-            )
+            subscribe(partial(self._fan_out, entry))
+            self._topics[topic] = entry
+        except Exception as e:
+            self.logger.error(f"Ошибка при подписке на {name}: {e}")
+        return topic
+    
+    def subscribe_to_ticker(self, symbol: str, callback) -> str:
+        """Подписывается на обновления тикера; возвращает топик для отписки"""
+        return self._subscribe_topic(f"tickers.{symbol}", partial(self._stream, "ticker_stream", symbol=symbol),
+                                     callback, "тикер")
+    
+    def subscribe_to_kline(self, symbol: str, interval: str, callback) -> str:
+        """Подписывается на обновления свечей; возвращает топик для отписки"""
+        stream = partial(self._stream, "kline_stream", symbol=symbol,
+                         interval=int(interval) if interval.isdigit() else interval)
+        return self._subscribe_topic(f"kline.{interval}.{symbol}", stream, callback, "свечи")
+    
+    def subscribe_to_trades(self, symbol: str, callback) -> str:
+        """Подписывается на публичные сделки; возвращает топик для отписки"""
+        return self._subscribe_topic(f"publicTrade.{symbol}", partial(self._stream, "trade_stream", symbol=symbol),
+                                     callback, "сделки")
+    
+    def subscribe_to_orderbook(self, symbol: str, depth: int, callback) -> str:
+        """Подписывается на стакан orderbook.{depth}: снимок, затем дельты (сырые сообщения)"""
+        stream = partial(self._stream, "orderbook_stream", symbol=symbol, depth=depth)
+        return self._subscribe_topic(f"orderbook.{depth}.{symbol}", stream, callback, "стакан")
+    
+    def unsubscribe(self, topic: str, callback):
+        """Убирает подписчика топика; подписка у биржи остается до переподключения WebSocket
+        
+        pybit 5.7.0 не умеет отписываться, а и в новых версиях колбэк топика снимается только
+        после ответа биржи, так что повторная подписка до него получила бы "already subscribed".
+        Топик без подписчиков просто ничего не раздает, следующий подписчик получает его сразу.
+        """
+        entry = self._topics.get(topic)
+        if entry is None or callback not in entry[1]:
+            return
+        entry[1] = tuple(other for other in entry[1] if other != callback)
+    
+    def subscribe_to_order_updates(self):
+        """Подписывает трекер ордеров на приватные потоки order и execution (из event loop)
+        
+        Повторный вызов ничего не делает: потоки общие, стратегии получают обновления через orders.listeners.
+        """
+        if self.orders.streaming:
+            return
+        self.orders.attach(asyncio.get_running_loop())
+        try:
+            self.private_ws.order_stream(callback=self.orders.on_order)
+            self.private_ws.execution_stream(callback=self.orders.on_execution)
+        except Exception as e:
+            self.orders.streaming = False
+            self.logger.error(f"Ошибка при подписке на исполнения ордеров: {e}")
+    
+    def subscribe_to_account_updates(self):
+        """Подписывает книгу позиций на приватные потоки position и wallet (из event loop)
+        
+        Начальный снимок берется через REST сразу, дальше — при каждом переподключении потока.
+        Повторный вызов ничего не делает.
+        """
+        if self.positions.streaming:
+            return
+        try:
+            ws = self.private_ws
+            self.positions.attach(asyncio.get_running_loop())
+            ws.position_stream(callback=self.positions.on_position)
+            ws.wallet_stream(callback=self.positions.on_wallet)
+            asyncio.ensure_future(self.sync_account())
         except Exception as e:
-            self.logger.error(f"Ошибка при подписке на тикер: {e}")
+            self.positions.streaming = False
+            self.logger.error(f"Ошибка при подписке на позиции и кошелек: {e}")
+    
+    def reset_ws(self):
+        """Закрывает публичный WebSocket, следующая подписка откроет новый"""
+        ws, self._ws = self._ws, None
+        if ws is None:
+            return
+        try:
+            ws.exit()
+        except Exception as e:
+            self.logger.error(f"Ошибка при закрытии WebSocket: {e}")
+    
+    def reconnect_ws(self):
+        """Пересоздает публичный WebSocket и восстанавливает все подписки (блокирующий вызов)"""
+        self.reset_ws()
+        for topic, entry in list(self._topics.items()):
+            # У нового WebSocket подписок нет: топики без подписчиков на нем не нужны
+            if not entry[1]:
+                del self._topics[topic]
+                continue
+            try:
+                entry[0](partial(self._fan_out, entry))
+            except Exception as e:
+                self.logger.error(f"Ошибка при восстановлении подписки {topic}: {e}")
     
     def close_connection(self):
-        """Закрывает WebSocket соединение"""
+        """Закрывает WebSocket соединение и пул HTTP-запросов"""
+        if BybitClient._shared is self:
+            BybitClient._shared = None
         try:
-            if hasattr(self.ws, 'close'):
-                self.ws.close()
-            elif hasattr(self.ws, 'close_connection'):
-                self.ws.close_connection()
+            self.executor.shutdown(wait=False)
+            if self._private_ws is not None:
+                self.orders.streaming = False
+                self.positions.streaming = False
+                self._private_ws.exit()
+                self._private_ws = None
+            if self._ws is None:
+                return
+            if hasattr(self._ws, 'close'):
+                self._ws.close()
+            elif hasattr(self._ws, 'close_connection'):
+                self._ws.close_connection()
+            elif hasattr(self._ws, 'exit'):
+                self._ws.exit()
         except Exception as e:
             self.logger.error(f"Ошибка при закрытии соединения: {e}")
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+Локальное хранилище закрытых свечей: по каталогу на символ и интервал,
+по append-only бинарному файлу на колонку, чтение через memory map без копирования
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from bybit_client import BybitClient
+from config import Config
+from decoding import klines_from_rest
+from kline_cache import INTERVAL_MS, KLINE_PAGE_SIZE, interval_to_ms
+
+# Колонки в порядке строки REST kline и их типы на диске (little-endian, по 8 байт)
+COLUMNS = {
+    "start": np.dtype("<i8"),
+    "open": np.dtype("<f8"),
+    "high": np.dtype("<f8"),
+    "low": np.dtype("<f8"),
+    "close": np.dtype("<f8"),
+    "volume": np.dtype("<f8"),
+    "turnover": np.dtype("<f8"),
+}
+
+# Недельные свечи Bybit начинаются с понедельника, а эпоха Unix — с четверга
+WEEK_OFFSET_MS = 4 * INTERVAL_MS["D"]
+
+
+class CandleStore:
+    """Колоночное хранилище свечей; пишет один процесс, читать могут многие"""
+
+    def __init__(self, root: Optional[str] = None):
+        self.config = Config()
+        self.root = root or self.config.CANDLE_STORE_DIR
+        self.logger = logging.getLogger(__name__)
+        self._last_start: Dict[Tuple[str, str], Optional[int]] = {}
+
+    def _path(self, symbol: str, interval: str, column: Optional[str] = None) -> str:
+        path = os.path.join(self.root, symbol, interval)
+        return os.path.join(path, f"{column}.bin") if column else path
+
+    def count(self, symbol: str, interval: str) -> int:
+        """Число полностью записанных свечей (оборванная запись колонок не учитывается)"""
+        sizes = []
+        for column, dtype in COLUMNS.items():
+            path = self._path(symbol, interval, column)
+            sizes.append(os.path.getsize(path) // dtype.itemsize if os.path.exists(path) else 0)
+        return min(sizes)
+
+    def last_start(self, symbol: str, interval: str) -> Optional[int]:
+        """Время начала последней сохраненной свечи (мс) или None"""
+        key = (symbol, interval)
+        if key not in self._last_start:
+            count = self.count(symbol, interval)
+            start = None
+            if count:
+                with open(self._path(symbol, interval, "start"), "rb") as f:
+                    f.seek((count - 1) * COLUMNS["start"].itemsize)
+                    start = int(np.frombuffer(f.read(COLUMNS["start"].itemsize), dtype=COLUMNS["start"])[0])
+            self._last_start[key] = start
+        return self._last_start[key]
+
+    def load(self, symbol: str, interval: str, start: Optional[int] = None,
+             end: Optional[int] = None) -> Dict[str, np.ndarray]:
+        """Свечи [start, end) как массивы только для чтения поверх файлов (memory map)"""
+        count = self.count(symbol, interval)
+        if not count:
+            return {column: np.empty(0, dtype=dtype) for column, dtype in COLUMNS.items()}
+
+        candles = {
+            column: np.memmap(self._path(symbol, interval, column), dtype=dtype, mode="r", shape=(count,))
+            for column, dtype in COLUMNS.items()
+        }
+        starts = candles["start"]
+        lo = int(np.searchsorted(starts, start)) if start is not None else 0
+        hi = int(np.searchsorted(starts, end)) if end is not None else count
+        return {column: values[lo:hi] for column, values in candles.items()}
+
+    def tail(self, symbol: str, interval: str, limit: int) -> Dict[str, np.ndarray]:
+        """Последние limit свечей"""
+        candles = self.load(symbol, interval)
+        return {column: values[-limit:] for column, values in candles.items()}
+
+    def append(self, symbol: str, interval: str, candles: Dict[str, np.ndarray]) -> int:
+        """Дописывает свечи новее последней сохраненной; возвращает число записанных"""
+        starts = np.asarray(candles["start"], dtype=COLUMNS["start"])
+        last = self.last_start(symbol, interval)
+        keep = slice(int(np.searchsorted(starts, last, side="right")), None) if last is not None else slice(None)
+        if not len(starts[keep]):
+            return 0
+
+        os.makedirs(self._path(symbol, interval), exist_ok=True)
+        count = self.count(symbol, interval)
+        for column, dtype in COLUMNS.items():
+            with open(self._path(symbol, interval, column), "ab") as f:
+                # Хвост оборванной прошлой записи отрезается, колонки выравниваются
+                f.truncate(count * dtype.itemsize)
+                f.write(np.ascontiguousarray(np.asarray(candles[column])[keep], dtype=dtype).tobytes())
+        self._last_start[(symbol, interval)] = int(starts[-1])
+        return len(starts[keep])
+
+    def append_candle(self, symbol: str, interval: str, candle: Dict) -> int:
+        """Дописывает одну закрытую свечу в формате MarketDataFeed"""
+        return self.append(symbol, interval, {column: [candle[column]] for column in COLUMNS})
+
+    def is_current(self, symbol: str, interval: str, now_ms: Optional[int] = None) -> bool:
+        """Есть ли в хранилище последняя закрытая свеча"""
+        interval_ms = interval_to_ms(interval)
+        last = self.last_start(symbol, interval)
+        if not interval_ms or last is None:
+            return False
+        return last >= last_closed_start(interval_ms, now_ms)
+
+    async def sync(self, client: BybitClient, symbol: str, interval: str,
+                   since_ms: Optional[int] = None, now_ms: Optional[int] = None) -> int:
+        """Догружает закрытые свечи через REST: всю историю с since_ms или только недостающий хвост"""
+        interval_ms = interval_to_ms(interval)
+        if not interval_ms:
+            raise ValueError(f"Интервал {interval} не поддерживается хранилищем свечей")
+
+        closed_until = last_closed_start(interval_ms, now_ms)
+        last = self.last_start(symbol, interval)
+        if last is not None:
+            begin = last + interval_ms
+        else:
+            begin = since_ms if since_ms is not None else closed_until - (self.config.CANDLE_STORE_BACKFILL - 1) * interval_ms
+            begin = candle_start(begin, interval_ms)
+        if begin > closed_until:
+            return 0
+
+        # Окна по KLINE_PAGE_SIZE свечей запрашиваются параллельно группами размером с пул HTTP
+        page_ms = KLINE_PAGE_SIZE * interval_ms
+        windows = [(start, min(start + page_ms, closed_until + interval_ms) - 1)
+                   for start in range(begin, closed_until + 1, page_ms)]
+        group = max(1, client.config.HTTP_POOL_SIZE)
+        written = 0
+        for i in range(0, len(windows), group):
+            pages = await asyncio.gather(*(
+                client.get_kline_data(symbol, interval, KLINE_PAGE_SIZE, start=start, end=end)
+                for start, end in windows[i:i + group]
+            ))
+            for rows in pages:
+                if not rows:
+                    if self.last_start(symbol, interval) is None:
+                        # История символа еще не началась
+                        continue
+                    # Пропуск страницы оставил бы дыру в истории — продолжим со следующей синхронизации
+                    self.logger.warning(f"Не удалось загрузить свечи {symbol} {interval}, синхронизация прервана")
+                    return written
+                written += self.append(symbol, interval, candles_from_rows(rows, closed_until))
+
+        if written:
+            self.logger.info(f"Хранилище свечей {symbol} {interval}: добавлено {written}")
+        return written
+
+
+def candle_start(ms: int, interval_ms: int) -> int:
+    """Время начала свечи interval_ms, в которую попадает момент ms"""
+    offset = WEEK_OFFSET_MS if interval_ms == INTERVAL_MS["W"] else 0
+    return ms - (ms - offset) % interval_ms
+
+
+def last_closed_start(interval_ms: int, now_ms: Optional[int] = None) -> int:
+    """Время начала последней закрытой свечи (мс)"""
+    now_ms = now_ms if now_ms is not None else int(time.time() * 1000)
+    return candle_start(now_ms, interval_ms) - interval_ms
+
+
+def candles_from_rows(rows: List[List[str]], closed_until: Optional[int] = None) -> Dict[str, np.ndarray]:
+    """Колонки из строк REST kline (от новых к старым) по возрастанию времени"""
+    klines = klines_from_rest(rows)
+    if closed_until is not None:
+        klines = klines[klines["start"] <= closed_until]
+    return {column: np.ascontiguousarray(klines[column]) for column in COLUMNS}
+
+
+async def backfill(symbols: List[str], interval: str, days: float):
+    """Заполняет хранилище историей за days дней и догружает хвост"""
+    store = CandleStore()
+    client = BybitClient()
+    since_ms = int((time.time() - days * 86_400) * 1000)
+    try:
+        for symbol in symbols:
+            written = await store.sync(client, symbol, interval, since_ms=since_ms)
+            print(f"📦 {symbol} {interval}: +{written}, всего {store.count(symbol, interval)} свечей")
+    finally:
+        client.close_connection()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Загрузка истории свечей в локальное хранилище")
+    parser.add_argument("symbols", nargs="*", default=Config.SYMBOLS, help="символы (по умолчанию SYMBOLS)")
+    parser.add_argument("--interval", default=Config.CANDLE_INTERVAL, help="интервал свечей Bybit")
+    parser.add_argument("--days", type=float, default=30, help="глубина истории для пустого хранилища")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(backfill(args.symbols, args.interval, args.days))
+
+
+if __name__ == "__main__":
+    main()
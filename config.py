@@ -9,15 +9,26 @@ class Config:
     BYBIT_API_KEY = os.getenv('BYBIT_API_KEY')
     BYBIT_SECRET_KEY = os.getenv('BYBIT_SECRET_KEY')
     BYBIT_TESTNET = os.getenv('BYBIT_TESTNET', 'true').lower() == 'true'
+    BYBIT_REST_URL = os.getenv('BYBIT_REST_URL')  # переопределение REST endpoint (стенды, бенчмарки)
+    BYBIT_WS_URL = os.getenv('BYBIT_WS_URL')  # переопределение публичного WebSocket (симулятор)
+    BYBIT_WS_PRIVATE_URL = os.getenv('BYBIT_WS_PRIVATE_URL')  # переопределение приватного WebSocket
+    HTTP_POOL_SIZE = int(os.getenv('HTTP_POOL_SIZE', '8'))  # потоков и keep-alive соединений
+    API_RATE_LIMIT = float(os.getenv('API_RATE_LIMIT', '10'))  # общий бюджет REST-запросов в секунду
+    API_RATE_BURST = float(os.getenv('API_RATE_BURST', '20'))  # допустимый всплеск запросов
+    # Сколько последних запросов окна endpoint оставлять торговым операциям
+    API_LIMIT_RESERVE = int(os.getenv('API_LIMIT_RESERVE', '1'))
+    RATE_LIMIT_RETRIES = int(os.getenv('RATE_LIMIT_RETRIES', '2'))  # повторов после отказа 10006
     
     # Настройки торговли
     SYMBOL = os.getenv('SYMBOL', 'BTCUSDT')
+    # Несколько символов в одном процессе: SYMBOLS=BTCUSDT,ETHUSDT (по умолчанию только SYMBOL)
+    SYMBOLS = [s.strip() for s in os.getenv('SYMBOLS', SYMBOL).split(',') if s.strip()]
     QUANTITY = float(os.getenv('QUANTITY', '0.001'))
     
     # Настройки скальпинга
     PROFIT_TARGET = float(os.getenv('PROFIT_TARGET', '0.002'))  # 0.2%
     STOP_LOSS = float(os.getenv('STOP_LOSS', '0.001'))  # 0.1%
-    MAX_POSITIONS = int(os.getenv('MAX_POSITIONS', '3'))
+    MAX_POSITIONS = int(os.getenv('MAX_POSITIONS', '3'))  # на каждый символ
     
     # Технические индикаторы
     RSI_PERIOD = int(os.getenv('RSI_PERIOD', '14'))
@@ -26,10 +37,64 @@ class Config:
     
     # Временные настройки
     CANDLE_INTERVAL = os.getenv('CANDLE_INTERVAL', '1')  # 1 минута
+    # Старшие интервалы, которые собираются локально из потока CANDLE_INTERVAL: RESAMPLE_INTERVALS=3,5,15,60
+    RESAMPLE_INTERVALS = [s.strip() for s in os.getenv('RESAMPLE_INTERVALS', '').split(',') if s.strip()]
     POSITION_TIMEOUT = int(os.getenv('POSITION_TIMEOUT', '300'))  # 5 минут
+    SIGNAL_COOLDOWN = int(os.getenv('SIGNAL_COOLDOWN', '60'))  # секунд между сигналами
+    CYCLE_INTERVAL = int(os.getenv('CYCLE_INTERVAL', '10'))  # пауза между циклами без WebSocket
+    
+    # Поток рыночных данных
+    USE_WEBSOCKET = os.getenv('USE_WEBSOCKET', 'true').lower() == 'true'
+    WS_STALE_TIMEOUT = int(os.getenv('WS_STALE_TIMEOUT', '30'))  # переподключение при тишине, секунды
+    STATUS_LOG_INTERVAL = int(os.getenv('STATUS_LOG_INTERVAL', '60'))  # период логирования статуса
+    
+    # Символы по процессам: процесс потоков пишет рынок в общую память, процессы стратегий
+    # торгуют через шлюз ордеров. 0 или 1 — все символы в одном процессе
+    SHARD_WORKERS = int(os.getenv('SHARD_WORKERS', '0'))
+    SHARD_POLL_MS = float(os.getenv('SHARD_POLL_MS', '5'))  # период опроса общей памяти процессом стратегий
+    SHARD_RING_SIZE = int(os.getenv('SHARD_RING_SIZE', '200'))  # свечей символа в общей памяти
+    SHARD_HEARTBEAT_TIMEOUT = int(os.getenv('SHARD_HEARTBEAT_TIMEOUT', '30'))  # без отметки — перезапуск процесса
+    
+    # Стакан L2 из потока orderbook: глубина подписки (1, 50, 200, 500), 0 — без стакана
+    ORDERBOOK_DEPTH = int(os.getenv('ORDERBOOK_DEPTH', '50'))
+    ORDERBOOK_LEVELS = int(os.getenv('ORDERBOOK_LEVELS', '5'))  # уровней в расчете перекоса объема
+    IMBALANCE_THRESHOLD = float(os.getenv('IMBALANCE_THRESHOLD', '0.3'))  # перекос, подтверждающий сигнал
+    MAX_SPREAD_BPS = float(os.getenv('MAX_SPREAD_BPS', '5'))  # шире — вход не открывается
+    
+    # Исполнения ордеров, позиции и баланс из приватного WebSocket (иначе — запросы через REST)
+    USE_PRIVATE_WS = os.getenv('USE_PRIVATE_WS', 'true').lower() == 'true'
+    FILL_TIMEOUT = float(os.getenv('FILL_TIMEOUT', '5'))  # ожидание исполнения из потока, секунды
+    # Take profit и stop loss выставляются на бирже вместе с ордером входа
+    EXCHANGE_TPSL = os.getenv('EXCHANGE_TPSL', 'true').lower() == 'true'
+    
+    # Локальное хранилище свечей
+    USE_CANDLE_STORE = os.getenv('USE_CANDLE_STORE', 'true').lower() == 'true'
+    CANDLE_STORE_DIR = os.getenv('CANDLE_STORE_DIR', 'data/candles')
+    CANDLE_STORE_BACKFILL = int(os.getenv('CANDLE_STORE_BACKFILL', '10000'))  # свечей при пустом хранилище
+    
+    # Запись рыночных данных (сделки, тикеры, свечи, стакан) для воспроизведения
+    RECORD_MARKET_DATA = os.getenv('RECORD_MARKET_DATA', 'false').lower() == 'true'
+    RECORDER_DIR = os.getenv('RECORDER_DIR', 'data/recordings')
+    RECORDER_ROTATE_MB = int(os.getenv('RECORDER_ROTATE_MB', '64'))  # размер файла до ротации
+    RECORDER_FLUSH_INTERVAL = float(os.getenv('RECORDER_FLUSH_INTERVAL', '1'))  # период записи на диск, секунды
+    
+    # API статуса для мониторинга
+    STATUS_API_ENABLED = os.getenv('STATUS_API_ENABLED', 'true').lower() == 'true'
+    STATUS_API_HOST = os.getenv('STATUS_API_HOST', '127.0.0.1')  # в ответах данные счета: наружу — только через прокси
+    STATUS_API_PORT = int(os.getenv('STATUS_API_PORT', '8080'))
+    STATUS_PUSH_INTERVAL = float(os.getenv('STATUS_PUSH_INTERVAL', '1'))  # период push-потока, секунды
+    LATENCY_LOG_INTERVAL = int(os.getenv('LATENCY_LOG_INTERVAL', '300'))  # период сводки задержек, 0 — выключена
     
     # Логирование
     LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+    LOG_FILE = os.getenv('LOG_FILE', 'scalping_bot.log')
+    # Запись лога в фоновом потоке через очередь: диск и stdout не задерживают event loop
+    LOG_ASYNC = os.getenv('LOG_ASYNC', 'true').lower() == 'true'
+    LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', '100000'))  # при переполнении записи отбрасываются
+    LOG_JSON = os.getenv('LOG_JSON', 'true').lower() == 'true'  # файл лога строками JSON
+    LOG_MAX_MB = int(os.getenv('LOG_MAX_MB', '50'))  # размер файла лога до ротации
+    LOG_BACKUP_COUNT = int(os.getenv('LOG_BACKUP_COUNT', '5'))
+    LOG_DEBUG_SAMPLE = int(os.getenv('LOG_DEBUG_SAMPLE', '100'))  # пишется каждое N-е DEBUG-сообщение шаблона
     
     @classmethod
     def validate(cls):
@@ -40,6 +105,12 @@ class Config:
         if cls.QUANTITY <= 0:
             raise ValueError("QUANTITY должен быть больше 0")
         
+        if not cls.SYMBOLS:
+            raise ValueError("SYMBOLS должен содержать хотя бы один символ")
+        
+        if cls.API_RATE_LIMIT <= 0:
+            raise ValueError("API_RATE_LIMIT должен быть больше 0")
+        
         if cls.PROFIT_TARGET <= 0 or cls.STOP_LOSS <= 0:
             raise ValueError("PROFIT_TARGET и STOP_LOSS должны быть больше 0")
         
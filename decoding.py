@@ -0,0 +1,96 @@
+"""
+Разбор ответов REST и сообщений WebSocket Bybit в типизированные массивы NumPy.
+
+Свечи становятся структурированным массивом KLINE_DTYPE по возрастанию времени
+(Bybit отдает их от новых к старым строками из строк), а columns() дает
+индикаторам колонки этого массива без копирования.
+"""
+
+import json
+from typing import Dict, Iterable, List, Sequence, Union
+
+import numpy as np
+
+try:
+    # orjson разбирает сообщения потоков примерно в полтора-два раза быстрее json
+    import orjson
+    loads = orjson.loads
+except ImportError:
+    loads = json.loads
+
+# Свеча: колонки строки REST kline и признак закрытия (у строк REST всегда 1,
+# последняя строка может еще формироваться — это видно только по времени)
+KLINE_DTYPE = np.dtype([("start", "<i8"), ("open", "<f8"), ("high", "<f8"), ("low", "<f8"),
+                        ("close", "<f8"), ("volume", "<f8"), ("turnover", "<f8"), ("confirm", "?")])
+
+# Колонки строки REST kline: [start, open, high, low, close, volume, turnover]
+REST_COLUMNS = KLINE_DTYPE.names[:7]
+
+# Тикер: время сообщения (мс) и цены; пустые поля дельты — NaN
+TICKER_DTYPE = np.dtype([("ts", "<i8"), ("last", "<f8"), ("bid", "<f8"), ("ask", "<f8"),
+                         ("mark", "<f8"), ("volume24h", "<f8")])
+
+# Поля тикера Bybit по колонкам TICKER_DTYPE (кроме ts)
+TICKER_FIELDS = ("lastPrice", "bid1Price", "ask1Price", "markPrice", "volume24h")
+
+
+def klines_from_rest(rows: Sequence[Sequence[str]]) -> np.ndarray:
+    """Строки REST kline (от новых к старым) в массив KLINE_DTYPE по возрастанию времени"""
+    width = len(REST_COLUMNS)
+    klines = np.empty(len(rows), dtype=KLINE_DTYPE)
+    if not len(rows):
+        return klines
+    # Строки разбираются один раз в C; дальше свечи живут только в типизированном виде
+    values = np.array(rows, dtype=np.float64)[::-1, :width]
+    for i, column in enumerate(REST_COLUMNS):
+        # Время в мс меньше 2**53 и переживает float64 без потерь
+        klines[column] = values[:, i]
+    klines["confirm"] = True
+    return klines
+
+
+def klines_from_ws(items: Iterable[Dict]) -> np.ndarray:
+    """Элементы data сообщения kline.{interval}.{symbol} в массив KLINE_DTYPE"""
+    return np.array([(int(item["start"]), float(item["open"]), float(item["high"]), float(item["low"]),
+                      float(item["close"]), float(item["volume"]), float(item["turnover"]), bool(item["confirm"]))
+                     for item in items], dtype=KLINE_DTYPE)
+
+
+def klines_from_candles(candles: Iterable[Dict]) -> np.ndarray:
+    """Свечи-словари буфера MarketDataFeed (уже разобранные, по возрастанию) в массив KLINE_DTYPE"""
+    return np.array([(candle["start"], candle["open"], candle["high"], candle["low"], candle["close"],
+                      candle["volume"], candle["turnover"], candle.get("confirm", True))
+                     for candle in candles], dtype=KLINE_DTYPE)
+
+
+def as_klines(data: Union[np.ndarray, Sequence]) -> np.ndarray:
+    """Свечи в любом из форматов бота (массив, строки REST, словари свечей) как массив KLINE_DTYPE"""
+    if isinstance(data, np.ndarray):
+        if data.dtype != KLINE_DTYPE:
+            raise ValueError(f"Ожидался массив свечей {KLINE_DTYPE}, получен {data.dtype}")
+        return data
+    if not len(data):
+        return np.empty(0, dtype=KLINE_DTYPE)
+    if isinstance(data[0], dict):
+        return klines_from_candles(data)
+    return klines_from_rest(data)
+
+
+def columns(klines: np.ndarray) -> Dict[str, np.ndarray]:
+    """Колонки массива свечей — представления без копирования (с шагом в размер записи)"""
+    return {name: klines[name] for name in KLINE_DTYPE.names}
+
+
+def to_candles(klines: np.ndarray) -> List[Dict]:
+    """Массив KLINE_DTYPE в свечи-словари буфера MarketDataFeed"""
+    return [dict(zip(KLINE_DTYPE.names, record)) for record in klines.tolist()]
+
+
+def _price(value) -> float:
+    return float(value) if value not in (None, "") else np.nan
+
+
+def tickers(items: Iterable[Dict], ts: int = 0) -> np.ndarray:
+    """Тикеры (result.list REST get_tickers или data сообщения tickers) в массив TICKER_DTYPE"""
+    return np.array([(ts,) + tuple(_price(item.get(field)) for field in TICKER_FIELDS) for item in items],
+                    dtype=TICKER_DTYPE)
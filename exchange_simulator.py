@@ -0,0 +1,1005 @@
+#!/usr/bin/env python3
+"""
+Локальный симулятор Bybit v5 для нагрузочного тестирования без сети
+Отдает подмножество REST, публичного и приватного WebSocket, которое использует бот,
+исполняет ордера по воспроизводимым свечам, добавляет задержки и ошибки
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import random
+import time
+from collections import OrderedDict, defaultdict
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+from aiohttp import WSMsgType, web
+
+from kline_cache import interval_to_ms
+
+# Опорные точки пути цены внутри свечи: open -> экстремум -> экстремум -> close
+PATH_KNOTS = (0.0, 1 / 3, 2 / 3, 1.0)
+
+# Задержка подтверждения подписки WebSocket, секунды
+SUBSCRIBE_ACK_DELAY = 0.05
+
+# Шаг цены инструментов симулятора
+TICK_SIZE = "0.1"
+
+# Уровней на сторону в стакане симулятора (все глубины подписки получают один стакан)
+BOOK_DEPTH = 50
+
+# Сколько последних ордеров доступно в /v5/order/realtime по orderId
+ORDER_HISTORY_SIZE = 500
+
+# Ордеров в одном пакетном запросе (linear)
+BATCH_ORDER_LIMIT = 10
+
+# Коды ошибок Bybit, которые отдает симулятор
+RET_OK = 0
+RET_INVALID_PARAMS = 10001
+RET_RATE_LIMIT = 10006
+RET_SERVER_ERROR = 10016
+RET_ORDER_NOT_FOUND = 110001
+RET_REDUCE_ONLY = 110017
+
+
+class SimulatorError(Exception):
+    """Ошибка запроса с кодом Bybit"""
+
+    def __init__(self, code: int, message: str):
+        super().__init__(message)
+        self.code = code
+
+
+def synthetic_candles(count: int, interval_ms: int, price: float = 50000.0,
+                      volatility: float = 0.001, seed: Optional[int] = None) -> Dict[str, np.ndarray]:
+    """Случайное блуждание цены в формате свечей backtest.load_candles"""
+    rng = np.random.default_rng(seed)
+    close = price * np.exp(np.cumsum(rng.normal(0, volatility, count)))
+    open_ = np.concatenate([[price], close[:-1]])
+    wick = np.abs(rng.normal(0, volatility / 2, (2, count)))
+    return {
+        "start": np.arange(count, dtype=np.int64) * interval_ms,
+        "open": open_,
+        "high": np.maximum(open_, close) * (1 + wick[0]),
+        "low": np.minimum(open_, close) * (1 - wick[1]),
+        "close": close,
+        "volume": rng.uniform(1, 100, count),
+    }
+
+
+class MarketReplay:
+    """Воспроизводит свечи одного символа в реальном или ускоренном времени
+
+    Время свечей пересчитывается от текущего момента: свеча history формируется
+    при старте, более ранние отдаются как история. Цена внутри свечи идет по
+    ломаной open -> экстремум -> экстремум -> close, поэтому состояние рынка —
+    чистая функция времени и не требует тикового цикла.
+    """
+
+    def __init__(self, symbol: str, candles: Dict[str, np.ndarray], interval: str,
+                 speed: float = 1.0, history: int = 200):
+        self.symbol = symbol
+        self.interval = interval
+        self.interval_ms = interval_to_ms(interval)
+        if not self.interval_ms:
+            raise ValueError(f"Интервал {interval} не поддерживается симулятором")
+        self.speed = speed
+        self.open = np.asarray(candles["open"], dtype=np.float64)
+        self.high = np.asarray(candles["high"], dtype=np.float64)
+        self.low = np.asarray(candles["low"], dtype=np.float64)
+        self.close = np.asarray(candles["close"], dtype=np.float64)
+        self.volume = np.asarray(candles["volume"], dtype=np.float64)
+
+        now_ms = int(time.time() * 1000)
+        self.started_wall = time.time()
+        self.started_ms = now_ms
+        history = min(history, len(self.close) - 1)
+        self.first_start = now_ms - now_ms % self.interval_ms - history * self.interval_ms
+
+    def now_ms(self) -> int:
+        """Время симулятора в мс"""
+        return self.started_ms + int((time.time() - self.started_wall) * 1000 * self.speed)
+
+    def position(self, now_ms: Optional[int] = None) -> Tuple[int, float]:
+        """Индекс текущей свечи и доля прошедшего в ней времени"""
+        now_ms = self.now_ms() if now_ms is None else now_ms
+        index, offset = divmod(now_ms - self.first_start, self.interval_ms)
+        if index >= len(self.close):
+            return len(self.close) - 1, 1.0
+        return int(index), offset / self.interval_ms
+
+    def _path(self, index: int) -> np.ndarray:
+        if self.close[index] >= self.open[index]:
+            return np.array([self.open[index], self.low[index], self.high[index], self.close[index]])
+        return np.array([self.open[index], self.high[index], self.low[index], self.close[index]])
+
+    def price(self, now_ms: Optional[int] = None) -> float:
+        """Последняя цена"""
+        index, fraction = self.position(now_ms)
+        return float(np.interp(fraction, PATH_KNOTS, self._path(index)))
+
+    def candle(self, index: int, fraction: float = 1.0) -> Dict:
+        """Свеча index; при fraction < 1 — формирующаяся, с ценами пройденной части пути"""
+        start = self.first_start + index * self.interval_ms
+        if fraction >= 1.0:
+            open_, high, low, close = self.open[index], self.high[index], self.low[index], self.close[index]
+            volume = self.volume[index]
+        else:
+            path = self._path(index)
+            close = float(np.interp(fraction, PATH_KNOTS, path))
+            passed = np.append(path[np.array(PATH_KNOTS) <= fraction], close)
+            open_, high, low = path[0], passed.max(), passed.min()
+            volume = self.volume[index] * fraction
+        return {"start": start, "open": float(open_), "high": float(high), "low": float(low),
+                "close": float(close), "volume": float(volume), "turnover": float(volume * close),
+                "confirm": fraction >= 1.0}
+
+    def klines(self, limit: int = 200, start: Optional[int] = None, end: Optional[int] = None) -> List[Dict]:
+        """Свечи от новых к старым, как в REST kline (последняя может формироваться)"""
+        index, fraction = self.position()
+        last = index
+        if end is not None:
+            last = min(last, (end - self.first_start) // self.interval_ms)
+        first = max(0, last - limit + 1)
+        if start is not None:
+            first = max(first, -(-(start - self.first_start) // self.interval_ms))
+        return [self.candle(i, fraction if i == index else 1.0) for i in range(last, first - 1, -1)]
+
+    def ticker(self) -> Dict:
+        """Данные тикера в формате Bybit"""
+        index, fraction = self.position()
+        price = self.price()
+        volume = float(self.volume[max(0, index - 1439):index].sum() + self.volume[index] * fraction)
+        return {
+            "symbol": self.symbol,
+            "lastPrice": str(price),
+            "markPrice": str(price),
+            "indexPrice": str(price),
+            "bid1Price": str(price),
+            "ask1Price": str(price),
+            "volume24h": str(volume),
+            "turnover24h": str(volume * price),
+        }
+
+
+def kline_row(candle: Dict) -> List[str]:
+    """Строка REST kline [start, open, high, low, close, volume, turnover]"""
+    return [str(candle["start"]), str(candle["open"]), str(candle["high"]), str(candle["low"]),
+            str(candle["close"]), str(candle["volume"]), str(candle["turnover"])]
+
+
+class SyntheticBook:
+    """Стакан символа вокруг цены воспроизведения: уровни на шаге цены, объемы случайные
+
+    Каждый шаг сдвигает уровни за ценой и меняет часть объемов; изменения уходят
+    дельтой с последовательным u, как в потоке orderbook Bybit. Как у Bybit, u снимка
+    REST — отдельный счетчик (стакан 500 уровней обновляется чаще), общий только seq.
+    """
+
+    def __init__(self, replay: MarketReplay, spread: float, depth: int = BOOK_DEPTH,
+                 seed: Optional[int] = None):
+        self.replay = replay
+        self.spread = spread
+        self.depth = depth
+        self.tick = float(TICK_SIZE)
+        self.decimals = len(TICK_SIZE.partition(".")[2])
+        self.random = random.Random(seed)
+        self.bids: Dict[int, str] = {}
+        self.asks: Dict[int, str] = {}
+        self.update_id = 0
+        self.rest_update_id = self.random.randint(1000, 100_000)
+        self.seq = 0
+        self.step()
+
+    def _size(self) -> str:
+        return f"{self.random.uniform(0.001, 5):.3f}"
+
+    def _price(self, ticks: int) -> str:
+        return f"{ticks * self.tick:.{self.decimals}f}"
+
+    def _side_delta(self, levels: Dict[int, str], ticks: range) -> List[List[str]]:
+        changes = []
+        for level in list(levels):
+            if level not in ticks:
+                del levels[level]
+                changes.append([self._price(level), "0"])
+        for level in ticks:
+            if level not in levels or self.random.random() < 0.2:
+                levels[level] = self._size()
+                changes.append([self._price(level), levels[level]])
+        return changes
+
+    def step(self) -> Optional[Dict]:
+        """Сдвигает стакан к текущей цене; данные дельты или None, если ничего не изменилось"""
+        last = self.replay.price()
+        best_bid = int(np.floor(last * (1 - self.spread / 2) / self.tick))
+        best_ask = max(best_bid + 1, int(np.ceil(last * (1 + self.spread / 2) / self.tick)))
+        bids = self._side_delta(self.bids, range(best_bid - self.depth + 1, best_bid + 1))
+        asks = self._side_delta(self.asks, range(best_ask, best_ask + self.depth))
+        if not bids and not asks:
+            return None
+        self.update_id += 1
+        self.rest_update_id += self.random.randint(1, 3)
+        self.seq += len(bids) + len(asks)
+        return {"s": self.replay.symbol, "b": bids, "a": asks, "u": self.update_id, "seq": self.seq}
+
+    def snapshot(self, limit: Optional[int] = None, rest: bool = False) -> Dict:
+        """Полный стакан: покупки и продажи от лучшей цены; rest — с u снимка REST"""
+        limit = limit or self.depth
+        bids = [[self._price(level), self.bids[level]] for level in sorted(self.bids, reverse=True)[:limit]]
+        asks = [[self._price(level), self.asks[level]] for level in sorted(self.asks)[:limit]]
+        update_id = self.rest_update_id if rest else self.update_id
+        return {"s": self.replay.symbol, "b": bids, "a": asks, "u": update_id, "seq": self.seq,
+                "ts": self.replay.now_ms()}
+
+
+class MatchingEngine:
+    """Исполнение ордеров по ценам воспроизведения в режиме одной позиции на символ
+
+    Рыночные ордера исполняются сразу со спредом и комиссией taker, лимитные —
+    при пересечении цены с комиссией maker. Изменения ордеров, сделки, позиции
+    и баланс копятся в updates для приватных потоков order, execution, position и wallet.
+    """
+
+    def __init__(self, replays: Dict[str, MarketReplay], balance: float = 10_000.0,
+                 taker_fee: float = 0.00055, maker_fee: float = 0.0002, spread: float = 0.0001):
+        self.replays = replays
+        self.balance = balance
+        self.taker_fee = taker_fee
+        self.maker_fee = maker_fee
+        self.spread = spread
+        self.orders: Dict[str, Dict] = {}
+        self.history: "OrderedDict[str, Dict]" = OrderedDict()
+        # Пары TP/SL одной позиции: срабатывание одного ордера деактивирует другой
+        self.oco: Dict[str, str] = {}
+        self.updates: List[Tuple[str, Dict]] = []
+        self.positions: Dict[str, Dict] = {symbol: {"size": 0.0, "avg_price": 0.0, "updated_time": 0}
+                                                for symbol in replays}
+        self.executions = 0
+        self._ids = itertools.count(1)
+
+    def _replay(self, symbol: str) -> MarketReplay:
+        if symbol not in self.replays:
+            raise SimulatorError(RET_INVALID_PARAMS, f"Unknown symbol {symbol}")
+        return self.replays[symbol]
+
+    def place_order(self, params: Dict) -> Dict:
+        """Принимает ордер /v5/order/create: рыночный, лимитный, условный, с TP/SL"""
+        symbol = params.get("symbol", "")
+        # Неизвестный символ — ошибка Bybit 10001
+        self._replay(symbol)
+        side = params.get("side")
+        order_type = params.get("orderType", "Market")
+        try:
+            qty = float(params.get("qty", 0))
+            price = float(params["price"]) if params.get("price") else None
+            trigger_price = float(params["triggerPrice"]) if params.get("triggerPrice") else None
+            take_profit = float(params["takeProfit"]) if params.get("takeProfit") else None
+            stop_loss = float(params["stopLoss"]) if params.get("stopLoss") else None
+            trigger_direction = int(params.get("triggerDirection") or 0)
+        except ValueError:
+            raise SimulatorError(RET_INVALID_PARAMS, "Invalid qty or price")
+        if side not in ("Buy", "Sell") or qty <= 0 or order_type not in ("Market", "Limit"):
+            raise SimulatorError(RET_INVALID_PARAMS, "Invalid order parameters")
+        if order_type == "Limit" and not price:
+            raise SimulatorError(RET_INVALID_PARAMS, "Limit order requires price")
+        if trigger_price and trigger_direction not in (1, 2):
+            raise SimulatorError(RET_INVALID_PARAMS, "Conditional order requires triggerDirection")
+
+        reduce_only = str(params.get("reduceOnly", "")).lower() == "true"
+        if reduce_only and not trigger_price:
+            qty = self._reducible(symbol, side, qty)
+            if qty <= 0:
+                raise SimulatorError(RET_REDUCE_ONLY, "Reduce-only order has same side with current position")
+
+        order = self._new_order(symbol, side, order_type, qty, price, params.get("orderLinkId", ""),
+                                reduceOnly=reduce_only, stopOrderType="Stop" if trigger_price else "",
+                                triggerPrice=trigger_price, triggerDirection=trigger_direction,
+                                takeProfit=take_profit, stopLoss=stop_loss)
+        if trigger_price:
+            order["orderStatus"] = "Untriggered"
+            self.orders[order["orderId"]] = order
+            self._order_update(order)
+        else:
+            self._execute(order)
+        return order
+
+    def amend_order(self, params: Dict) -> Dict:
+        """Меняет объем, цену или уровень срабатывания активного ордера /v5/order/amend"""
+        order = self.orders.get(params.get("orderId", ""))
+        if order is None or order["symbol"] != params.get("symbol"):
+            raise SimulatorError(RET_ORDER_NOT_FOUND, "Order does not exist")
+        try:
+            changes = {field: float(params[key]) for key, field in (("qty", "qty"), ("price", "price"),
+                                                                    ("triggerPrice", "triggerPrice"))
+                       if params.get(key)}
+        except ValueError:
+            raise SimulatorError(RET_INVALID_PARAMS, "Invalid qty or price")
+        if not changes or changes.get("qty", 1) <= 0:
+            raise SimulatorError(RET_INVALID_PARAMS, "Invalid amend parameters")
+        order.update(changes, updatedTime=self.replays[order["symbol"]].now_ms())
+        self._order_update(order)
+        return order
+
+    def _new_order(self, symbol: str, side: str, order_type: str, qty: float, price: Optional[float],
+                   link_id: str = "", **fields) -> Dict:
+        now_ms = self.replays[symbol].now_ms()
+        order = {
+            "orderId": f"sim-{next(self._ids)}",
+            "orderLinkId": link_id,
+            "symbol": symbol,
+            "side": side,
+            "orderType": order_type,
+            "qty": qty,
+            "price": price,
+            "orderStatus": "New",
+            "avgPrice": 0.0,
+            "cumExecQty": 0.0,
+            "cumExecFee": 0.0,
+            "reduceOnly": False,
+            "stopOrderType": "",
+            "triggerPrice": None,
+            "triggerDirection": 0,
+            "takeProfit": None,
+            "stopLoss": None,
+            "createdTime": now_ms,
+            "updatedTime": now_ms,
+        }
+        order.update(fields)
+        self.history[order["orderId"]] = order
+        while len(self.history) > ORDER_HISTORY_SIZE:
+            self.history.popitem(last=False)
+        return order
+
+    def _reducible(self, symbol: str, side: str, qty: float) -> float:
+        """Объем, который reduce-only ордер может закрыть в текущей позиции"""
+        size = self.positions[symbol]["size"]
+        return min(qty, -size if side == "Buy" else size)
+
+    def _execute(self, order: Dict):
+        """Исполняет ордер по рынку или ставит лимитный в книгу"""
+        last = self.replays[order["symbol"]].price()
+        ask, bid = last * (1 + self.spread / 2), last * (1 - self.spread / 2)
+        side, price = order["side"], order["price"]
+        if order["orderType"] == "Market":
+            self._fill(order, ask if side == "Buy" else bid, self.taker_fee)
+        elif (side == "Buy" and price >= ask) or (side == "Sell" and price <= bid):
+            self._fill(order, ask if side == "Buy" else bid, self.taker_fee)
+        else:
+            order["orderStatus"] = "New"
+            self.orders[order["orderId"]] = order
+            self._order_update(order)
+
+    def _attach_tpsl(self, order: Dict):
+        """Выставляет условные reduce-only ордера TP/SL на исполненный объем (режим Partial)
+
+        Срабатывание одного из них деактивирует парный.
+        """
+        exit_side = "Sell" if order["side"] == "Buy" else "Buy"
+        # Для длинной позиции TP срабатывает на росте цены, SL — на падении
+        rising, falling = (1, 2) if order["side"] == "Buy" else (2, 1)
+        children = []
+        for stop_type, level, direction in (("PartialTakeProfit", order["takeProfit"], rising),
+                                            ("PartialStopLoss", order["stopLoss"], falling)):
+            if level:
+                child = self._new_order(order["symbol"], exit_side, "Market", order["cumExecQty"], None,
+                                        orderStatus="Untriggered", reduceOnly=True, stopOrderType=stop_type,
+                                        triggerPrice=level, triggerDirection=direction)
+                self.orders[child["orderId"]] = child
+                self._order_update(child)
+                children.append(child["orderId"])
+        if len(children) == 2:
+            self.oco[children[0]], self.oco[children[1]] = children[1], children[0]
+
+    def _trigger(self, order: Dict):
+        """Активирует условный ордер: reduce-only без позиции деактивируется"""
+        del self.orders[order["orderId"]]
+        sibling = self.orders.pop(self.oco.pop(order["orderId"], None), None)
+        if sibling is not None:
+            self.oco.pop(sibling["orderId"], None)
+            self._deactivate(sibling)
+        if order["reduceOnly"]:
+            order["qty"] = self._reducible(order["symbol"], order["side"], order["qty"])
+            if order["qty"] <= 0:
+                self._deactivate(order)
+                return
+        self._execute(order)
+
+    def _deactivate(self, order: Dict):
+        order.update(orderStatus="Deactivated", updatedTime=self.replays[order["symbol"]].now_ms())
+        self._order_update(order)
+
+    @staticmethod
+    def order_view(order: Dict) -> Dict:
+        """Ордер в формате Bybit: числа строками"""
+        return {key: "" if value is None else str(value) if isinstance(value, float) else value
+                for key, value in order.items()}
+
+    def _order_update(self, order: Dict):
+        self.updates.append(("order", dict(self.order_view(order), category="linear")))
+
+    def drain_updates(self) -> List[Tuple[str, Dict]]:
+        updates, self.updates = self.updates, []
+        return updates
+
+    def match(self):
+        """Активирует условные ордера и исполняет лимитные, через цену которых прошел рынок"""
+        for order in list(self.orders.values()):
+            if order["orderId"] not in self.orders:
+                # Деактивирован срабатыванием парного TP/SL на этом же проходе
+                continue
+            last = self.replays[order["symbol"]].price()
+            if order["orderStatus"] == "Untriggered":
+                trigger = order["triggerPrice"]
+                if (order["triggerDirection"] == 1 and last >= trigger) or \
+                        (order["triggerDirection"] == 2 and last <= trigger):
+                    self._trigger(order)
+            elif (order["side"] == "Buy" and last <= order["price"]) or \
+                    (order["side"] == "Sell" and last >= order["price"]):
+                self._fill(order, order["price"], self.maker_fee)
+                del self.orders[order["orderId"]]
+
+    def _fill(self, order: Dict, price: float, fee_rate: float):
+        position = self.positions[order["symbol"]]
+        qty = order["qty"] if order["side"] == "Buy" else -order["qty"]
+        size, avg_price = position["size"], position["avg_price"]
+
+        if size == 0 or (size > 0) == (qty > 0):
+            position["avg_price"] = (abs(size) * avg_price + abs(qty) * price) / (abs(size) + abs(qty))
+        else:
+            closed = min(abs(qty), abs(size))
+            self.balance += (price - avg_price) * closed * (1 if size > 0 else -1)
+            if abs(qty) > abs(size):
+                position["avg_price"] = price
+        position["size"] = round(size + qty, 12)
+        if position["size"] == 0:
+            position["avg_price"] = 0.0
+
+        fee = abs(qty) * price * fee_rate
+        self.balance -= fee
+        self.executions += 1
+        now_ms = self.replays[order["symbol"]].now_ms()
+        order.update(orderStatus="Filled", avgPrice=price, cumExecQty=order["qty"], cumExecFee=fee,
+                     updatedTime=now_ms)
+        self.updates.append(("execution", {
+            "category": "linear",
+            "symbol": order["symbol"],
+            "orderId": order["orderId"],
+            "orderLinkId": order["orderLinkId"],
+            "side": order["side"],
+            "orderType": order["orderType"],
+            "stopOrderType": order["stopOrderType"],
+            "orderQty": str(order["qty"]),
+            "execId": f"{order['orderId']}-{self.executions}",
+            "execType": "Trade",
+            "execPrice": str(price),
+            "execQty": str(order["qty"]),
+            "execValue": str(order["qty"] * price),
+            "execFee": str(fee),
+            "feeRate": str(fee_rate),
+            "isMaker": fee_rate == self.maker_fee,
+            "leavesQty": "0",
+            "execTime": str(now_ms),
+        }))
+        self._order_update(order)
+        position["updated_time"] = now_ms
+        self.updates.append(("position", self.position_update(order["symbol"])))
+        self.updates.append(("wallet", self.wallet()["list"][0]))
+        if order["takeProfit"] or order["stopLoss"]:
+            self._attach_tpsl(order)
+
+    def cancel_order(self, symbol: str, order_id: str) -> Dict:
+        """Отменяет активный или условный ордер /v5/order/cancel"""
+        order = self.orders.get(order_id)
+        if order is None or order["symbol"] != symbol:
+            raise SimulatorError(RET_ORDER_NOT_FOUND, "Order does not exist")
+        self._cancel(order)
+        return order
+
+    def _cancel(self, order: Dict):
+        del self.orders[order["orderId"]]
+        self.oco.pop(self.oco.pop(order["orderId"], None), None)
+        order.update(orderStatus="Cancelled", updatedTime=self.replays[order["symbol"]].now_ms())
+        self._order_update(order)
+
+    def cancel_all(self, symbol: Optional[str] = None) -> List[Dict]:
+        """Отменяет активные и условные ордера символа (или все)"""
+        cancelled = [order for order in self.orders.values() if symbol in (None, order["symbol"])]
+        for order in cancelled:
+            self._cancel(order)
+        return [{"orderId": order["orderId"], "orderLinkId": order["orderLinkId"]} for order in cancelled]
+
+    def open_orders(self, symbol: Optional[str] = None, order_id: Optional[str] = None) -> List[Dict]:
+        """Активные ордера (или недавний ордер по orderId) в формате /v5/order/realtime"""
+        if order_id:
+            order = self.history.get(order_id)
+            return [self.order_view(order)] if order and symbol in (None, order["symbol"]) else []
+        return [self.order_view(order) for order in self.orders.values() if symbol in (None, order["symbol"])]
+
+    def unrealised_pnl(self, symbol: str) -> float:
+        position = self.positions[symbol]
+        return (self.replays[symbol].price() - position["avg_price"]) * position["size"]
+
+    def position_list(self, symbol: Optional[str] = None) -> List[Dict]:
+        """Позиции в формате /v5/position/list (пустая позиция — size 0 и side '')"""
+        result = []
+        for name, position in self.positions.items():
+            if symbol not in (None, name):
+                continue
+            size = position["size"]
+            mark = self.replays[name].price()
+            result.append({
+                "symbol": name,
+                "side": "Buy" if size > 0 else "Sell" if size < 0 else "",
+                "size": str(abs(size)),
+                "avgPrice": str(position["avg_price"]),
+                "markPrice": str(mark),
+                "positionValue": str(abs(size) * position["avg_price"]),
+                "unrealisedPnl": str(self.unrealised_pnl(name)),
+                "positionIdx": 0,
+                "updatedTime": str(position["updated_time"]),
+            })
+        return result
+
+    def position_update(self, symbol: str) -> Dict:
+        """Позиция в формате приватного потока position (средняя цена — entryPrice)"""
+        position = self.position_list(symbol)[0]
+        position["entryPrice"] = position.pop("avgPrice")
+        position["category"] = "linear"
+        return position
+
+    def wallet(self) -> Dict:
+        """Баланс в формате /v5/account/wallet-balance"""
+        unrealised = sum(self.unrealised_pnl(symbol) for symbol in self.positions)
+        equity = self.balance + unrealised
+        return {"list": [{
+            "accountType": "UNIFIED",
+            "totalEquity": str(equity),
+            "totalWalletBalance": str(self.balance),
+            "coin": [{"coin": "USDT", "equity": str(equity), "walletBalance": str(self.balance),
+                      "unrealisedPnl": str(unrealised)}],
+        }]}
+
+
+class ExchangeSimulator:
+    """HTTP и WebSocket сервер, имитирующий Bybit v5, с задержками, ошибками и лимитами"""
+
+    def __init__(self, engine: MatchingEngine, latency: float = 0.0, jitter: float = 0.0,
+                 error_rate: float = 0.0, rate_limit: Optional[int] = None,
+                 tick_interval: float = 0.1, seed: Optional[int] = None):
+        self.engine = engine
+        self.replays = engine.replays
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.tick_interval = tick_interval
+        self.random = random.Random(seed)
+        self.logger = logging.getLogger(__name__)
+
+        self.stats = {"requests": defaultdict(int), "errors_injected": 0, "rate_limited": 0, "ws_messages": 0}
+        self._windows: Dict[str, Tuple[int, int]] = {}
+        self._sockets: Dict[web.WebSocketResponse, Set[str]] = {}
+        self._private_sockets: Dict[web.WebSocketResponse, Set[str]] = {}
+        # Стаканы создаются при первой подписке или запросе и дальше двигаются каждый тик
+        self.books: Dict[str, SyntheticBook] = {}
+        self._book_deltas: Dict[str, Optional[Dict]] = {}
+        self._seed = seed
+        self._publisher_task = None
+        self._runner = None
+
+    def make_app(self) -> web.Application:
+        app = web.Application(middlewares=[self._middleware])
+        app.router.add_get("/v5/market/time", self._time)
+        app.router.add_get("/v5/market/tickers", self._tickers)
+        app.router.add_get("/v5/market/kline", self._kline)
+        app.router.add_get("/v5/market/instruments-info", self._instruments)
+        app.router.add_get("/v5/market/orderbook", self._orderbook)
+        app.router.add_post("/v5/order/create", self._order_create)
+        app.router.add_post("/v5/order/cancel", self._order_cancel)
+        app.router.add_post("/v5/order/cancel-all", self._order_cancel_all)
+        app.router.add_post("/v5/order/amend", self._order_amend)
+        app.router.add_post("/v5/order/create-batch", self._order_create_batch)
+        app.router.add_post("/v5/order/amend-batch", self._order_amend_batch)
+        app.router.add_post("/v5/order/cancel-batch", self._order_cancel_batch)
+        app.router.add_get("/v5/order/realtime", self._order_realtime)
+        app.router.add_get("/v5/position/list", self._position_list)
+        app.router.add_get("/v5/account/wallet-balance", self._wallet_balance)
+        app.router.add_get("/v5/public/linear", self._public_ws)
+        app.router.add_get("/v5/private", self._private_ws)
+        app.router.add_get("/sim/stats", self._stats)
+        return app
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8090):
+        """Запускает сервер и рассылку публичных потоков"""
+        self._runner = web.AppRunner(self.make_app())
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        self._publisher_task = asyncio.create_task(self._publisher())
+        self.logger.info(f"Симулятор биржи слушает {host}:{port}")
+
+    async def stop(self):
+        if self._publisher_task:
+            self._publisher_task.cancel()
+        for ws in list(self._sockets) + list(self._private_sockets):
+            await ws.close()
+        if self._runner:
+            await self._runner.cleanup()
+
+    # REST
+
+    @staticmethod
+    def _response(result, code: int = RET_OK, message: str = "OK", headers: Optional[Dict] = None,
+                  ext_info: Optional[Dict] = None) -> web.Response:
+        body = {"retCode": code, "retMsg": message, "result": result if code == RET_OK else {},
+                "retExtInfo": ext_info or {}, "time": int(time.time() * 1000)}
+        return web.json_response(body, headers=headers)
+
+    def _limit_headers(self, path: str) -> Tuple[Dict, bool]:
+        """Лимит запросов на endpoint в секундном окне и заголовки X-Bapi-Limit-*"""
+        now_ms = int(time.time() * 1000)
+        window, used = self._windows.get(path, (0, 0))
+        if now_ms >= window + 1000:
+            window, used = now_ms - now_ms % 1000, 0
+        allowed = used < self.rate_limit
+        self._windows[path] = (window, used + allowed)
+        headers = {
+            "X-Bapi-Limit": str(self.rate_limit),
+            "X-Bapi-Limit-Status": str(self.rate_limit - used - allowed),
+            "X-Bapi-Limit-Reset-Timestamp": str(window + 1000),
+        }
+        return headers, allowed
+
+    @web.middleware
+    async def _middleware(self, request: web.Request, handler):
+        path = request.path
+        if path.startswith("/sim/") or path.startswith("/v5/public/") or path == "/v5/private":
+            return await handler(request)
+        self.stats["requests"][path] += 1
+
+        delay = self.latency + self.random.uniform(0, self.jitter)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        headers = {}
+        if self.rate_limit:
+            headers, allowed = self._limit_headers(path)
+            if not allowed:
+                self.stats["rate_limited"] += 1
+                return self._response(None, RET_RATE_LIMIT, "Too many visits!", headers)
+
+        if self.error_rate and self.random.random() < self.error_rate:
+            self.stats["errors_injected"] += 1
+            if self.random.random() < 0.5:
+                return web.Response(status=503, text="Service Unavailable")
+            return self._response(None, RET_SERVER_ERROR, "Internal server error", headers)
+
+        try:
+            response = await handler(request)
+        except SimulatorError as e:
+            response = self._response(None, e.code, str(e))
+        response.headers.update(headers)
+        return response
+
+    @staticmethod
+    async def _params(request: web.Request) -> Dict:
+        if request.method == "POST":
+            return await request.json() if request.can_read_body else {}
+        return dict(request.query)
+
+    def _symbols(self, params: Dict) -> List[str]:
+        symbol = params.get("symbol")
+        if symbol and symbol not in self.replays:
+            raise SimulatorError(RET_INVALID_PARAMS, f"Unknown symbol {symbol}")
+        return [symbol] if symbol else list(self.replays)
+
+    async def _time(self, request):
+        now_ms = int(time.time() * 1000)
+        return self._response({"timeSecond": str(now_ms // 1000), "timeNano": str(now_ms * 1_000_000)})
+
+    async def _tickers(self, request):
+        params = await self._params(request)
+        tickers = [self.replays[symbol].ticker() for symbol in self._symbols(params)]
+        return self._response({"category": "linear", "list": tickers})
+
+    async def _kline(self, request):
+        params = await self._params(request)
+        replay = self.replays.get(params.get("symbol"))
+        if replay is None or params.get("interval") != replay.interval:
+            raise SimulatorError(RET_INVALID_PARAMS, "Unknown symbol or interval")
+        limit = min(int(params.get("limit", 200)), 1000)
+        start = int(params["start"]) if "start" in params else None
+        end = int(params["end"]) if "end" in params else None
+        rows = [kline_row(candle) for candle in replay.klines(limit, start, end)]
+        return self._response({"category": "linear", "symbol": replay.symbol, "list": rows})
+
+    def _book(self, symbol: str) -> SyntheticBook:
+        book = self.books.get(symbol)
+        if book is None:
+            seed = None if self._seed is None else self._seed + len(self.books)
+            book = self.books[symbol] = SyntheticBook(self.replays[symbol], self.engine.spread, seed=seed)
+        return book
+
+    async def _orderbook(self, request):
+        params = await self._params(request)
+        if params.get("symbol") not in self.replays:
+            raise SimulatorError(RET_INVALID_PARAMS, "Unknown symbol")
+        limit = min(int(params.get("limit", 25)), 500)
+        return self._response(self._book(params["symbol"]).snapshot(limit, rest=True))
+
+    async def _instruments(self, request):
+        params = await self._params(request)
+        instruments = [{"symbol": symbol, "status": "Trading", "contractType": "LinearPerpetual",
+                        "priceFilter": {"tickSize": TICK_SIZE},
+                        "lotSizeFilter": {"qtyStep": "0.001", "minOrderQty": "0.001"}}
+                       for symbol in self._symbols(params)]
+        return self._response({"category": "linear", "list": instruments, "nextPageCursor": ""})
+
+    async def _order_create(self, request):
+        order = self.engine.place_order(await self._params(request))
+        # Приватные потоки и ответ REST уходят независимо, как на бирже
+        asyncio.ensure_future(self._flush_private())
+        return self._response({"orderId": order["orderId"], "orderLinkId": order["orderLinkId"]})
+
+    async def _order_cancel(self, request):
+        params = await self._params(request)
+        order = self.engine.cancel_order(params.get("symbol", ""), params.get("orderId", ""))
+        asyncio.ensure_future(self._flush_private())
+        return self._response({"orderId": order["orderId"], "orderLinkId": order["orderLinkId"]})
+
+    async def _order_cancel_all(self, request):
+        params = await self._params(request)
+        cancelled = self.engine.cancel_all(params.get("symbol"))
+        asyncio.ensure_future(self._flush_private())
+        return self._response({"list": cancelled, "success": "1"})
+
+    async def _order_amend(self, request):
+        order = self.engine.amend_order(await self._params(request))
+        asyncio.ensure_future(self._flush_private())
+        return self._response({"orderId": order["orderId"], "orderLinkId": order["orderLinkId"]})
+
+    async def _batch(self, request, action) -> web.Response:
+        """Пакетный запрос: результат и код ошибки по каждому ордеру в порядке запроса"""
+        items = (await self._params(request)).get("request") or []
+        if not items or len(items) > BATCH_ORDER_LIMIT:
+            raise SimulatorError(RET_INVALID_PARAMS, f"Batch size must be 1..{BATCH_ORDER_LIMIT}")
+        results, codes = [], []
+        for item in items:
+            try:
+                order = action(item)
+                results.append({"category": "linear", "symbol": order["symbol"], "orderId": order["orderId"],
+                                "orderLinkId": order["orderLinkId"], "createAt": str(order["createdTime"])})
+                codes.append({"code": RET_OK, "msg": "OK"})
+            except SimulatorError as e:
+                results.append({"category": "linear", "symbol": item.get("symbol", ""), "orderId": "",
+                                "orderLinkId": item.get("orderLinkId", ""), "createAt": ""})
+                codes.append({"code": e.code, "msg": str(e)})
+        asyncio.ensure_future(self._flush_private())
+        return self._response({"list": results}, ext_info={"list": codes})
+
+    async def _order_create_batch(self, request):
+        return await self._batch(request, self.engine.place_order)
+
+    async def _order_amend_batch(self, request):
+        return await self._batch(request, self.engine.amend_order)
+
+    async def _order_cancel_batch(self, request):
+        return await self._batch(request, lambda item: self.engine.cancel_order(item.get("symbol", ""),
+                                                                               item.get("orderId", "")))
+
+    async def _order_realtime(self, request):
+        params = await self._params(request)
+        self.engine.match()
+        orders = self.engine.open_orders(params.get("symbol"), params.get("orderId"))
+        return self._response({"category": "linear", "list": orders, "nextPageCursor": ""})
+
+    async def _position_list(self, request):
+        params = await self._params(request)
+        self.engine.match()
+        symbols = self._symbols(params)
+        positions = [p for symbol in symbols for p in self.engine.position_list(symbol)]
+        return self._response({"category": "linear", "list": positions, "nextPageCursor": ""})
+
+    async def _wallet_balance(self, request):
+        self.engine.match()
+        return self._response(self.engine.wallet())
+
+    async def _stats(self, request):
+        stats = dict(self.stats, requests=dict(self.stats["requests"]),
+                     executions=self.engine.executions, balance=self.engine.balance)
+        return web.json_response(stats)
+
+    # WebSocket
+
+    async def _public_ws(self, request):
+        return await self._ws_session(request, self._sockets)
+
+    async def _private_ws(self, request):
+        """Приватный поток: авторизация принимается без проверки подписи"""
+        return await self._ws_session(request, self._private_sockets)
+
+    async def _ws_session(self, request, sockets: Dict[web.WebSocketResponse, Set[str]]):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        topics: Set[str] = set()
+        sockets[ws] = topics
+        private = sockets is self._private_sockets
+        try:
+            async for message in ws:
+                if message.type != WSMsgType.TEXT:
+                    continue
+                payload = json.loads(message.data)
+                op = payload.get("op")
+                if op == "auth":
+                    await ws.send_json({"success": True, "ret_msg": "", "op": "auth", "conn_id": str(id(ws))})
+                elif op == "ping":
+                    await ws.send_json({"success": True, "ret_msg": "pong", "op": "ping"})
+                elif op in ("subscribe", "unsubscribe"):
+                    args = payload.get("args", [])
+                    # pybit регистрирует подписку и колбэк уже после отправки запроса,
+                    # поэтому мгновенный локальный ответ опередил бы их
+                    await asyncio.sleep(SUBSCRIBE_ACK_DELAY)
+                    if op == "subscribe":
+                        topics.update(args)
+                    else:
+                        topics.difference_update(args)
+                    await ws.send_json({"success": True, "ret_msg": "", "op": op,
+                                        "req_id": payload.get("req_id", ""), "conn_id": str(id(ws))})
+                    if op == "subscribe" and not private:
+                        for topic in args:
+                            await self._send_topic(ws, topic, "snapshot")
+        finally:
+            sockets.pop(ws, None)
+        return ws
+
+    async def _flush_private(self):
+        """Рассылает накопленные изменения ордеров, сделки, позиции и баланс подписчикам приватных потоков"""
+        updates = self.engine.drain_updates()
+        if not updates:
+            return
+        now_ms = int(time.time() * 1000)
+        by_topic = defaultdict(list)
+        for topic, data in updates:
+            by_topic[topic].append(data)
+        # Сделки публикуются раньше итогового статуса ордера
+        for topic in sorted(by_topic, key=lambda name: name != "execution"):
+            message = {"id": f"sim-{now_ms}-{topic}", "topic": topic, "creationTime": now_ms,
+                       "data": by_topic[topic]}
+            for ws, topics in list(self._private_sockets.items()):
+                if topic in topics and not ws.closed:
+                    try:
+                        await ws.send_json(message)
+                        self.stats["ws_messages"] += 1
+                    except ConnectionResetError:
+                        self._private_sockets.pop(ws, None)
+
+    def _topic_message(self, topic: str, kind: str, closed: Optional[int] = None) -> Optional[Dict]:
+        parts = topic.split(".")
+        now_ms = int(time.time() * 1000)
+        if parts[0] == "tickers" and parts[-1] in self.replays:
+            return {"topic": topic, "type": kind, "data": self.replays[parts[-1]].ticker(), "ts": now_ms}
+        if parts[0] == "kline" and len(parts) == 3 and parts[2] in self.replays:
+            replay = self.replays[parts[2]]
+            if parts[1] != replay.interval:
+                return None
+            index, fraction = replay.position()
+            candle = replay.candle(closed, 1.0) if closed is not None else replay.candle(index, fraction)
+            data = {key: str(value) for key, value in candle.items() if key not in ("start", "confirm")}
+            data.update(start=candle["start"], end=candle["start"] + replay.interval_ms - 1,
+                        interval=replay.interval, confirm=candle["confirm"], timestamp=now_ms)
+            return {"topic": topic, "type": "snapshot", "data": [data], "ts": now_ms}
+        if parts[0] == "orderbook" and len(parts) == 3 and parts[2] in self.replays:
+            if kind == "snapshot":
+                data = self._book(parts[2]).snapshot()
+            else:
+                # Дельта шага общая для всех подписчиков символа
+                data = self._book_deltas.get(parts[2])
+            if data is None:
+                return None
+            return {"topic": topic, "type": kind, "data": data, "ts": now_ms, "cts": now_ms}
+        return None
+
+    async def _send_topic(self, ws: web.WebSocketResponse, topic: str, kind: str = "delta",
+                          closed: Optional[int] = None):
+        message = self._topic_message(topic, kind, closed)
+        if message is not None and not ws.closed:
+            await ws.send_json(message)
+            self.stats["ws_messages"] += 1
+
+    async def _publisher(self):
+        """Рассылает тикеры и свечи подписчикам и исполняет лимитные ордера"""
+        last_index = {symbol: replay.position()[0] for symbol, replay in self.replays.items()}
+        while True:
+            await asyncio.sleep(self.tick_interval)
+            self.engine.match()
+            await self._flush_private()
+            self._book_deltas = {symbol: book.step() for symbol, book in self.books.items()}
+            closed = {}
+            for symbol, replay in self.replays.items():
+                index = replay.position()[0]
+                if index != last_index[symbol]:
+                    closed[symbol] = last_index[symbol]
+                    last_index[symbol] = index
+            for ws, topics in list(self._sockets.items()):
+                try:
+                    for topic in topics:
+                        symbol = topic.split(".")[-1]
+                        if topic.startswith("kline") and symbol in closed:
+                            # Закрытие свечи приходит отдельным сообщением с confirm=true
+                            await self._send_topic(ws, topic, closed=closed[symbol])
+                        await self._send_topic(ws, topic)
+                except ConnectionResetError:
+                    self._sockets.pop(ws, None)
+
+
+def build_simulator(symbols: List[str], interval: str = "1", candles: Optional[Dict[str, Dict]] = None,
+                    speed: float = 1.0, seed: Optional[int] = None, **options) -> ExchangeSimulator:
+    """Собирает симулятор: записанные свечи по символам или случайное блуждание"""
+    interval_ms = interval_to_ms(interval) or 60_000
+    replays = {}
+    for i, symbol in enumerate(symbols):
+        data = (candles or {}).get(symbol)
+        if data is None:
+            data = synthetic_candles(100_000, interval_ms, seed=None if seed is None else seed + i)
+        replays[symbol] = MarketReplay(symbol, data, interval, speed)
+    engine_options = {key: options.pop(key) for key in ("balance", "taker_fee", "maker_fee", "spread")
+                      if key in options}
+    return ExchangeSimulator(MatchingEngine(replays, **engine_options), seed=seed, **options)
+
+
+async def serve(simulator: ExchangeSimulator, host: str, port: int):
+    """Работает до отмены"""
+    await simulator.start(host, port)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await simulator.stop()
+
+
+def main():
+    from backtest import read_candles
+    from config import Config
+
+    parser = argparse.ArgumentParser(description="Локальный симулятор Bybit v5 (REST + WebSocket)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--symbols", default=",".join(Config.SYMBOLS), help="символы через запятую")
+    parser.add_argument("--interval", default=Config.CANDLE_INTERVAL, help="интервал свечей Bybit")
+    parser.add_argument("--candles", help="CSV/.npz для воспроизведения (или символ с --store/--recording)")
+    parser.add_argument("--store", action="store_true", help="воспроизводить свечи символов из локального хранилища")
+    parser.add_argument("--recording", action="store_true", help="воспроизводить свечи символов из записи потоков")
+    parser.add_argument("--speed", type=float, default=1.0, help="ускорение времени симулятора")
+    parser.add_argument("--latency", type=float, default=0.0, help="задержка ответа REST, секунды")
+    parser.add_argument("--jitter", type=float, default=0.0, help="случайная добавка к задержке, секунды")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="доля запросов с ошибкой 503/10016")
+    parser.add_argument("--rate-limit", type=int, default=None, help="лимит запросов на endpoint в секунду")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    symbols = [symbol.strip() for symbol in args.symbols.split(",") if symbol.strip()]
+    candles = {}
+    if args.store or args.recording:
+        candles = {symbol: read_candles(symbol, args.store, args.recording) for symbol in symbols}
+    elif args.candles:
+        candles = dict.fromkeys(symbols, read_candles(args.candles))
+
+    logging.basicConfig(level=logging.INFO)
+    simulator = build_simulator(symbols, args.interval, candles, args.speed, args.seed,
+                                latency=args.latency, jitter=args.jitter,
+                                error_rate=args.error_rate, rate_limit=args.rate_limit)
+    print(f"🧪 BYBIT_REST_URL=http://{args.host}:{args.port} "
+          f"BYBIT_WS_URL=ws://{args.host}:{args.port}/v5/public/linear "
+          f"BYBIT_WS_PRIVATE_URL=ws://{args.host}:{args.port}/v5/private")
+    try:
+        asyncio.run(serve(simulator, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
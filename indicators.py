@@ -0,0 +1,253 @@
+import math
+from collections import deque
+from typing import Dict, Optional, Tuple
+
+from config import Config
+
+
+class IncrementalEMA:
+    """Экспоненциальная скользящая средняя с обновлением за O(1)
+
+    Совпадает с ScalpingStrategy.calculate_ema: EMA инициализируется первой ценой,
+    а пока значений меньше периода, возвращается последняя цена.
+    """
+
+    def __init__(self, period: int):
+        self.period = period
+        self.alpha = 2 / (period + 1)
+        self.count = 0
+        self.ema = None
+        self.last = None
+
+    def _next(self, value: float) -> float:
+        if self.ema is None:
+            return value
+        return value * self.alpha + self.ema * (1 - self.alpha)
+
+    def _result(self, ema: float, value: float, count: int) -> float:
+        return ema if count >= self.period else value
+
+    def update(self, value: float) -> float:
+        """Добавляет закрытое значение"""
+        self.ema = self._next(value)
+        self.last = value
+        self.count += 1
+        return self._result(self.ema, value, self.count)
+
+    def peek(self, value: float) -> float:
+        """Значение EMA, если бы value было добавлено, без изменения состояния"""
+        return self._result(self._next(value), value, self.count + 1)
+
+    @property
+    def value(self) -> Optional[float]:
+        if self.last is None:
+            return None
+        return self._result(self.ema, self.last, self.count)
+
+
+class IncrementalRSI:
+    """RSI по Уайлдеру с обновлением за O(1)"""
+
+    def __init__(self, period: int = 14):
+        self.period = period
+        self.prev = None
+        self.deltas = 0
+        # Сумма приростов/потерь на этапе инициализации, затем сглаженные средние
+        self.avg_gain = 0.0
+        self.avg_loss = 0.0
+
+    def _next(self, value: float) -> Tuple[float, float, int]:
+        if self.prev is None:
+            return self.avg_gain, self.avg_loss, self.deltas
+        delta = value - self.prev
+        gain = delta if delta > 0 else 0.0
+        loss = -delta if delta < 0 else 0.0
+        deltas = self.deltas + 1
+        if deltas < self.period:
+            return self.avg_gain + gain, self.avg_loss + loss, deltas
+        if deltas == self.period:
+            return (self.avg_gain + gain) / self.period, (self.avg_loss + loss) / self.period, deltas
+        return ((self.avg_gain * (self.period - 1) + gain) / self.period,
+                (self.avg_loss * (self.period - 1) + loss) / self.period,
+                deltas)
+
+    def _result(self, avg_gain: float, avg_loss: float, deltas: int) -> float:
+        if deltas < self.period:
+            return 50.0
+        if avg_loss == 0:
+            return 100.0
+        return 100 - (100 / (1 + avg_gain / avg_loss))
+
+    def update(self, value: float) -> float:
+        """Добавляет закрытое значение"""
+        self.avg_gain, self.avg_loss, self.deltas = self._next(value)
+        self.prev = value
+        return self._result(self.avg_gain, self.avg_loss, self.deltas)
+
+    def peek(self, value: float) -> float:
+        """RSI, если бы value было добавлено, без изменения состояния"""
+        return self._result(*self._next(value))
+
+    @property
+    def value(self) -> float:
+        return self._result(self.avg_gain, self.avg_loss, self.deltas)
+
+
+class IncrementalMACD:
+    """MACD с сигнальной линией как EMA от ряда MACD"""
+
+    def __init__(self, fast: int = 12, slow: int = 26, signal: int = 9):
+        self.slow = slow
+        self.fast_ema = IncrementalEMA(fast)
+        self.slow_ema = IncrementalEMA(slow)
+        # Сигнальная EMA считается от сырых EMA, как в пакетной версии
+        self.signal_ema = IncrementalEMA(signal)
+        self.count = 0
+
+    def _line(self, fast_ema: float, slow_ema: float) -> float:
+        return fast_ema - slow_ema
+
+    def _result(self, count: int, line: float, signal: float) -> Tuple[float, float, float]:
+        if count < self.slow:
+            return 0.0, 0.0, 0.0
+        return line, signal, line - signal
+
+    def update(self, value: float) -> Tuple[float, float, float]:
+        """Добавляет закрытое значение"""
+        self.fast_ema.update(value)
+        self.slow_ema.update(value)
+        self.count += 1
+        line = self._line(self.fast_ema.ema, self.slow_ema.ema)
+        signal = self.signal_ema.update(line)
+        return self._result(self.count, line, signal)
+
+    def peek(self, value: float) -> Tuple[float, float, float]:
+        """MACD, если бы value было добавлено, без изменения состояния"""
+        line = self._line(self.fast_ema._next(value), self.slow_ema._next(value))
+        return self._result(self.count + 1, line, self.signal_ema.peek(line))
+
+    @property
+    def value(self) -> Tuple[float, float, float]:
+        if self.count == 0:
+            return 0.0, 0.0, 0.0
+        line = self._line(self.fast_ema.ema, self.slow_ema.ema)
+        return self._result(self.count, line, self.signal_ema.value)
+
+
+class RollingStats:
+    """Скользящие среднее и дисперсия окна (Уэлфорд со скользящим окном)"""
+
+    def __init__(self, period: int):
+        self.period = period
+        self.window = deque(maxlen=period)
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def _next(self, value: float) -> Tuple[float, float]:
+        n = len(self.window)
+        if n < self.period:
+            mean = self.mean + (value - self.mean) / (n + 1)
+            return mean, self.m2 + (value - self.mean) * (value - mean)
+        old = self.window[0]
+        mean = self.mean + (value - old) / n
+        m2 = self.m2 + (value - old) * (value - mean + old - self.mean)
+        return mean, max(m2, 0.0)
+
+    def update(self, value: float) -> Tuple[float, float]:
+        """Добавляет значение, возвращает (среднее, стандартное отклонение)"""
+        self.mean, self.m2 = self._next(value)
+        self.window.append(value)
+        return self.mean, math.sqrt(self.m2 / len(self.window))
+
+    def peek(self, value: float) -> Tuple[float, float]:
+        """(среднее, стандартное отклонение), если бы value было добавлено"""
+        mean, m2 = self._next(value)
+        return mean, math.sqrt(m2 / min(len(self.window) + 1, self.period))
+
+    @property
+    def count(self) -> int:
+        return len(self.window)
+
+
+class IncrementalBollinger:
+    """Полосы Боллинджера на скользящих среднем и дисперсии"""
+
+    def __init__(self, period: int = 20, std_dev: float = 2):
+        self.std_dev = std_dev
+        self.stats = RollingStats(period)
+
+    def _result(self, mean: float, std: float, value: float, count: int) -> Tuple[float, float, float]:
+        if count < self.stats.period:
+            return value, value, value
+        return mean + std * self.std_dev, mean, mean - std * self.std_dev
+
+    def update(self, value: float) -> Tuple[float, float, float]:
+        """Добавляет закрытое значение"""
+        mean, std = self.stats.update(value)
+        return self._result(mean, std, value, self.stats.count)
+
+    def peek(self, value: float) -> Tuple[float, float, float]:
+        """Полосы, если бы value было добавлено, без изменения состояния"""
+        mean, std = self.stats.peek(value)
+        return self._result(mean, std, value, min(self.stats.count + 1, self.stats.period))
+
+
+class IndicatorEngine:
+    """Инкрементальный расчет индикаторов стратегии по закрытым свечам и тикам
+
+    update() фиксирует закрытую свечу, preview() считает индикаторы с учетом
+    формирующейся свечи без изменения состояния. Обе операции выполняются за O(1).
+    """
+
+    VOLUME_PERIOD = 20
+
+    def __init__(self, config: Optional[Config] = None):
+        self.config = config or Config()
+        self.reset()
+
+    def reset(self):
+        """Сбрасывает состояние всех индикаторов"""
+        self.rsi = IncrementalRSI(self.config.RSI_PERIOD)
+        self.bollinger = IncrementalBollinger()
+        self.macd = IncrementalMACD()
+        self.volume = RollingStats(self.VOLUME_PERIOD)
+        self.count = 0
+        self.last_start = None
+        self.snapshot = None
+
+    def update(self, close: float, volume: float, start: Optional[int] = None) -> Dict:
+        """Добавляет закрытую свечу"""
+        self.count += 1
+        self.last_start = start
+        rsi = self.rsi.update(close)
+        bands = self.bollinger.update(close)
+        macd = self.macd.update(close)
+        avg_volume, _ = self.volume.update(volume)
+        self.snapshot = self._snapshot(close, volume, rsi, bands, macd, avg_volume, self.count)
+        return self.snapshot
+
+    def preview(self, close: float, volume: float) -> Dict:
+        """Индикаторы с учетом незакрытой свечи"""
+        avg_volume, _ = self.volume.peek(volume)
+        return self._snapshot(
+            close, volume,
+            self.rsi.peek(close),
+            self.bollinger.peek(close),
+            self.macd.peek(close),
+            avg_volume,
+            self.count + 1
+        )
+
+    @staticmethod
+    def _snapshot(close: float, volume: float, rsi: float, bands: Tuple[float, float, float],
+                  macd: Tuple[float, float, float], avg_volume: float, count: int) -> Dict:
+        upper_bb, middle_bb, lower_bb = bands
+        macd_line, signal_line, histogram = macd
+        return {
+            "rsi": rsi,
+            "bollinger_bands": {"upper": upper_bb, "middle": middle_bb, "lower": lower_bb},
+            "macd": {"line": macd_line, "signal": signal_line, "histogram": histogram},
+            "current_price": close,
+            "volume": {"current": volume, "average": avg_volume},
+            "candles": count
+        }
@@ -0,0 +1,74 @@
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from decoding import klines_from_rest
+
+# Колонки строки REST kline: [start, open, high, low, close, volume, turnover]
+KLINE_COLUMNS = ("start", "open", "high", "low", "close", "volume", "turnover")
+
+# Максимум свечей в одном ответе REST kline
+KLINE_PAGE_SIZE = 1000
+
+# Длительность свечи в миллисекундах для проверки разрывов в потоке
+INTERVAL_MS = {
+    "D": 86_400_000,
+    "W": 604_800_000,
+}
+
+
+def interval_to_ms(interval: str) -> Optional[int]:
+    """Переводит интервал Bybit в миллисекунды (None для месячных свечей)"""
+    if interval.isdigit():
+        return int(interval) * 60_000
+    return INTERVAL_MS.get(interval)
+
+
+class KlineRing:
+    """Кольцевой буфер свечей одного (символ, интервал) с обновлением за O(1)
+
+    Каждая свеча пишется дважды (в нижнюю и верхнюю половину), поэтому последние
+    capacity свечей всегда лежат в памяти подряд и окно берется одним срезом.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.data = np.zeros((len(KLINE_COLUMNS), 2 * capacity))
+        self.head = 0
+        self.size = 0
+
+    @property
+    def last_start(self) -> int:
+        """Начало последней свечи (она может еще формироваться)"""
+        return int(self.data[0, self.head - 1 + self.capacity])
+
+    def _write(self, position: int, row: np.ndarray):
+        self.data[:, position] = row
+        self.data[:, position + self.capacity] = row
+
+    def merge(self, rows: List[List[str]]) -> int:
+        """Вливает строки REST (от новых к старым): обновляет последнюю свечу и дописывает новые"""
+        if not rows:
+            return 0
+        klines = klines_from_rest(rows)
+        table = np.column_stack([klines[column] for column in KLINE_COLUMNS])
+        added = 0
+        for row in table:
+            if self.size and row[0] < self.last_start:
+                continue
+            if self.size and row[0] == self.last_start:
+                self._write((self.head - 1) % self.capacity, row)
+                continue
+            self._write(self.head, row)
+            self.head = (self.head + 1) % self.capacity
+            self.size = min(self.size + 1, self.capacity)
+            added += 1
+        return added
+
+    def window(self, limit: int) -> Dict[str, np.ndarray]:
+        """Копия последних limit свечей по возрастанию времени, по колонкам"""
+        end = self.head + self.capacity
+        block = self.data[:, end - min(limit, self.size):end].copy()
+        columns = dict(zip(KLINE_COLUMNS, block))
+        columns["start"] = columns["start"].astype(np.int64)
+        return columns
@@ -0,0 +1,147 @@
+import math
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+import numpy as np
+
+# Линейных поддиапазонов на каждую степень двойки: относительная точность ~1/16
+SUB_BUCKETS = 16
+# Степеней двойки микросекунд: до 2^40 мкс (~12 суток)
+MAX_EXPONENT = 41
+
+# Границы корзин гистограммы Prometheus, секунды
+PROMETHEUS_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+SUMMARY_QUANTILES = (0.5, 0.9, 0.99)
+
+
+def bucket_index(micros: float) -> int:
+    """Номер корзины для значения в микросекундах (лог-линейная шкала, как в HDR Histogram)"""
+    if micros < 1:
+        return 0
+    mantissa, exponent = math.frexp(micros)
+    if exponent >= MAX_EXPONENT:
+        return MAX_EXPONENT * SUB_BUCKETS - 1
+    return exponent * SUB_BUCKETS + int((mantissa * 2 - 1) * SUB_BUCKETS)
+
+
+def bucket_upper_bounds() -> np.ndarray:
+    """Верхние границы корзин в секундах"""
+    index = np.arange(MAX_EXPONENT * SUB_BUCKETS)
+    exponent, sub = np.divmod(index, SUB_BUCKETS)
+    width = np.ldexp(1.0, exponent - 1) / SUB_BUCKETS
+    upper = np.ldexp(1.0, exponent - 1) + (sub + 1) * width
+    upper[:SUB_BUCKETS] = 1.0
+    return upper / 1e6
+
+
+class LatencyHistogram:
+    """Гистограмма задержек с фиксированными лог-линейными корзинами
+
+    Запись — O(1) без выделения памяти: номер корзины и инкремент счетчика.
+    Квантили считаются по счетчикам с точностью до ширины корзины.
+    """
+
+    upper_bounds = bucket_upper_bounds()
+
+    def __init__(self):
+        self.counts = [0] * (MAX_EXPONENT * SUB_BUCKETS)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds: float):
+        self.counts[bucket_index(seconds * 1e6)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def quantiles(self, quantiles=SUMMARY_QUANTILES, counts: Optional[np.ndarray] = None) -> List[float]:
+        """Квантили в секундах (верхняя граница корзины)"""
+        counts = np.asarray(self.counts if counts is None else counts)
+        cumulative = np.cumsum(counts)
+        if not cumulative[-1]:
+            return [0.0] * len(quantiles)
+        ranks = np.maximum(1, np.ceil(np.asarray(quantiles) * cumulative[-1]))
+        return self.upper_bounds[np.searchsorted(cumulative, ranks)].tolist()
+
+    def cumulative_at(self, bounds) -> List[int]:
+        """Число значений не больше каждой границы (для корзин Prometheus)"""
+        cumulative = np.cumsum(self.counts)
+        positions = np.searchsorted(self.upper_bounds, bounds, side="right")
+        return [int(cumulative[position - 1]) if position else 0 for position in positions]
+
+
+class LatencyRecorder:
+    """Гистограммы задержек по стадиям горячего пути: цикл стратегии, REST, ордера
+
+    Общий для процесса реестр, как у logging: стадии создаются при первой записи.
+    Периодическая сводка показывает распределение за интервал с прошлой сводки.
+    """
+
+    def __init__(self):
+        self.histograms: Dict[str, LatencyHistogram] = {}
+        self._logged: Dict[str, np.ndarray] = {}
+
+    def record(self, stage: str, seconds: float):
+        histogram = self.histograms.get(stage)
+        if histogram is None:
+            histogram = self.histograms[stage] = LatencyHistogram()
+        histogram.record(seconds)
+
+    @contextmanager
+    def measure(self, stage: str):
+        """Замеряет время выполнения блока"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - started)
+
+    def snapshot(self) -> Dict[str, Dict]:
+        """Накопленная статистика по стадиям в миллисекундах (для /api/metrics)"""
+        result = {}
+        for stage, histogram in sorted(self.histograms.items()):
+            p50, p90, p99 = histogram.quantiles()
+            result[stage] = {
+                "count": histogram.count,
+                "mean_ms": histogram.total / histogram.count * 1000 if histogram.count else 0.0,
+                "p50_ms": p50 * 1000,
+                "p90_ms": p90 * 1000,
+                "p99_ms": p99 * 1000,
+                "max_ms": histogram.max * 1000,
+            }
+        return result
+
+    def summary(self) -> List[str]:
+        """Строки сводки за интервал с прошлого вызова; стадии без новых замеров пропускаются"""
+        lines = []
+        for stage, histogram in sorted(self.histograms.items()):
+            counts = np.asarray(histogram.counts)
+            interval = counts - self._logged.get(stage, 0)
+            self._logged[stage] = counts
+            total = int(interval.sum())
+            if not total:
+                continue
+            p50, p90, p99 = histogram.quantiles(counts=interval)
+            lines.append(f"{stage}: n={total} p50={p50 * 1000:.2f}ms p90={p90 * 1000:.2f}ms "
+                         f"p99={p99 * 1000:.2f}ms")
+        return lines
+
+    def prometheus(self, name: str = "scalping_latency_seconds") -> str:
+        """Гистограммы в текстовом формате Prometheus"""
+        lines = [f"# HELP {name} Задержка стадий горячего пути бота",
+                 f"# TYPE {name} histogram"]
+        for stage, histogram in sorted(self.histograms.items()):
+            for bound, value in zip(PROMETHEUS_BUCKETS, histogram.cumulative_at(PROMETHEUS_BUCKETS)):
+                lines.append(f'{name}_bucket{{stage="{stage}",le="{bound}"}} {value}')
+            lines.append(f'{name}_bucket{{stage="{stage}",le="+Inf"}} {histogram.count}')
+            lines.append(f'{name}_sum{{stage="{stage}"}} {histogram.total:.6f}')
+            lines.append(f'{name}_count{{stage="{stage}"}} {histogram.count}')
+        return "\n".join(lines) + "\n"
+
+
+# Реестр процесса: клиент, стратегии и бот пишут в одни гистограммы
+recorder = LatencyRecorder()
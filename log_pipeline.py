@@ -0,0 +1,120 @@
+import json
+import logging
+import queue
+import sys
+from collections import defaultdict
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Optional
+
+from config import Config
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Атрибуты LogRecord; остальные поля записи пришли через extra и попадают в JSON
+RECORD_FIELDS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """Запись лога — одна строка JSON: время, уровень, логгер, сообщение, поля extra"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in RECORD_FIELDS:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class LazyQueueHandler(QueueHandler):
+    """Кладет запись в очередь как есть: сообщение форматируется в потоке слушателя
+
+    Стандартный QueueHandler форматирует сообщение в вызывающем потоке. При
+    переполнении очереди (диск или stdout не успевают) записи отбрасываются,
+    а не блокируют event loop.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class DebugSampler(logging.Filter):
+    """Пропускает каждую every-ю DEBUG-запись каждого шаблона сообщения
+
+    Шаблон — msg до подстановки аргументов, поэтому сообщения горячего пути
+    пишутся в стиле logger.debug("... %s", value), а не f-строкой.
+    """
+
+    def __init__(self, every: int):
+        super().__init__()
+        self.every = every
+        self.counts = defaultdict(int)
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno != logging.DEBUG or self.every <= 1:
+            return True
+        key = (record.name, record.msg)
+        if key not in self.counts and len(self.counts) >= 10000:
+            # Шаблоны из f-строк уникальны и иначе копились бы без конца
+            self.counts.clear()
+        count = self.counts[key]
+        self.counts[key] = count + 1
+        if count % self.every:
+            return False
+        record.sampled = self.every
+        return True
+
+
+def setup_logging(config: Optional[Config] = None) -> Optional[QueueListener]:
+    """Настраивает корневой логгер; в асинхронном режиме возвращает запущенный QueueListener
+
+    Файл лога ротируется по размеру, консоль получает текст. В асинхронном режиме
+    вызывающий поток только кладет запись в очередь, форматирование и запись — в
+    фоновом потоке; слушатель нужно остановить при завершении, чтобы дописать очередь.
+    """
+    config = config or Config()
+    file_handler = RotatingFileHandler(config.LOG_FILE, maxBytes=config.LOG_MAX_MB * 1024 * 1024,
+                                       backupCount=config.LOG_BACKUP_COUNT, encoding="utf-8")
+    file_handler.setFormatter(JsonFormatter() if config.LOG_JSON else logging.Formatter(TEXT_FORMAT))
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+
+    root = logging.getLogger()
+    root.setLevel(getattr(logging, config.LOG_LEVEL))
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+
+    if not config.LOG_ASYNC:
+        for handler in (file_handler, stream_handler):
+            handler.addFilter(DebugSampler(config.LOG_DEBUG_SAMPLE))
+            root.addHandler(handler)
+        return None
+
+    queue_handler = LazyQueueHandler(queue.Queue(config.LOG_QUEUE_SIZE))
+    queue_handler.addFilter(DebugSampler(config.LOG_DEBUG_SAMPLE))
+    root.addHandler(queue_handler)
+    listener = QueueListener(queue_handler.queue, file_handler, stream_handler)
+    listener.start()
+    return listener
+
+
+def dropped_records() -> int:
+    """Сколько записей отброшено из-за переполнения очереди лога"""
+    return sum(handler.dropped for handler in logging.getLogger().handlers if isinstance(handler, LazyQueueHandler))
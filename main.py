@@ -1,20 +1,50 @@
 import asyncio
 import logging
 import signal
-import sys
+import time
 from datetime import datetime
-from typing import Dict, Optional
+from typing import Dict, List, Optional
 
 from config import Config
 from bybit_client import BybitClient
 from scalping_strategy import ScalpingStrategy
+from market_data import MarketDataFeed
+from candle_store import CandleStore
+from market_recorder import MarketRecorder
+from status_server import StatusServer
+from latency import recorder
+from log_pipeline import dropped_records, setup_logging
 
 class ScalpingBot:
-    def __init__(self):
-        self.config = Config()
-        self.client = BybitClient()
-        self.strategy = ScalpingStrategy()
+    def __init__(self, symbols: Optional[List[str]] = None, client: Optional[BybitClient] = None,
+                 market=None, config: Optional[Config] = None):
+        self.config = config or Config()
+        # Один клиент на все символы: общий пул соединений и бюджет запросов
+        self.client = client or BybitClient.shared()
+        self.strategies: Dict[str, ScalpingStrategy] = {
+            symbol: ScalpingStrategy(self.client, symbol) for symbol in symbols or self.config.SYMBOLS
+        }
+        # Выходы по TP/SL исполняются на бирже, стратегии сверяют их по потоку ордеров
+        for strategy in self.strategies.values():
+            self.client.orders.listeners.append(strategy.on_order_update)
+        self.feeds: Dict[str, MarketDataFeed] = {}
+        # Процесс стратегий (SHARD_WORKERS > 1): рынок читается из общей памяти (SharedMarket),
+        # потоки, хранилище свечей и запись рынка ведет процесс потоков
+        self.market = market
+        # Закрытые свечи сохраняются на диск и переживают перезапуск
+        self.candle_store = CandleStore() if self.config.USE_CANDLE_STORE and market is None else None
+        # Потоки рынка пишутся на диск для бэктеста и симулятора
+        self.recorder = MarketRecorder() if self.config.RECORD_MARKET_DATA and market is None else None
         self.running = False
+        self.stopped = False
+        self.last_status_log = 0.0
+        self.last_latency_log = time.monotonic()
+        
+        # Состояние для API статуса: отдается из памяти, без запросов к бирже
+        self.started_at: Optional[datetime] = None
+        self.account_info: Dict = {}
+        self.metrics = {"cycles": 0, "trades_opened": 0, "trades_failed": 0}
+        self.status_server: Optional[StatusServer] = None
         self.logger = self._setup_logging()
         
         # Обработчики сигналов для graceful shutdown
@@ -22,17 +52,16 @@ class ScalpingBot:
         signal.signal(signal.SIGTERM, self._signal_handler)
     
     def _setup_logging(self) -> logging.Logger:
-        """Настраивает логирование"""
-        logging.basicConfig(
-            level=getattr(logging, self.config.LOG_LEVEL),
-            format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-            handlers=[
-                logging.FileHandler('scalping_bot.log'),
-                logging.StreamHandler(sys.stdout)
-            ]
-        )
+        """Настраивает логирование (при LOG_ASYNC запись идет в фоновом потоке)"""
+        self.log_listener = setup_logging(self.config)
         return logging.getLogger(__name__)
     
+    def stop_logging(self):
+        """Дописывает очередь лога; вызывается последним"""
+        if self.log_listener:
+            self.log_listener.stop()
+            self.log_listener = None
+    
     def _signal_handler(self, signum, frame):
         """Обработчик сигналов для graceful shutdown"""
         self.logger.info(f"Получен сигнал {signum}, завершаем работу...")
@@ -53,15 +82,31 @@ class ScalpingBot:
                 self.logger.error("Не удалось подключиться к Bybit API")
                 return False
             
-            self.logger.info(f"Подключение к Bybit установлено: {account_info}")
+            self.account_info = account_info
+            self.logger.info("Подключение к Bybit установлено: %s", account_info)
             
-            # Получаем текущую цену
-            current_price = await self.client.get_market_price(self.config.SYMBOL)
-            if current_price:
-                self.logger.info(f"Текущая цена {self.config.SYMBOL}: {current_price}")
+            # Исполнения ордеров, позиции и кошелек приходят из приватного потока
+            if self.config.USE_PRIVATE_WS:
+                self.client.subscribe_to_order_updates()
+                self.client.subscribe_to_account_updates()
             
-            # Отменяем все активные ордера
-            await self.client.cancel_all_orders(self.config.SYMBOL)
+            # Получаем текущие цены и отменяем все активные ордера по всем символам
+            await asyncio.gather(*(self._initialize_symbol(symbol) for symbol in self.strategies))
+            
+            # Запускаем потоки рыночных данных
+            if self.market is not None:
+                for symbol in self.strategies:
+                    self.feeds[symbol] = self.market.feed(symbol)
+                self.market.start(self.config.SHARD_POLL_MS / 1000)
+                self.logger.info(f"Рыночные данные из общей памяти: {', '.join(self.feeds)}")
+            elif self.config.USE_WEBSOCKET:
+                if self.recorder:
+                    self.recorder.start()
+                for symbol in self.strategies:
+                    self.feeds[symbol] = MarketDataFeed(self.client, symbol, self.config.CANDLE_INTERVAL,
+                                                        store=self.candle_store, recorder=self.recorder)
+                    await self.feeds[symbol].start()
+                self.logger.info(f"Потоки рыночных данных запущены: {', '.join(self.feeds)}")
             
             self.logger.info("Бот успешно инициализирован")
             return True
@@ -70,14 +115,45 @@ class ScalpingBot:
             self.logger.error(f"Ошибка при инициализации: {e}")
             return False
     
-    async def run_strategy_cycle(self):
-        """Выполняет один цикл стратегии"""
+    async def _initialize_symbol(self, symbol: str):
+        """Подготавливает символ к торговле"""
+        current_price = await self.client.get_market_price(symbol)
+        if current_price:
+            self.logger.info(f"Текущая цена {symbol}: {current_price}")
+        
+        await self.client.cancel_all_orders(symbol)
+        
+        # Шаг цены нужен для уровней TP/SL; загружаем заранее, а не в момент сделки
+        if self.config.EXCHANGE_TPSL:
+            await self.client.get_tick_size(symbol)
+    
+    async def run_strategy_cycle(self, symbol: str):
+        """Выполняет один цикл стратегии для символа"""
+        started = time.perf_counter()
         try:
+            self.metrics["cycles"] += 1
+            strategy = self.strategies[symbol]
+            feed = self.feeds.get(symbol)
+            
+            # Данные из потока, если он запущен, иначе стратегия запросит их через REST
+            current_price = feed.last_price if feed else None
+            kline_data = feed.candles if feed else None
+            orderbook = feed.book if feed else None
+            event_time = feed.event_time if feed else None
+            if feed:
+                feed.event_time = None
+            
             # Обновляем информацию о позициях
-            await self.strategy.update_positions(self.config.SYMBOL)
+            with recorder.measure("update_positions"):
+                await strategy.update_positions(symbol, current_price)
             
             # Проверяем, следует ли открыть новую позицию
-            should_open, reason = await self.strategy.should_open_position(self.config.SYMBOL)
+            with recorder.measure("decision"):
+                should_open, reason = await strategy.should_open_position(symbol, kline_data, orderbook)
+            decided = time.perf_counter()
+            if event_time is not None:
+                # От прихода события WebSocket до принятого решения, включая ожидание в очереди
+                recorder.record("tick_to_decision", decided - event_time)
             
             if should_open:
                 # Определяем сторону торговли
@@ -86,27 +162,32 @@ class ScalpingBot:
                 elif "SELL" in reason:
                     side = "Sell"
                 else:
-                    self.logger.warning(f"Неопределенная сторона торговли: {reason}")
+                    self.logger.warning("Неопределенная сторона торговли: %s", reason)
                     return
                 
-                self.logger.info(f"Открываем позицию: {reason}")
+                self.logger.info("Открываем позицию %s: %s", symbol, reason)
                 
                 # Выполняем торговую операцию
-                success = await self.strategy.execute_trade(
-                    symbol=self.config.SYMBOL,
+                success = await strategy.execute_trade(
+                    symbol=symbol,
                     side=side,
                     quantity=self.config.QUANTITY
                 )
+                recorder.record("signal_to_order", time.perf_counter() - decided)
                 
                 if success:
-                    self.logger.info(f"Позиция {side} успешно открыта")
+                    self.metrics["trades_opened"] += 1
+                    self.logger.info("Позиция %s %s успешно открыта", side, symbol)
                 else:
-                    self.logger.error(f"Не удалось открыть позицию {side}")
+                    self.metrics["trades_failed"] += 1
+                    self.logger.error("Не удалось открыть позицию %s %s", side, symbol)
             else:
-                self.logger.debug(f"Нет сигнала для открытия позиции: {reason}")
+                self.logger.debug("Нет сигнала для открытия позиции: %s", reason)
                 
         except Exception as e:
-            self.logger.error(f"Ошибка в цикле стратегии: {e}")
+            self.logger.error(f"Ошибка в цикле стратегии {symbol}: {e}")
+        finally:
+            recorder.record("cycle", time.perf_counter() - started)
     
     async def run(self):
         """Основной цикл работы бота"""
@@ -117,47 +198,94 @@ class ScalpingBot:
                 return
             
             self.running = True
+            self.started_at = datetime.now()
+            # API статуса — только в однопроцессном режиме: порт один на хост
+            if self.config.STATUS_API_ENABLED and self.market is None:
+                self.status_server = StatusServer(self)
+                await self.status_server.start()
             self.logger.info("Бот запущен и работает...")
             
-            # Основной цикл
-            while self.running:
-                try:
-                    # Выполняем цикл стратегии
-                    await self.run_strategy_cycle()
-                    
-                    # Получаем статус стратегии
-                    status = self.strategy.get_strategy_status()
-                    self.logger.info(f"Статус: {status['active_positions']}/{status['max_positions']} позиций")
-                    
-                    # Ждем перед следующим циклом
-                    await asyncio.sleep(10)  # 10 секунд между циклами
-                    
-                except asyncio.CancelledError:
-                    self.logger.info("Получен сигнал отмены")
-                    break
-                except Exception as e:
-                    self.logger.error(f"Ошибка в основном цикле: {e}")
-                    await asyncio.sleep(30)  # Ждем 30 секунд при ошибке
+            # Символы работают параллельно в одном event loop
+            await asyncio.gather(*(self._run_symbol(symbol) for symbol in self.strategies))
             
         except Exception as e:
             self.logger.error(f"Критическая ошибка: {e}")
         finally:
             await self.shutdown()
     
+    async def _run_symbol(self, symbol: str):
+        """Основной цикл одного символа"""
+        feed = self.feeds.get(symbol)
+        while self.running:
+            try:
+                if feed:
+                    # Цикл запускается событием рынка; таймаут нужен, чтобы проверять self.running
+                    if not await feed.wait_for_update(timeout=1):
+                        continue
+                    await self.run_strategy_cycle(symbol)
+                else:
+                    await self.run_strategy_cycle(symbol)
+                    await asyncio.sleep(self.config.CYCLE_INTERVAL)
+                
+                # Получаем статус стратегии
+                self._log_status()
+                self._log_latency()
+                
+            except asyncio.CancelledError:
+                self.logger.info("Получен сигнал отмены")
+                break
+            except Exception as e:
+                self.logger.error(f"Ошибка в основном цикле {symbol}: {e}")
+                await asyncio.sleep(30)  # Ждем 30 секунд при ошибке
+    
+    def _log_status(self):
+        """Периодически логирует статус стратегии"""
+        now = time.monotonic()
+        interval = self.config.STATUS_LOG_INTERVAL if self.feeds else self.config.CYCLE_INTERVAL
+        if now - self.last_status_log < interval:
+            return
+        self.last_status_log = now
+        summary = ", ".join(
+            f"{symbol} {len(strategy.positions)}/{self.config.MAX_POSITIONS}"
+            for symbol, strategy in self.strategies.items()
+        )
+        self.logger.info("Статус позиций: %s", summary)
+    
+    def _log_latency(self):
+        """Периодически логирует задержки стадий за прошедший интервал"""
+        interval = self.config.LATENCY_LOG_INTERVAL
+        now = time.monotonic()
+        if not interval or now - self.last_latency_log < interval:
+            return
+        self.last_latency_log = now
+        for line in recorder.summary():
+            self.logger.info(f"Задержка {line}")
+    
     async def shutdown(self):
         """Корректно завершает работу бота"""
+        if self.stopped:
+            return
+        self.stopped = True
         try:
             self.logger.info("Завершение работы бота...")
             
             # Закрываем все позиции
-            for position in self.strategy.active_positions[:]:
-                self.logger.info(f"Закрываем позицию: {position}")
-                await self.strategy.close_position_by_id(position)
+            await self.flatten()
             
             # Отменяем все ордера
-            await self.client.cancel_all_orders(self.config.SYMBOL)
+            await asyncio.gather(*(self.client.cancel_all_orders(symbol) for symbol in self.strategies))
             
             # Закрываем соединения
+            if self.status_server:
+                await self.status_server.stop()
+            for feed in self.feeds.values():
+                await feed.stop()
+            self.feeds = {}
+            if self.market is not None:
+                self.market.stop()
+            if self.recorder:
+                # Дописывает очередь и закрывает файлы, не занимая event loop
+                await asyncio.to_thread(self.recorder.stop)
             self.client.close_connection()
             
             self.logger.info("Бот успешно завершил работу")
@@ -165,24 +293,69 @@ class ScalpingBot:
         except Exception as e:
             self.logger.error(f"Ошибка при завершении работы: {e}")
     
+    async def flatten(self):
+        """Закрывает все позиции бота: ордера выхода отменяются и позиции закрываются
+        пакетными запросами по всем символам, а не запросом на каждую позицию"""
+        positions = [(strategy, position) for strategy in self.strategies.values()
+                     for position in list(strategy.positions.values())]
+        if not positions:
+            return
+        self.logger.info(f"Закрываем позиции: {len(positions)}")
+        # Ордера выхода закреплены за позициями: у каждой не больше одного TP и одного SL
+        exit_orders = {order_id: position['symbol'] for strategy, position in positions
+                       for order_id in strategy.exit_orders_of(position)}
+        await self.client.cancel_batch_orders([{"symbol": symbol, "order_id": order_id}
+                                               for order_id, symbol in exit_orders.items()])
+        results = await self.client.close_positions([position for _, position in positions])
+        for (strategy, position), result in zip(positions, results):
+            if result['code']:
+                self.logger.error(f"Не удалось закрыть позицию {position['order_id']}: {result['msg']}")
+                continue
+            strategy.book.remove(position['order_id'])
+            self.logger.info("Позиция закрыта: %s", position)
+    
     async def get_bot_status(self) -> Dict:
-        """Возвращает текущий статус бота"""
+        """Возвращает текущий статус бота из состояния в памяти (без запросов к бирже)"""
         try:
-            account_info = await self.client.get_account_info()
-            strategy_status = self.strategy.get_strategy_status()
-            current_price = await self.client.get_market_price(self.config.SYMBOL)
+            symbols = list(self.strategies)
+            prices = {}
+            orderbooks = {}
+            for symbol, strategy in self.strategies.items():
+                feed = self.feeds.get(symbol)
+                prices[symbol] = feed.last_price if feed and feed.last_price else strategy.last_price
+                if feed and feed.book is not None and feed.book.ready:
+                    orderbooks[symbol] = feed.book.features(self.config.ORDERBOOK_LEVELS)
             
             return {
                 "running": self.running,
-                "symbol": self.config.SYMBOL,
-                "current_price": current_price,
-                "account_info": account_info,
-                "strategy_status": strategy_status,
+                "symbols": symbols,
+                "current_prices": prices,
+                "orderbooks": orderbooks,
+                "account_info": self.account_info,
+                # Кошелек и нетто-позиции биржи из приватных потоков
+                "wallet": self.client.positions.wallet,
+                "exchange_positions": self.client.positions.exchange,
+                "strategy_status": {symbol: strategy.get_strategy_status()
+                                    for symbol, strategy in self.strategies.items()},
+                "metrics": self.get_metrics(),
                 "timestamp": datetime.now().isoformat()
             }
         except Exception as e:
             self.logger.error(f"Ошибка при получении статуса: {e}")
             return {"error": str(e)}
+    
+    def get_metrics(self) -> Dict:
+        """Счетчики работы бота"""
+        uptime = (datetime.now() - self.started_at).total_seconds() if self.started_at else 0.0
+        return dict(self.metrics,
+                    uptime=uptime,
+                    active_positions=len(self.client.positions.entries),
+                    rate_limited=self.client.scheduler.rate_limited,
+                    recorded=self.recorder.written if self.recorder else 0,
+                    recorder_dropped=self.recorder.dropped if self.recorder else 0,
+                    log_dropped=dropped_records(),
+                    orderbook_gaps=sum(feed.book.gaps for feed in self.feeds.values() if feed.book is not None),
+                    latency=recorder.snapshot())
 
 async def main():
     """Главная функция"""
@@ -196,7 +369,12 @@ async def main():
         print(f"Критическая ошибка: {e}")
     finally:
         await bot.shutdown()
+        bot.stop_logging()
 
 if __name__ == "__main__":
     # Запускаем бота
-    asyncio.run(main())
+    if Config.SHARD_WORKERS > 1:
+        from supervisor import Supervisor
+        Supervisor().run()
+    else:
+        asyncio.run(main())
@@ -0,0 +1,291 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Dict, List, Optional
+
+from bybit_client import BybitClient
+from config import Config
+from decoding import klines_from_candles, to_candles
+from kline_cache import interval_to_ms
+from orderbook import OrderBook
+from resampler import Resampler
+
+# Предельная пауза между попытками восстановить стакан снимком REST, секунды
+ORDERBOOK_RETRY_DELAY = 2.0
+
+
+def candle_from_ws(item: Dict) -> Dict:
+    """Преобразует элемент WebSocket kline в свечу"""
+    return {
+        "start": int(item["start"]),
+        "open": float(item["open"]),
+        "high": float(item["high"]),
+        "low": float(item["low"]),
+        "close": float(item["close"]),
+        "volume": float(item["volume"]),
+        "turnover": float(item["turnover"]),
+        "confirm": bool(item["confirm"]),
+    }
+
+
+class MarketDataFeed:
+    """Потоковые рыночные данные по одному символу: тикер, живой буфер свечей и стакан L2"""
+
+    def __init__(self, client: BybitClient, symbol: str, interval: str, buffer_size: int = 200, store=None,
+                 recorder=None):
+        self.config = Config()
+        self.client = client
+        # Локальное хранилище свечей (CandleStore): теплый старт без загрузки всей истории
+        self.store = store
+        # Запись потоков на диск (MarketRecorder): сообщения передаются ей прямо из потока WebSocket
+        self.recorder = recorder
+        self.symbol = symbol
+        self.interval = interval
+        self.interval_ms = interval_to_ms(interval)
+        self.logger = logging.getLogger(__name__)
+
+        # Свечи по возрастанию времени, последняя может быть незакрытой
+        self.candles = deque(maxlen=buffer_size)
+        # Сколько раз буфер свечей пересобирался целиком (REST или хранилище)
+        self.resyncs = 0
+        self.last_price = None
+        self.last_message_time = 0.0
+        # Момент прихода самого раннего необработанного события (perf_counter) для замера tick-to-decision
+        self.event_time = None
+        # Локальный стакан из потока orderbook (ORDERBOOK_DEPTH=0 — без стакана)
+        depth = self.config.ORDERBOOK_DEPTH
+        self.book = OrderBook(symbol, depth) if depth > 0 else None
+        # Старшие интервалы, собираемые из потока свечей (RESAMPLE_INTERVALS)
+        intervals = self.config.RESAMPLE_INTERVALS
+        self.timeframes = Resampler(intervals, interval, buffer_size) if intervals else None
+        self._book_resync = None
+        # (топик, колбэк) подписок потока: клиент общий, при остановке отписывается только этот поток
+        self._subscribed = []
+
+        self._loop = None
+        self._updated = asyncio.Event()
+        self._watchdog_task = None
+        self._resync_lock = asyncio.Lock()
+        self.running = False
+
+    async def start(self):
+        """Загружает историю через REST и подписывается на потоки"""
+        self._loop = asyncio.get_running_loop()
+        self.running = True
+        await self.resync()
+        self._subscribe()
+        self._watchdog_task = asyncio.create_task(self._watchdog())
+
+    async def stop(self):
+        """Останавливает поток данных"""
+        self.running = False
+        if self._watchdog_task:
+            self._watchdog_task.cancel()
+        for topic, callback in self._subscribed:
+            self.client.unsubscribe(topic, callback)
+        self._subscribed = []
+
+    def _subscribe(self):
+        """Подписывается на тикер, свечи и стакан"""
+        self.last_message_time = time.monotonic()
+        subscriptions = [(self.client.subscribe_to_ticker(self.symbol, self._on_ticker), self._on_ticker),
+                         (self.client.subscribe_to_kline(self.symbol, self.interval, self._on_kline), self._on_kline)]
+        if self.book is not None:
+            subscriptions.append((self.client.subscribe_to_orderbook(self.symbol, self.book.depth, self._on_orderbook),
+                                  self._on_orderbook))
+        if self.recorder is not None:
+            # Сделки нужны только записи
+            subscriptions.append((self.client.subscribe_to_trades(self.symbol, self._on_trade), self._on_trade))
+        self._subscribed = subscriptions
+
+    async def resync(self):
+        """Восстанавливает буфер свечей и цену из REST"""
+        async with self._resync_lock:
+            if self.store is not None and await self._resync_from_store():
+                self._updated.set()
+                return
+            klines, price = await asyncio.gather(
+                self.client.get_klines(self.symbol, self.interval, self.candles.maxlen),
+                self.client.get_market_price(self.symbol)
+            )
+            if len(klines):
+                self.candles.clear()
+                self.candles.extend(to_candles(klines))
+                # Самая новая свеча из REST еще формируется
+                self.candles[-1]["confirm"] = False
+                self.resyncs += 1
+                self._seed_timeframes()
+            if price:
+                self.last_price = price
+            self.logger.info(f"Буфер свечей {self.symbol} синхронизирован: {len(self.candles)} свечей")
+            self._updated.set()
+
+    async def resync_orderbook(self):
+        """Восстанавливает стакан снимком REST после разрыва последовательности дельт
+        
+        Повторяет, пока стакан не станет валидным: поток сам снимок не пришлет, а пока
+        стакан не валиден, новые разрывы не замечаются.
+        """
+        attempt = 0
+        while self.running and not self.book.ready:
+            snapshot = await self.client.get_orderbook(self.symbol, self.book.depth)
+            if snapshot and self.book.load_snapshot(snapshot):
+                self.logger.info(f"Стакан {self.symbol} восстановлен снимком REST (seq={self.book.seq})")
+                return
+            attempt += 1
+            if attempt == 3:
+                self.logger.warning(f"Стакан {self.symbol} не восстановлен через REST, повторяем")
+            # Снимок отстал от потока: дельты уже ушли дальше, пробуем еще раз
+            await asyncio.sleep(min(0.2 * attempt, ORDERBOOK_RETRY_DELAY))
+    
+    async def _resync_from_store(self) -> bool:
+        """Догружает в хранилище только недостающие свечи и берет буфер из него"""
+        try:
+            _, price = await asyncio.gather(
+                self.store.sync(self.client, self.symbol, self.interval),
+                self.client.get_market_price(self.symbol)
+            )
+        except Exception as e:
+            self.logger.error(f"Ошибка синхронизации хранилища свечей {self.symbol}: {e}")
+            return False
+        if not self.store.is_current(self.symbol, self.interval):
+            return False
+
+        # Формирующаяся свеча придет из WebSocket
+        stored = self.store.tail(self.symbol, self.interval, self.candles.maxlen)
+        self.candles.clear()
+        for row in zip(*(values.tolist() for values in stored.values())):
+            candle = dict(zip(stored, row))
+            candle["confirm"] = True
+            self.candles.append(candle)
+        self.resyncs += 1
+        if price:
+            self.last_price = price
+        self._seed_timeframes()
+        self.logger.info(f"Буфер свечей {self.symbol} загружен из хранилища: {len(self.candles)} свечей")
+        return True
+
+    def _seed_timeframes(self):
+        """Пересобирает старшие интервалы из истории: хранилище дает полный буфер и для часовых свечей"""
+        if self.timeframes is None:
+            return
+        if self.store is not None and self.store.count(self.symbol, self.interval):
+            ratio = max(frame.interval_ms for frame in self.timeframes.frames.values()) // self.interval_ms
+            history = self.store.tail(self.symbol, self.interval, self.candles.maxlen * ratio)
+            starts = history["start"]
+            # Формирующаяся свеча буфера (после REST) досчитывается поверх хранилища
+            newer = [candle for candle in self.candles if not len(starts) or candle["start"] > starts[-1]]
+            self.timeframes.seed(history)
+            for candle in newer:
+                self.timeframes.update(candle)
+        else:
+            self.timeframes.seed(klines_from_candles(self.candles))
+
+    async def reconnect(self):
+        """Пересоздает WebSocket и заново синхронизирует данные"""
+        self.logger.warning(f"Переподключение потока рыночных данных {self.symbol}")
+        self.last_message_time = time.monotonic()
+        # WebSocket общий для всех символов: клиент восстановит все подписки,
+        # поэтому замолчавшие одновременно потоки переподключают его один раз
+        if time.monotonic() - self.client.ws_reconnected_at > self.config.WS_STALE_TIMEOUT:
+            self.client.ws_reconnected_at = time.monotonic()
+            await asyncio.get_running_loop().run_in_executor(None, self.client.reconnect_ws)
+        await self.resync()
+
+    async def _watchdog(self):
+        """Переподключается, если поток замолчал"""
+        timeout = self.config.WS_STALE_TIMEOUT
+        while self.running:
+            await asyncio.sleep(timeout / 2)
+            if time.monotonic() - self.last_message_time > timeout:
+                try:
+                    await self.reconnect()
+                except Exception as e:
+                    self.logger.error(f"Ошибка при переподключении потока: {e}")
+
+    # Колбэки pybit вызываются из потока WebSocket, данные передаются в event loop
+
+    def _on_ticker(self, message: Dict):
+        if self.recorder is not None:
+            self.recorder.record("ticker", self.symbol, message)
+        self._loop.call_soon_threadsafe(self._apply_ticker, message, time.perf_counter())
+
+    def _on_kline(self, message: Dict):
+        if self.recorder is not None:
+            self.recorder.record("kline", self.symbol, message)
+        self._loop.call_soon_threadsafe(self._apply_kline, message, time.perf_counter())
+
+    def _on_orderbook(self, message: Dict):
+        if self.recorder is not None:
+            self.recorder.record("book", self.symbol, message)
+        self._loop.call_soon_threadsafe(self._apply_orderbook, message)
+
+    def _on_trade(self, message: Dict):
+        self.recorder.record("trade", self.symbol, message)
+
+    def _notify(self, received: float):
+        """Сигнализирует о новом событии; объединенные события меряются от самого раннего"""
+        if not self._updated.is_set():
+            self.event_time = received
+        self._updated.set()
+
+    def _apply_ticker(self, message: Dict, received: Optional[float] = None):
+        self.last_message_time = time.monotonic()
+        last_price = message.get("data", {}).get("lastPrice")
+        if last_price:
+            self.last_price = float(last_price)
+            self._notify(received or time.perf_counter())
+
+    def _apply_kline(self, message: Dict, received: Optional[float] = None):
+        self.last_message_time = time.monotonic()
+        for item in message.get("data", []):
+            candle = candle_from_ws(item)
+            if candle["confirm"]:
+                self._store_candle(candle)
+            if self.timeframes is not None:
+                self.timeframes.update(candle)
+            if self.candles and candle["start"] == self.candles[-1]["start"]:
+                self.candles[-1] = candle
+            elif not self.candles or candle["start"] > self.candles[-1]["start"]:
+                if (self.candles and self.interval_ms and
+                        candle["start"] - self.candles[-1]["start"] > self.interval_ms):
+                    # Пропущены свечи (например, во время реконнекта) — догружаем из REST
+                    asyncio.ensure_future(self.resync())
+                self.candles.append(candle)
+        self._notify(received or time.perf_counter())
+
+    def _apply_orderbook(self, message: Dict):
+        # Стакан не будит цикл стратегии: дельты идут чаще тикера, стратегия читает стакан на событии тикера или свечи
+        self.last_message_time = time.monotonic()
+        if not self.book.apply(message.get("data", {}), message.get("type") == "snapshot"):
+            if self._book_resync is None or self._book_resync.done():
+                self._book_resync = asyncio.ensure_future(self.resync_orderbook())
+
+    def _store_candle(self, candle: Dict):
+        """Сохраняет закрытую свечу, если она продолжает хранилище без разрыва"""
+        if self.store is None or not self.interval_ms:
+            return
+        last = self.store.last_start(self.symbol, self.interval)
+        if last is not None and candle["start"] - last == self.interval_ms:
+            try:
+                self.store.append_candle(self.symbol, self.interval, candle)
+            except OSError as e:
+                self.logger.error(f"Ошибка записи свечи {self.symbol} в хранилище: {e}")
+
+    async def wait_for_update(self, timeout: Optional[float] = None) -> bool:
+        """Ждет нового события рынка; события, пришедшие во время обработки, объединяются"""
+        try:
+            await asyncio.wait_for(self._updated.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        self._updated.clear()
+        return True
+
+    def get_kline_data(self) -> List[Dict]:
+        """Возвращает свечи из буфера по возрастанию времени"""
+        return list(self.candles)
+
+    def get_timeframe_data(self, interval: str) -> List[Dict]:
+        """Свечи старшего интервала из RESAMPLE_INTERVALS по возрастанию времени (последняя может формироваться)"""
+        return self.timeframes.candles(interval)
@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""
+Запись публичных рыночных данных (сделки, тикеры, свечи, дельты стакана) в
+append-only бинарные файлы с фиксированной раскладкой записей, сжатые gzip,
+с ротацией по размеру. На диск пишет фоновый поток, event loop не блокируется.
+"""
+
+import argparse
+import glob
+import gzip
+import logging
+import os
+import struct
+import threading
+import time
+import zlib
+from collections import defaultdict, deque
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from config import Config
+
+# Записи по видам данных (little-endian, без выравнивания); recv — локальное время приема, мкс
+RECORDS = {
+    "trade": np.dtype([("ts", "<i8"), ("recv", "<i8"), ("price", "<f8"), ("size", "<f8"),
+                       ("side", "i1")]),
+    "ticker": np.dtype([("ts", "<i8"), ("recv", "<i8"), ("last", "<f8"), ("bid", "<f8"), ("ask", "<f8"),
+                        ("mark", "<f8"), ("volume24h", "<f8")]),
+    "kline": np.dtype([("ts", "<i8"), ("recv", "<i8"), ("start", "<i8"), ("open", "<f8"), ("high", "<f8"),
+                       ("low", "<f8"), ("close", "<f8"), ("volume", "<f8"), ("turnover", "<f8"),
+                       ("confirm", "u1")]),
+    # Строка на уровень; snapshot=1 — уровень снимка (стакан перед ним очищается)
+    "book": np.dtype([("ts", "<i8"), ("recv", "<i8"), ("update_id", "<i8"), ("side", "i1"),
+                      ("snapshot", "u1"), ("price", "<f8"), ("size", "<f8")]),
+}
+
+# Заголовок файла: сигнатура, версия раскладки, размер записи
+MAGIC = b"SKMD"
+VERSION = 1
+HEADER = struct.Struct("<4sHH")
+
+FILE_SUFFIX = ".rec.gz"
+
+
+def _float(value) -> float:
+    return float(value) if value not in (None, "") else np.nan
+
+
+def _decode(kind: str, recv: int, message: Dict) -> List[Tuple]:
+    """Строки записей из сообщения потока Bybit"""
+    data = message.get("data")
+    ts = int(message.get("ts") or 0)
+    if kind == "trade":
+        return [(int(item["T"]), recv, float(item["p"]), float(item["v"]), 1 if item["S"] == "Buy" else -1)
+                for item in data]
+    if kind == "ticker":
+        return [(ts, recv, _float(data.get("lastPrice")), _float(data.get("bid1Price")),
+                 _float(data.get("ask1Price")), _float(data.get("markPrice")), _float(data.get("volume24h")))]
+    if kind == "kline":
+        return [(int(item.get("timestamp") or ts), recv, int(item["start"]), float(item["open"]),
+                 float(item["high"]), float(item["low"]), float(item["close"]), float(item["volume"]),
+                 float(item["turnover"]), int(bool(item["confirm"]))) for item in data]
+    if kind == "book":
+        update_id, snapshot = int(data.get("u", 0)), int(message.get("type") == "snapshot")
+        rows = [(ts, recv, update_id, 1, snapshot, float(price), float(size)) for price, size in data.get("b", [])]
+        rows.extend((ts, recv, update_id, -1, snapshot, float(price), float(size)) for price, size in data.get("a", []))
+        return rows
+    raise ValueError(f"Неизвестный вид записи {kind}")
+
+
+def _stream(kind: str, message: Dict) -> str:
+    """Имя потока записи: у свечей в него входит интервал из топика (kline.1.BTCUSDT -> kline.1)"""
+    if kind == "kline":
+        return f"kline.{message['topic'].split('.')[1]}"
+    return kind
+
+
+class RecordFile:
+    """Текущий файл потока записи; после закрытия становится валидным gzip-файлом"""
+
+    def __init__(self, path: str, dtype: np.dtype, compresslevel: int):
+        self.path = path
+        self._raw = open(path, "wb")
+        self._file = gzip.GzipFile(fileobj=self._raw, mode="wb", compresslevel=compresslevel)
+        self._file.write(HEADER.pack(MAGIC, VERSION, dtype.itemsize))
+
+    @property
+    def size(self) -> int:
+        """Байт на диске"""
+        return self._raw.tell()
+
+    def write(self, data: bytes):
+        self._file.write(data)
+
+    def flush(self):
+        # Синхронный сброс zlib: записанное читается даже при обрыве процесса
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+        self._raw.close()
+
+
+class MarketRecorder:
+    """Пишет сообщения публичных потоков по символу и виду данных
+
+    record() вызывается из любого потока (колбэки pybit) и только кладет сообщение
+    в очередь; разбор, упаковка в записи и сжатие идут в фоновом потоке пачками раз
+    в flush_interval. При переполнении очереди (диск не успевает) сообщения
+    отбрасываются и учитываются в dropped.
+    """
+
+    def __init__(self, root: Optional[str] = None, rotate_bytes: Optional[int] = None,
+                 flush_interval: Optional[float] = None, max_pending: int = 1_000_000,
+                 compresslevel: int = 1):
+        self.config = Config()
+        self.root = root or self.config.RECORDER_DIR
+        self.rotate_bytes = rotate_bytes or self.config.RECORDER_ROTATE_MB * 1024 * 1024
+        self.flush_interval = flush_interval or self.config.RECORDER_FLUSH_INTERVAL
+        self.max_pending = max_pending
+        self.compresslevel = compresslevel
+        self.logger = logging.getLogger(__name__)
+
+        self.written = 0
+        self.dropped = 0
+        # deque.append потокобезопасен и не берет блокировку очереди, как queue.Queue
+        self._pending = deque()
+        self._files: Dict[Tuple[str, str], RecordFile] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="market-recorder", daemon=True)
+        self._thread.start()
+        self.logger.info(f"Запись рыночных данных в {self.root}")
+
+    def stop(self):
+        """Дописывает очередь и закрывает файлы"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def record(self, kind: str, symbol: str, message: Dict):
+        """Ставит сообщение потока в очередь записи (kind: trade, ticker, kline, book)"""
+        if len(self._pending) >= self.max_pending:
+            self.dropped += 1
+            return
+        if kind == "ticker":
+            # pybit отдает тикер поверх своей копии, которую изменит следующая дельта
+            message = {"ts": message.get("ts"), "data": dict(message.get("data") or {})}
+        self._pending.append((kind, symbol, time.time_ns() // 1000, message))
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self._drain()
+        self._drain()
+        for file in self._files.values():
+            file.close()
+        self._files.clear()
+
+    def _drain(self):
+        rows: Dict[Tuple[str, str, str], List[Tuple]] = defaultdict(list)
+        pending = self._pending
+        for _ in range(len(pending)):
+            kind, symbol, recv, message = pending.popleft()
+            try:
+                rows[(symbol, kind, _stream(kind, message))].extend(_decode(kind, recv, message))
+            except (KeyError, TypeError, ValueError) as e:
+                self.logger.error(f"Ошибка разбора сообщения {kind} {symbol}: {e}")
+        for (symbol, kind, stream), batch in rows.items():
+            try:
+                self._write(symbol, stream, np.array(batch, dtype=RECORDS[kind]))
+            except OSError as e:
+                self.dropped += len(batch)
+                self.logger.error(f"Ошибка записи {stream} {symbol}: {e}")
+
+    def _write(self, symbol: str, stream: str, records: np.ndarray):
+        key = (symbol, stream)
+        file = self._files.get(key)
+        if file is not None and file.size >= self.rotate_bytes:
+            file.close()
+            file = None
+        if file is None:
+            directory = os.path.join(self.root, symbol, stream)
+            os.makedirs(directory, exist_ok=True)
+            name = time.strftime("%Y%m%d-%H%M%S", time.gmtime()) + f"-{time.time_ns() % 1_000_000_000:09d}"
+            file = self._files[key] = RecordFile(os.path.join(directory, name + FILE_SUFFIX),
+                                                 records.dtype, self.compresslevel)
+        file.write(records.tobytes())
+        file.flush()
+        self.written += len(records)
+
+
+def _read_file(path: str, dtype: np.dtype) -> np.ndarray:
+    """Записи одного файла; оборванный хвост (файл пишется или процесс упал) отбрасывается"""
+    decompressor = zlib.decompressobj(wbits=31)
+    chunks = []
+    with open(path, "rb") as f:
+        while True:
+            block = f.read(1 << 20)
+            if not block:
+                break
+            try:
+                chunks.append(decompressor.decompress(block))
+            except zlib.error:
+                break
+    data = b"".join(chunks)
+    if len(data) < HEADER.size:
+        return np.empty(0, dtype=dtype)
+    magic, version, itemsize = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION or itemsize != dtype.itemsize:
+        raise ValueError(f"{path}: неподдерживаемый формат записи")
+    count = (len(data) - HEADER.size) // itemsize
+    return np.frombuffer(data, dtype=dtype, count=count, offset=HEADER.size)
+
+
+def read_records(symbol: str, stream: str, root: Optional[str] = None,
+                 start: Optional[int] = None, end: Optional[int] = None) -> np.ndarray:
+    """Записи потока (trade, ticker, kline.{интервал}, book) символа по порядку записи, ts в [start, end) мс"""
+    root = root or Config.RECORDER_DIR
+    dtype = RECORDS[stream.split(".")[0]]
+    paths = sorted(glob.glob(os.path.join(root, symbol, stream, "*" + FILE_SUFFIX)))
+    parts = [_read_file(path, dtype) for path in paths]
+    records = np.concatenate(parts) if parts else np.empty(0, dtype=dtype)
+    if start is not None:
+        records = records[records["ts"] >= start]
+    if end is not None:
+        records = records[records["ts"] < end]
+    return records
+
+
+def candles_from_recording(symbol: str, interval: str, root: Optional[str] = None) -> Dict[str, np.ndarray]:
+    """Закрытые свечи из записи в формате backtest.load_candles (по возрастанию времени, без повторов)"""
+    records = read_records(symbol, f"kline.{interval}", root)
+    records = records[records["confirm"] == 1]
+    # Повтор закрытия свечи (переподключение) — берется последний
+    _, last = np.unique(records["start"][::-1], return_index=True)
+    records = records[len(records) - 1 - last]
+    return {column: np.ascontiguousarray(records[column])
+            for column in ("start", "open", "high", "low", "close", "volume", "turnover")}
+
+
+def summary(root: str):
+    """Печатает потоки записи: число записей и интервал времени"""
+    for directory in sorted(glob.glob(os.path.join(root, "*", "*"))):
+        symbol, stream = directory.split(os.sep)[-2:]
+        if stream.split(".")[0] not in RECORDS:
+            continue
+        records = read_records(symbol, stream, root)
+        files = len(glob.glob(os.path.join(directory, "*" + FILE_SUFFIX)))
+        if not len(records):
+            print(f"📼 {symbol} {stream}: пусто ({files} файлов)")
+            continue
+        first, last = (time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(ts / 1000))
+                       for ts in (records["ts"].min(), records["ts"].max()))
+        print(f"📼 {symbol} {stream}: {len(records)} записей, {files} файлов, {first} — {last} UTC")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сводка записанных рыночных данных")
+    parser.add_argument("root", nargs="?", default=Config.RECORDER_DIR, help="каталог записи")
+    args = parser.parse_args()
+    summary(args.root)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+Подбор параметров стратегии скальпинга на исторических свечах
+Сетка или случайная выборка комбинаций параметров Config прогоняется через
+Backtester на всех ядрах; свечи один раз кладутся в разделяемую память
+"""
+
+import argparse
+import csv
+import itertools
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from backtest import CANDLE_COLUMNS, Backtester, read_candles
+from batch_indicators import compute_indicators, compute_signals
+from config import Config
+
+# Пространство поиска по умолчанию: значения для каждого параметра Config
+DEFAULT_GRID = {
+    "PROFIT_TARGET": [0.001, 0.0015, 0.002, 0.003, 0.004],
+    "STOP_LOSS": [0.0005, 0.001, 0.0015, 0.002],
+    "RSI_PERIOD": [7, 14, 21],
+    "RSI_OVERBOUGHT": [65, 70, 75, 80],
+    "RSI_OVERSOLD": [20, 25, 30, 35],
+    "POSITION_TIMEOUT": [60, 120, 300, 600],
+    "SIGNAL_COOLDOWN": [0, 30, 60, 120],
+}
+
+# Параметры, от которых зависят сигналы входа (остальные влияют только на выходы)
+SIGNAL_PARAMS = ("RSI_PERIOD", "RSI_OVERBOUGHT", "RSI_OVERSOLD")
+
+# Метрики, по которым можно ранжировать; для просадки лучше меньшее значение
+RANK_KEYS = ("total_pnl", "profit_factor", "win_rate", "avg_trade", "max_drawdown")
+
+RESULT_COLUMNS = ("trades", "total_pnl", "max_drawdown", "win_rate", "profit_factor", "avg_trade", "fees")
+
+# Сколько таблиц индикаторов и сигналов держит один воркер
+CACHE_SIZE = 32
+
+_worker: Dict = {}
+
+
+def _column_views(buffer, total: int) -> Dict[str, np.ndarray]:
+    """Колонки свечей поверх общего буфера: подряд по 8 байт на значение"""
+    return {
+        column: np.ndarray(total, dtype=np.int64 if column == "start" else np.float64,
+                           buffer=buffer, offset=i * total * 8)
+        for i, column in enumerate(CANDLE_COLUMNS)
+    }
+
+
+def share_candles(candles: Dict[str, np.ndarray]) -> SharedMemory:
+    """Копирует свечи в новый блок разделяемой памяти"""
+    total = len(candles["close"])
+    shm = SharedMemory(create=True, size=max(1, total * 8 * len(CANDLE_COLUMNS)))
+    for column, view in _column_views(shm.buf, total).items():
+        view[:] = candles[column]
+    return shm
+
+
+def _init_worker(shm_name: str, total: int, fee_rate: float, slippage: float):
+    """Подключает воркер к свечам в разделяемой памяти"""
+    logging.basicConfig(level=logging.WARNING)
+    shm = SharedMemory(name=shm_name)
+    _worker.update(
+        shm=shm,
+        candles=_column_views(shm.buf, total),
+        fee_rate=fee_rate,
+        slippage=slippage,
+        indicators={},
+        signals={},
+    )
+
+
+def _cached(cache: Dict, key, compute):
+    if key not in cache:
+        if len(cache) >= CACHE_SIZE:
+            cache.pop(next(iter(cache)))
+        cache[key] = compute()
+    return cache[key]
+
+
+def make_config(params: Dict) -> Config:
+    """Config с переопределенными параметрами стратегии"""
+    config = Config()
+    for name, value in params.items():
+        setattr(config, name, value)
+    return config
+
+
+def evaluate(params: Dict) -> Dict:
+    """Бэктест одной комбинации параметров в воркере"""
+    candles = _worker["candles"]
+    config = make_config(params)
+
+    # Индикаторы зависят только от периода RSI, сигналы — еще и от уровней RSI
+    indicators = _cached(_worker["indicators"], params["RSI_PERIOD"], lambda: compute_indicators(
+        candles["close"][None, :], candles["volume"][None, :], config))
+    key = tuple(params[name] for name in SIGNAL_PARAMS)
+    signals = _cached(_worker["signals"], key, lambda: compute_signals(indicators, config)["signal"][0])
+
+    stats = Backtester(candles, config, _worker["fee_rate"], _worker["slippage"]).run(signals)
+    result = dict(params)
+    result.update({column: stats[column] for column in RESULT_COLUMNS})
+    return result
+
+
+def is_valid(params: Dict) -> bool:
+    """Отбрасывает заведомо бессмысленные комбинации"""
+    return params.get("RSI_OVERSOLD", 0) < params.get("RSI_OVERBOUGHT", 100)
+
+
+def grid_combinations(grid: Dict[str, Sequence]) -> List[Dict]:
+    """Все комбинации сетки"""
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*grid.values())]
+
+
+def random_combinations(grid: Dict[str, Sequence], samples: int, seed: Optional[int] = None) -> List[Dict]:
+    """Случайная выборка различных комбинаций сетки без ее полного перебора"""
+    names = list(grid)
+    sizes = [len(grid[name]) for name in names]
+    total = int(np.prod(sizes))
+    rng = np.random.default_rng(seed)
+    indices = rng.choice(total, size=min(samples, total), replace=False)
+
+    combinations = []
+    for index in indices:
+        params = {}
+        for name, size in zip(reversed(names), reversed(sizes)):
+            index, position = divmod(int(index), size)
+            params[name] = grid[name][position]
+        combinations.append({name: params[name] for name in names})
+    return combinations
+
+
+def rank(results: List[Dict], key: str = "total_pnl", min_trades: int = 1) -> List[Dict]:
+    """Сортирует результаты по метрике, отбрасывая прогоны с малым числом сделок"""
+    results = [result for result in results if result["trades"] >= min_trades]
+    return sorted(results, key=lambda result: result[key], reverse=key != "max_drawdown")
+
+
+def optimize(candles: Dict[str, np.ndarray], combinations: List[Dict], workers: Optional[int] = None,
+             fee_rate: float = 0.00055, slippage: float = 0.0001) -> List[Dict]:
+    """Прогоняет комбинации параметров через Backtester в пуле процессов"""
+    combinations = [params for params in combinations if is_valid(params)]
+    if not combinations:
+        return []
+    # Соседние задачи с одинаковыми параметрами сигналов попадают в один пакет и кэш воркера
+    combinations.sort(key=lambda params: tuple(params[name] for name in SIGNAL_PARAMS))
+
+    workers = workers or os.cpu_count() or 1
+    chunksize = max(1, min(64, len(combinations) // (workers * 4)))
+    total = len(candles["close"])
+
+    shm = share_candles(candles)
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(shm.name, total, fee_rate, slippage)) as pool:
+            return list(pool.map(evaluate, combinations, chunksize=chunksize))
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+def parse_param(spec: str) -> Tuple[str, List]:
+    """Разбирает NAME=v1,v2,... в имя параметра Config и список значений его типа"""
+    name, _, values = spec.partition("=")
+    name = name.strip().upper()
+    if name not in DEFAULT_GRID or not values:
+        raise argparse.ArgumentTypeError(f"ожидается NAME=v1,v2,... где NAME из {', '.join(DEFAULT_GRID)}")
+    cast = type(getattr(Config, name))
+    return name, [cast(value) for value in values.split(",") if value.strip()]
+
+
+def save_results(path: str, results: List[Dict]):
+    """Сохраняет ранжированные результаты в CSV"""
+    if not results:
+        return
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(results[0]))
+        writer.writeheader()
+        writer.writerows(results)
+
+
+def print_table(results: List[Dict], top: int):
+    """Выводит лучшие комбинации"""
+    print(f"{'#':>3}  {'P&L':>10} {'DD':>9} {'Win':>6} {'PF':>6} {'Trades':>6}  Параметры")
+    for place, result in enumerate(results[:top], 1):
+        params = " ".join(f"{name}={result[name]}" for name in DEFAULT_GRID if name in result)
+        print(f"{place:>3}  {result['total_pnl']:>10.4f} {result['max_drawdown']:>9.4f} "
+              f"{result['win_rate']:>6.1%} {result['profit_factor']:>6.2f} {result['trades']:>6}  {params}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Подбор параметров стратегии скальпинга")
+    parser.add_argument("candles", help="CSV или .npz со свечами: start,open,high,low,close,volume (или символ с --store)")
+    parser.add_argument("--store", action="store_true", help="читать свечи символа из локального хранилища")
+    parser.add_argument("--mode", choices=("grid", "random"), default="grid", help="полный перебор или случайная выборка")
+    parser.add_argument("--samples", type=int, default=1000, help="число комбинаций в режиме random")
+    parser.add_argument("--seed", type=int, default=None, help="seed случайной выборки")
+    parser.add_argument("--param", type=parse_param, action="append", default=[],
+                        help="значения параметра вместо сетки по умолчанию, например PROFIT_TARGET=0.001,0.002")
+    parser.add_argument("--workers", type=int, default=None, help="число процессов (по умолчанию все ядра)")
+    parser.add_argument("--sort", choices=RANK_KEYS, default="total_pnl", help="метрика ранжирования")
+    parser.add_argument("--min-trades", type=int, default=10, help="минимум сделок для попадания в таблицу")
+    parser.add_argument("--top", type=int, default=20, help="сколько строк вывести")
+    parser.add_argument("--output", help="CSV для полной ранжированной таблицы")
+    parser.add_argument("--fee", type=float, default=0.00055, help="комиссия taker, доля")
+    parser.add_argument("--slippage", type=float, default=0.0001, help="проскальзывание, доля")
+    args = parser.parse_args()
+
+    grid = dict(DEFAULT_GRID)
+    grid.update(args.param)
+    if args.mode == "grid":
+        combinations = grid_combinations(grid)
+    else:
+        combinations = random_combinations(grid, args.samples, args.seed)
+
+    candles = read_candles(args.candles, args.store)
+    started = time.perf_counter()
+    results = optimize(candles, combinations, args.workers, args.fee, args.slippage)
+    elapsed = time.perf_counter() - started
+
+    ranked = rank(results, args.sort, args.min_trades)
+    print(f"🔎 Комбинаций: {len(results)}, свечей: {len(candles['close'])}, время: {elapsed:.1f} с")
+    print_table(ranked, args.top)
+    if args.output:
+        save_results(args.output, ranked)
+        print(f"💾 Результаты сохранены в {args.output}")
+
+
+if __name__ == "__main__":
+    main()
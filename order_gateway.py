@@ -0,0 +1,326 @@
+"""
+Шлюз ордеров для режима с несколькими процессами: один процесс держит бюджет
+REST-запросов и приватный WebSocket, процессы стратегий обращаются к бирже через него.
+"""
+
+import asyncio
+import itertools
+import logging
+import os
+import signal
+import threading
+import time
+from collections import defaultdict
+from multiprocessing.connection import Client, Listener
+from typing import Dict, List, Optional
+
+from bybit_client import BybitClient
+from config import Config
+
+# Сколько процесс стратегий ждет ответа шлюза (шлюз мог упасть и перезапускаться)
+GATEWAY_TIMEOUT = 30.0
+# Пауза между попытками подключиться к шлюзу, секунды
+RECONNECT_DELAY = 1.0
+
+# Приватные потоки, которые шлюз раздает процессам стратегий: поток → метод получателя
+PRIVATE_STREAMS = {
+    "order": "order_stream",
+    "execution": "execution_stream",
+    "position": "position_stream",
+    "wallet": "wallet_stream",
+}
+
+
+class GatewayError(Exception):
+    """Запрос не выполнен шлюзом: ошибка биржи или шлюз недоступен"""
+
+
+class OrderGateway:
+    """Выполняет REST-запросы процессов стратегий через общий клиент и раздает им приватные потоки
+
+    Каждый процесс стратегий держит свое соединение с шлюзом (сокет Unix), поэтому
+    упавший или перезапущенный процесс ничего не блокирует у остальных. Запрос —
+    ("request", id, метод pybit, параметры), ответ — ("reply", id, ответ, ошибка).
+    Приоритеты и лимиты endpoint соблюдает планировщик клиента, поэтому бюджет запросов
+    один на все процессы. Сообщения order, execution и position направляются процессу,
+    который ведет символ, wallet — всем.
+    """
+
+    def __init__(self, address: str, authkey: bytes, owners: Dict[str, int], market=None, slot: int = 0):
+        self.config = Config()
+        self.client = BybitClient.shared()
+        self.address = address
+        self.authkey = authkey
+        self.owners = owners
+        # Соединение процесса стратегий по номеру и блокировка записи в него
+        self.connections: Dict[int, tuple] = {}
+        # Heartbeat для супервизора (SharedMarket и номер ячейки)
+        self.market = market
+        self.slot = slot
+        self.running = False
+        self._loop = None
+        self.logger = logging.getLogger(__name__)
+
+    async def run(self):
+        self._loop = asyncio.get_running_loop()
+        self._loop.add_signal_handler(signal.SIGTERM, self.stop)
+        self.running = True
+        if self.config.USE_PRIVATE_WS:
+            self._subscribe_private()
+        # Сокет прошлого экземпляра шлюза остается на диске
+        if os.path.exists(self.address):
+            os.unlink(self.address)
+        listener = Listener(self.address, authkey=self.authkey)
+        threading.Thread(target=self._accept, args=(listener,), name="gateway-accept", daemon=True).start()
+        self.logger.info(f"Шлюз ордеров запущен: {self.address}")
+        try:
+            while self.running:
+                if self.market is not None:
+                    self.market.beat(self.slot)
+                await asyncio.sleep(1)
+        finally:
+            listener.close()
+            self.client.close_connection()
+
+    def stop(self):
+        self.running = False
+
+    def _subscribe_private(self):
+        """Подписывается на приватные потоки; при (пере)подключении процессы стратегий сверяют позиции"""
+        self.client._on_private_open = self._on_private_open
+        try:
+            ws = self.client.private_ws
+            for kind, method in PRIVATE_STREAMS.items():
+                getattr(ws, method)(callback=lambda message, kind=kind: self._route(kind, message))
+        except Exception as e:
+            self.logger.error(f"Ошибка при подписке шлюза на приватные потоки: {e}")
+
+    def _on_private_open(self):
+        for worker in list(self.connections):
+            self._send(worker, ("resync",))
+
+    def _route(self, kind: str, message: Dict):
+        """Раздает сообщение приватного потока (вызывается из потока WebSocket)"""
+        items = message.get("data", [])
+        if kind == "wallet":
+            for worker in list(self.connections):
+                self._send(worker, ("private", kind, items))
+            return
+        routed = defaultdict(list)
+        for item in items:
+            worker = self.owners.get(item.get("symbol"))
+            if worker is not None:
+                routed[worker].append(item)
+        for worker, batch in routed.items():
+            self._send(worker, ("private", kind, batch))
+
+    def _send(self, worker: int, message: tuple):
+        entry = self.connections.get(worker)
+        if entry is None:
+            return
+        connection, lock = entry
+        try:
+            with lock:
+                connection.send(message)
+        except (OSError, EOFError) as e:
+            self.logger.warning(f"Процесс стратегий {worker} недоступен: {e}")
+
+    def _accept(self, listener: Listener):
+        while self.running:
+            try:
+                connection = listener.accept()
+                _, worker = connection.recv()
+            except Exception as e:
+                if self.running:
+                    self.logger.error(f"Ошибка при подключении процесса стратегий: {e}")
+                continue
+            # Перезапущенный процесс заменяет соединение прежнего экземпляра
+            self.connections[worker] = (connection, threading.Lock())
+            threading.Thread(target=self._read, args=(worker, connection), name=f"gateway-worker{worker}",
+                             daemon=True).start()
+            self.logger.info(f"Процесс стратегий {worker} подключен")
+
+    def _read(self, worker: int, connection):
+        while True:
+            try:
+                message = connection.recv()
+            except (OSError, EOFError):
+                break
+            self._loop.call_soon_threadsafe(
+                lambda message=message: asyncio.ensure_future(self._serve(worker, connection, *message[1:])))
+        entry = self.connections.get(worker)
+        if entry is not None and entry[0] is connection:
+            del self.connections[worker]
+        connection.close()
+
+    async def _serve(self, worker: int, connection, request_id, method: str, params: Dict):
+        if method.startswith("_") or not hasattr(self.client.session, method):
+            response, error = None, f"Неизвестный метод {method}"
+        else:
+            try:
+                response, error = await self.client._request(method, **params), None
+            except Exception as e:
+                response, error = None, f"{type(e).__name__}: {e}"
+        # Ответ нужен только тому экземпляру процесса, который спрашивал
+        entry = self.connections.get(worker)
+        if entry is not None and entry[0] is connection:
+            self._send(worker, ("reply", request_id, response, error))
+
+
+class GatewayClient(BybitClient):
+    """BybitClient процесса стратегий: REST-запросы и приватные потоки идут через шлюз ордеров
+
+    Все методы клиента работают как есть, потому что обращаются к бирже через _request.
+    Рыночные данные процесс стратегий берет из общей памяти, публичный WebSocket не открывается.
+    При обрыве соединения ожидающие запросы завершаются ошибкой, а клиент переподключается.
+    """
+
+    def __init__(self, worker: int, address: str, authkey: bytes):
+        super().__init__()
+        self.worker = worker
+        self.address = address
+        self.authkey = authkey
+        self._ids = itertools.count()
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._connection = None
+        self._connected = threading.Event()
+        self._closed = threading.Event()
+        self._loop = None
+        self._reader: Optional[threading.Thread] = None
+
+    def _start_reader(self):
+        if self._reader is None:
+            self._loop = asyncio.get_running_loop()
+            self._reader = threading.Thread(target=self._read, name="gateway-client", daemon=True)
+            self._reader.start()
+
+    async def _request(self, method: str, **params) -> Dict:
+        self._start_reader()
+        if not self._connected.is_set():
+            await asyncio.to_thread(self._connected.wait, GATEWAY_TIMEOUT)
+        connection = self._connection
+        if connection is None:
+            raise GatewayError(f"Шлюз недоступен для {method}")
+        request_id = next(self._ids)
+        future = self._pending[request_id] = self._loop.create_future()
+        try:
+            connection.send(("request", request_id, method, params))
+            return await asyncio.wait_for(future, GATEWAY_TIMEOUT)
+        except (OSError, EOFError) as e:
+            raise GatewayError(f"Шлюз недоступен для {method}: {e}")
+        except asyncio.TimeoutError:
+            raise GatewayError(f"Шлюз не ответил на {method} за {GATEWAY_TIMEOUT:.0f} с")
+        finally:
+            self._pending.pop(request_id, None)
+
+    def _read(self):
+        """Подключается к шлюзу и читает ответы и приватные потоки, переподключаясь при обрыве"""
+        while not self._closed.is_set():
+            try:
+                connection = Client(self.address, authkey=self.authkey)
+                connection.send(("hello", self.worker))
+            except (OSError, EOFError):
+                time.sleep(RECONNECT_DELAY)
+                continue
+            self._connection = connection
+            self._connected.set()
+            # Пока соединения не было, приватные обновления могли потеряться
+            self._loop.call_soon_threadsafe(self._resync)
+            while True:
+                try:
+                    message = connection.recv()
+                except (OSError, EOFError):
+                    break
+                self._dispatch(message)
+            self._connected.clear()
+            self._connection = None
+            connection.close()
+            if not self._closed.is_set():
+                self.logger.warning("Соединение со шлюзом ордеров потеряно, переподключение")
+                self._loop.call_soon_threadsafe(self._fail_pending)
+
+    def _dispatch(self, message: tuple):
+        kind = message[0]
+        if kind == "reply":
+            self._loop.call_soon_threadsafe(self._resolve, *message[1:])
+        elif kind == "private":
+            self._private(message[1], message[2])
+        elif kind == "resync":
+            self._loop.call_soon_threadsafe(self._resync)
+
+    def _resync(self):
+        if self.positions.streaming:
+            asyncio.ensure_future(self.sync_account())
+
+    def _resolve(self, request_id: int, response: Optional[Dict], error: Optional[str]):
+        # Ответ после таймаута просто отбрасывается
+        future = self._pending.get(request_id)
+        if future is None or future.done():
+            return
+        if error is not None:
+            future.set_exception(GatewayError(error))
+        else:
+            future.set_result(response)
+
+    def _fail_pending(self):
+        for future in self._pending.values():
+            if not future.done():
+                future.set_exception(GatewayError("Соединение со шлюзом ордеров потеряно"))
+
+    def _private(self, kind: str, items: List[Dict]):
+        """Сообщение приватного потока от шлюза — тем же обработчикам, что и из WebSocket"""
+        message = {"data": items}
+        if kind == "order" and self.orders.streaming:
+            self.orders.on_order(message)
+        elif kind == "execution" and self.orders.streaming:
+            self.orders.on_execution(message)
+        elif kind == "position" and self.positions.streaming:
+            self.positions.on_position(message)
+        elif kind == "wallet" and self.positions.streaming:
+            self.positions.on_wallet(message)
+
+    def subscribe_to_order_updates(self):
+        """Исполнения ордеров приходят от шлюза"""
+        if self.orders.streaming:
+            return
+        self._start_reader()
+        self.orders.attach(asyncio.get_running_loop())
+
+    def subscribe_to_account_updates(self):
+        """Позиции и кошелек приходят от шлюза; начальный снимок — через REST шлюза"""
+        if self.positions.streaming:
+            return
+        self._start_reader()
+        self.positions.attach(asyncio.get_running_loop())
+        asyncio.ensure_future(self.sync_account())
+
+    def close_connection(self):
+        # Соединение закрывается с процессом: поток чтения ждет в recv, и закрывать сокет под ним нельзя
+        self._closed.set()
+        super().close_connection()
+
+
+def run_gateway(address: str, authkey: bytes, owners: Dict[str, int], market_name: str, symbols: List[str],
+                capacity: int, processes: int, slot: int):
+    """Точка входа процесса шлюза; останавливается по SIGTERM от супервизора"""
+    from log_pipeline import setup_logging
+    from shared_market import SharedMarket
+
+    # Ctrl+C получает вся группа процессов: шлюз работает, пока процессы стратегий закрывают позиции
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    listener = setup_logging(process_config("gateway"))
+    market = SharedMarket.attach(market_name, symbols, capacity, processes)
+    try:
+        asyncio.run(OrderGateway(address, authkey, owners, market, slot).run())
+    finally:
+        market.close()
+        if listener:
+            listener.stop()
+
+
+def process_config(name: str) -> Config:
+    """Config процесса: свой файл лога рядом с основным (scalping_bot.log -> scalping_bot.gateway.log)"""
+    config = Config()
+    root, dot, extension = config.LOG_FILE.rpartition(".")
+    config.LOG_FILE = f"{root}.{name}.{extension}" if dot else f"{config.LOG_FILE}.{name}"
+    return config
@@ -0,0 +1,134 @@
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional
+
+# Конечные статусы ордера Bybit v5
+TERMINAL_STATUSES = {"Filled", "Cancelled", "PartiallyFilledCanceled", "Rejected", "Deactivated"}
+
+
+def _float(value) -> float:
+    return float(value) if value not in (None, "") else 0.0
+
+
+class OrderTracker:
+    """Состояние ордеров по orderId из приватных потоков order и execution
+
+    Сообщения могут прийти раньше ответа REST на создание ордера, поэтому
+    состояние копится для любых orderId, а ожидающие получают его по готовности.
+    Хранятся последние capacity ордеров.
+    """
+
+    def __init__(self, capacity: int = 1000):
+        self.capacity = capacity
+        self.orders: "OrderedDict[str, Dict]" = OrderedDict()
+        self.streaming = False
+        # Получают каждое обновление ордера как есть (например, срабатывание TP/SL)
+        self.listeners: List[Callable[[Dict], None]] = []
+        self._waiters: Dict[str, asyncio.Future] = {}
+        self._loop = None
+        self.logger = logging.getLogger(__name__)
+
+    def attach(self, loop: asyncio.AbstractEventLoop):
+        """Привязывает трекер к event loop, в котором ждут исполнения"""
+        self._loop = loop
+        self.streaming = True
+
+    # Колбэки pybit вызываются из потока WebSocket, данные передаются в event loop
+
+    def on_order(self, message: Dict):
+        self._loop.call_soon_threadsafe(self.apply_orders, message.get("data", []))
+
+    def on_execution(self, message: Dict):
+        self._loop.call_soon_threadsafe(self.apply_executions, message.get("data", []))
+
+    def _state(self, order_id: str) -> Dict:
+        state = self.orders.get(order_id)
+        if state is None:
+            state = self.orders[order_id] = {
+                "order_id": order_id, "status": None, "order_qty": 0.0,
+                "cum_qty": 0.0, "avg_price": 0.0, "cum_fee": 0.0, "updated_time": 0,
+                "exec_ids": set(), "exec_qty": 0.0, "exec_value": 0.0, "exec_fee": 0.0, "exec_time": 0,
+            }
+            while len(self.orders) > self.capacity:
+                self.orders.popitem(last=False)
+        return state
+
+    def apply_orders(self, orders: Iterable[Dict]):
+        """Обновления из потока order (или ответа /v5/order/realtime)"""
+        for order in orders:
+            state = self._state(order["orderId"])
+            state.update(
+                symbol=order.get("symbol"),
+                side=order.get("side"),
+                status=order.get("orderStatus"),
+                order_qty=_float(order.get("qty")),
+                cum_qty=_float(order.get("cumExecQty")),
+                avg_price=_float(order.get("avgPrice")),
+                cum_fee=_float(order.get("cumExecFee")),
+                updated_time=int(order.get("updatedTime") or 0),
+            )
+            self._check(state)
+            for listener in self.listeners:
+                try:
+                    listener(order)
+                except Exception as e:
+                    self.logger.error(f"Ошибка обработчика обновления ордера: {e}")
+
+    def apply_executions(self, executions: Iterable[Dict]):
+        """Сделки из потока execution; повторы по execId отбрасываются"""
+        for execution in executions:
+            if execution.get("execType", "Trade") != "Trade":
+                continue
+            state = self._state(execution["orderId"])
+            exec_id = execution.get("execId")
+            if exec_id in state["exec_ids"]:
+                continue
+            state["exec_ids"].add(exec_id)
+            qty = _float(execution.get("execQty"))
+            state["symbol"] = execution.get("symbol")
+            state["side"] = execution.get("side")
+            state["order_qty"] = state["order_qty"] or _float(execution.get("orderQty"))
+            state["exec_qty"] += qty
+            state["exec_value"] += qty * _float(execution.get("execPrice"))
+            state["exec_fee"] += _float(execution.get("execFee"))
+            state["exec_time"] = max(state["exec_time"], int(execution.get("execTime") or 0))
+            self._check(state)
+
+    @staticmethod
+    def is_done(state: Dict) -> bool:
+        """Ордер в конечном статусе или сделки покрыли весь объем"""
+        return state["status"] in TERMINAL_STATUSES or \
+            bool(state["order_qty"]) and state["exec_qty"] >= state["order_qty"] - 1e-12
+
+    def fill(self, order_id: str) -> Optional[Dict]:
+        """Итог исполнения: объем, средняя цена, комиссия и время (мс) или None, пока ордер активен"""
+        state = self.orders.get(order_id)
+        if state is None or not self.is_done(state):
+            return None
+        if state["status"] in TERMINAL_STATUSES:
+            qty, price, fee = state["cum_qty"], state["avg_price"], state["cum_fee"]
+            time_ms = state["exec_time"] or state["updated_time"]
+        else:
+            qty, fee, time_ms = state["exec_qty"], state["exec_fee"], state["exec_time"]
+            price = state["exec_value"] / qty if qty else 0.0
+        return {"order_id": order_id, "symbol": state.get("symbol"), "side": state.get("side"),
+                "status": state["status"] or "Filled", "qty": qty, "avg_price": price, "fee": fee, "time": time_ms}
+
+    def _check(self, state: Dict):
+        waiter = self._waiters.get(state["order_id"])
+        if waiter is not None and not waiter.done() and self.is_done(state):
+            waiter.set_result(self.fill(state["order_id"]))
+
+    async def wait_fill(self, order_id: str, timeout: float) -> Optional[Dict]:
+        """Ждет исполнения ордера из потока; None, если оно не пришло за timeout"""
+        fill = self.fill(order_id)
+        if fill is not None or not self.streaming:
+            return fill
+        waiter = self._waiters[order_id] = asyncio.get_running_loop().create_future()
+        try:
+            return await asyncio.wait_for(waiter, timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            self._waiters.pop(order_id, None)
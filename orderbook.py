@@ -0,0 +1,235 @@
+import logging
+from bisect import bisect_left, bisect_right
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Сколько дельт копится, пока ждем снимок после разрыва; дальше старые отбрасываются
+MAX_PENDING = 1000
+
+
+class BookSide:
+    """Одна сторона стакана: уровни в отсортированных массивах цен и объемов
+
+    Цены хранятся по возрастанию, поэтому поиск уровня — бинарный, а вставка и
+    удаление — сдвиг короткого массива. Лучшая цена у покупок в конце, у продаж в начале.
+    """
+
+    def __init__(self, bids: bool):
+        self.bids = bids
+        self.prices: List[float] = []
+        self.sizes: List[float] = []
+
+    def __len__(self) -> int:
+        return len(self.prices)
+
+    def load(self, levels: Iterable[Iterable[str]]):
+        """Заменяет сторону уровнями снимка [[цена, объем], ...]"""
+        book = sorted((float(price), float(size)) for price, size in levels if float(size) > 0)
+        self.prices = [price for price, _ in book]
+        self.sizes = [size for _, size in book]
+
+    def set(self, price: float, size: float):
+        """Обновляет уровень; нулевой объем удаляет его"""
+        index = bisect_left(self.prices, price)
+        exists = index < len(self.prices) and self.prices[index] == price
+        if size > 0:
+            if exists:
+                self.sizes[index] = size
+            else:
+                self.prices.insert(index, price)
+                self.sizes.insert(index, size)
+        elif exists:
+            del self.prices[index]
+            del self.sizes[index]
+
+    def trim(self, depth: int):
+        """Оставляет depth лучших уровней: уровни за глубиной подписки биржа не обновляет"""
+        if len(self.prices) <= depth:
+            return
+        if self.bids:
+            del self.prices[:-depth], self.sizes[:-depth]
+        else:
+            del self.prices[depth:], self.sizes[depth:]
+
+    def best(self) -> Optional[Tuple[float, float]]:
+        """Лучший уровень (цена, объем)"""
+        if not self.prices:
+            return None
+        index = -1 if self.bids else 0
+        return self.prices[index], self.sizes[index]
+
+    def top(self, levels: int) -> Tuple[List[float], List[float]]:
+        """levels лучших уровней, от лучшего к худшему"""
+        if self.bids:
+            return self.prices[:-levels - 1:-1], self.sizes[:-levels - 1:-1]
+        return self.prices[:levels], self.sizes[:levels]
+
+    def depth(self, levels: int) -> float:
+        """Суммарный объем levels лучших уровней"""
+        return sum(self.sizes[-levels:] if self.bids else self.sizes[:levels])
+
+    def volume_to(self, price: float) -> float:
+        """Объем от лучшей цены до price включительно"""
+        if self.bids:
+            return sum(self.sizes[bisect_left(self.prices, price):])
+        return sum(self.sizes[:bisect_right(self.prices, price)])
+
+
+class OrderBook:
+    """Локальный стакан L2 одного символа из потока orderbook.{depth}.{symbol}
+
+    Поток присылает снимок и затем дельты с последовательным updateId (u). Разрыв
+    последовательности делает стакан невалидным: дельты копятся, пока не придет
+    снимок (REST или повторный снимок потока), после чего применяются продолжающие его.
+    u у каждой глубины свой (REST идет по стакану 500 уровней), поэтому снимок REST
+    упорядочивается с дельтами потока по общему для всех глубин seq.
+    """
+
+    def __init__(self, symbol: str, depth: int = 50):
+        self.symbol = symbol
+        self.depth = depth
+        self.bids = BookSide(bids=True)
+        self.asks = BookSide(bids=False)
+        self.update_id = 0
+        self.seq = 0
+        self.ready = False
+        self.gaps = 0
+        self._pending: List[Dict] = []
+        self.logger = logging.getLogger(__name__)
+
+    def apply(self, data: Dict, snapshot: bool = False) -> bool:
+        """Применяет сообщение потока; False — последовательность разорвана и нужен снимок"""
+        update_id = int(data.get("u", 0))
+        # u=1 — биржа перезапустила сервис стакана и прислала снимок вместо дельты
+        if snapshot or update_id == 1:
+            self._load(data)
+            return True
+        if not self.ready:
+            self._pending.append(data)
+            del self._pending[:-MAX_PENDING]
+            return True
+        if not self.update_id:
+            # После снимка REST u потока еще неизвестен: первая дельта новее снимка задает его
+            if int(data.get("seq", 0)) > self.seq:
+                self._delta(data)
+            return True
+        if update_id <= self.update_id:
+            return True
+        if update_id != self.update_id + 1:
+            self.ready = False
+            self.gaps += 1
+            self._pending = [data]
+            self.logger.warning(f"Разрыв стакана {self.symbol}: u {self.update_id} -> {update_id}")
+            return False
+        self._delta(data)
+        return True
+
+    def load_snapshot(self, data: Dict) -> bool:
+        """Снимок REST /v5/market/orderbook; дельты потока новее его по seq применяются сверху
+        
+        Снимок годится, только если он не старше первой накопленной дельты: пропущенные
+        перед ней дельты должны в него войти. u снимка с u потока не сравнивается.
+        """
+        seq = int(data.get("seq", 0))
+        if self._pending and seq < int(self._pending[0].get("seq", 0)):
+            # Снимок старше разрыва: ждем следующий
+            return False
+        pending, self._pending = self._pending, []
+        self._load(data)
+        self.update_id = 0
+        previous = None
+        for delta in pending:
+            update_id = int(delta.get("u", 0))
+            if not self.update_id and int(delta.get("seq", 0)) <= self.seq:
+                # Дельта уже вошла в снимок
+                previous = update_id
+                continue
+            expected = self.update_id or previous
+            if expected is not None:
+                if update_id <= expected:
+                    continue
+                if update_id != expected + 1:
+                    # Разрыв среди накопленных дельт: нужен снимок новее
+                    self.ready = False
+                    self._pending = [delta]
+                    return False
+            self._delta(delta)
+        return True
+
+    def _load(self, data: Dict):
+        self.bids.load(data.get("b", []))
+        self.asks.load(data.get("a", []))
+        self.bids.trim(self.depth)
+        self.asks.trim(self.depth)
+        self.update_id = int(data.get("u", 0))
+        self.seq = int(data.get("seq", 0))
+        self.ready = True
+
+    def _delta(self, data: Dict):
+        for price, size in data.get("b", []):
+            self.bids.set(float(price), float(size))
+        for price, size in data.get("a", []):
+            self.asks.set(float(price), float(size))
+        self.bids.trim(self.depth)
+        self.asks.trim(self.depth)
+        self.update_id = int(data["u"])
+        self.seq = int(data.get("seq", self.seq))
+
+    # Запросы для стратегии
+
+    def best_bid(self) -> Optional[float]:
+        best = self.bids.best()
+        return best[0] if best else None
+
+    def best_ask(self) -> Optional[float]:
+        best = self.asks.best()
+        return best[0] if best else None
+
+    def mid(self) -> Optional[float]:
+        bid, ask = self.bids.best(), self.asks.best()
+        return (bid[0] + ask[0]) / 2 if bid and ask else None
+
+    def spread(self) -> Optional[float]:
+        bid, ask = self.bids.best(), self.asks.best()
+        return ask[0] - bid[0] if bid and ask else None
+
+    def spread_bps(self) -> Optional[float]:
+        """Спред в базисных пунктах от средней цены"""
+        spread, mid = self.spread(), self.mid()
+        return spread / mid * 10000 if mid else None
+
+    def imbalance(self, levels: int = 5) -> float:
+        """Перекос объема levels лучших уровней: +1 — только покупки, -1 — только продажи"""
+        bid, ask = self.bids.depth(levels), self.asks.depth(levels)
+        return (bid - ask) / (bid + ask) if bid + ask else 0.0
+
+    def microprice(self) -> Optional[float]:
+        """Средняя цена, взвешенная объемами лучших уровней: смещена к стороне с меньшим объемом"""
+        bid, ask = self.bids.best(), self.asks.best()
+        if not bid or not ask:
+            return None
+        return (bid[0] * ask[1] + ask[0] * bid[1]) / (bid[1] + ask[1])
+
+    def depth_within(self, side: str, bps: float) -> float:
+        """Объем на стороне side ("Buy" — покупки, "Sell" — продажи) в пределах bps от лучшей цены"""
+        if side == "Buy":
+            best = self.best_bid()
+            return self.bids.volume_to(best * (1 - bps / 10000)) if best else 0.0
+        best = self.best_ask()
+        return self.asks.volume_to(best * (1 + bps / 10000)) if best else 0.0
+
+    def queue_ahead(self, side: str, price: float) -> float:
+        """Объем своей стороны, стоящий впереди лимитного ордера side по цене price"""
+        if side == "Buy":
+            return self.bids.volume_to(price)
+        return self.asks.volume_to(price)
+
+    def features(self, levels: int = 5) -> Dict:
+        """Признаки микроструктуры для сигналов и статуса"""
+        return {
+            "best_bid": self.best_bid(),
+            "best_ask": self.best_ask(),
+            "spread_bps": self.spread_bps(),
+            "imbalance": self.imbalance(levels),
+            "microprice": self.microprice(),
+            "update_id": self.update_id,
+        }
@@ -0,0 +1,110 @@
+import asyncio
+import logging
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional
+
+
+def _float(value) -> float:
+    return float(value) if value not in (None, "") else 0.0
+
+
+class PositionBook:
+    """Позиции бота и состояние счета на бирже
+
+    Позиции бота (входы) хранятся по orderId входа с индексом по символу, поэтому
+    добавление и удаление — O(1). Нетто-позиции биржи и кошелек обновляются приватными
+    потоками position и wallet; снимок REST берется только при (пере)подключении потока.
+    """
+
+    def __init__(self):
+        self.entries: Dict[str, Dict] = {}
+        self.by_symbol: Dict[str, Dict[str, Dict]] = defaultdict(dict)
+        # Нетто-позиция биржи по символу: знаковый размер, средняя цена, P&L
+        self.exchange: Dict[str, Dict] = {}
+        self.wallet: Dict = {}
+        self.streaming = False
+        self._loop = None
+        self.logger = logging.getLogger(__name__)
+
+    # Позиции бота
+
+    def add(self, entry: Dict):
+        self.entries[entry['order_id']] = entry
+        self.by_symbol[entry['symbol']][entry['order_id']] = entry
+
+    def remove(self, order_id: str) -> Optional[Dict]:
+        entry = self.entries.pop(order_id, None)
+        if entry is not None:
+            self.by_symbol[entry['symbol']].pop(order_id, None)
+        return entry
+
+    def symbol_entries(self, symbol: str) -> Dict[str, Dict]:
+        """Живой словарь позиций символа по orderId (в порядке открытия)"""
+        return self.by_symbol[symbol]
+
+    # Состояние биржи
+
+    def attach(self, loop: asyncio.AbstractEventLoop):
+        """Привязывает книгу к event loop, в котором применяются обновления потоков"""
+        self._loop = loop
+        self.streaming = True
+
+    # Колбэки pybit вызываются из потока WebSocket, данные передаются в event loop
+
+    def on_position(self, message: Dict):
+        self._loop.call_soon_threadsafe(self.apply_positions, message.get("data", []))
+
+    def on_wallet(self, message: Dict):
+        self._loop.call_soon_threadsafe(self.apply_wallet, message.get("data", []))
+
+    def apply_positions(self, positions: Iterable[Dict], snapshot: bool = False):
+        """Обновления потока position или ответ /v5/position/list; устаревшие по updatedTime пропускаются"""
+        for position in positions:
+            symbol = position.get("symbol")
+            updated = int(position.get("updatedTime") or 0)
+            current = self.exchange.get(symbol)
+            if current is not None and updated and updated < current["updated_time"]:
+                continue
+            size = _float(position.get("size"))
+            self.exchange[symbol] = {
+                "symbol": symbol,
+                "size": size if position.get("side") != "Sell" else -size,
+                # В потоке средняя цена приходит как entryPrice, в REST — как avgPrice
+                "avg_price": _float(position.get("avgPrice") or position.get("entryPrice")),
+                "mark_price": _float(position.get("markPrice")),
+                "unrealised_pnl": _float(position.get("unrealisedPnl")),
+                "updated_time": updated,
+            }
+            stale = self.reconcile(symbol, trim=snapshot)
+            if stale:
+                self.logger.warning(f"Позиции {symbol} закрыты вне бота: {[entry['order_id'] for entry in stale]}")
+
+    def apply_wallet(self, accounts: Iterable[Dict]):
+        """Обновления потока wallet или ответ /v5/account/wallet-balance"""
+        for account in accounts:
+            if account.get("accountType", "UNIFIED") == "UNIFIED":
+                self.wallet = account
+
+    def reconcile(self, symbol: str, trim: bool = False) -> List[Dict]:
+        """Убирает позиции бота, которых уже нет на бирже, и возвращает их
+
+        Нулевая или встречная нетто-позиция закрывает все входы символа. С trim
+        (снимок после переподключения, когда сообщения могли потеряться) лишний объем
+        снимается со старых входов. Входы, исполненные позже состояния биржи (снимок REST
+        запрошен до исполнения), не трогаются.
+        """
+        entries = self.by_symbol[symbol]
+        if not entries or symbol not in self.exchange:
+            return []
+        net, updated = self.exchange[symbol]["size"], self.exchange[symbol]["updated_time"]
+        held = sum(float(entry['size']) for entry in entries.values())
+        stale = []
+        for order_id, entry in list(entries.items()):
+            direction = 1 if entry['side'] == "Buy" else -1
+            if net * direction > 0 and not (trim and held > abs(net) + 1e-12):
+                continue
+            if updated and (entry.get('fill_time') or 0) > updated:
+                continue
+            held -= float(entry['size'])
+            stale.append(self.remove(order_id))
+        return stale
@@ -0,0 +1,156 @@
+import asyncio
+import itertools
+import time
+from typing import Dict, List, Optional, Tuple
+
+# Приоритеты запросов в планировщике: меньше — раньше
+PRIORITY_TRADE = 0    # создание и отмена ордеров
+PRIORITY_ACCOUNT = 1  # состояние ордеров, позиции, баланс
+PRIORITY_MARKET = 2   # рыночные данные
+
+# Дольше этого не ждем сброса окна лимита, даже если биржа (или расхождение часов) просит больше
+MAX_LIMIT_WAIT = 5.0
+# Длина окна лимита endpoint, пока ответ биржи не сообщил время сброса, секунды
+LIMIT_WINDOW = 1.0
+
+
+class TokenBucket:
+    """Асинхронный токен-бакет: общий бюджет запросов для всех корутин event loop"""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, tokens: float = 1.0) -> float:
+        """Через сколько секунд в бюджете будут токены (0 — уже есть)"""
+        self._refill()
+        return max(0.0, (tokens - self.tokens) / self.rate)
+
+    async def acquire(self, tokens: float = 1.0):
+        """Ждет, пока в бюджете появятся токены, и списывает их"""
+        while True:
+            self._refill()
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return
+            await asyncio.sleep((tokens - self.tokens) / self.rate)
+
+
+class RequestScheduler:
+    """Очередь REST-запросов с приоритетами поверх общего токен-бакета
+
+    Кроме общего бюджета учитываются лимиты endpoint из заголовков X-Bapi-Limit-*:
+    остаток окна уменьшается локально при каждой отправке и уточняется ответом биржи.
+    Запросы, которые не срочны, не тратят последние reserve запросов окна, а
+    исчерпанный endpoint ждет сброса окна, не задерживая запросы к другим endpoint.
+    """
+
+    def __init__(self, rate: float, burst: Optional[float] = None, reserve: int = 1):
+        self.bucket = TokenBucket(rate, burst)
+        self.reserve = reserve
+        # endpoint → (остаток запросов в окне, время сброса окна по time.monotonic, размер окна)
+        self.limits: Dict[str, Tuple[int, float, int]] = {}
+        self.rate_limited = 0
+        self._queue: List[Tuple[int, int, str, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._arrived: Optional[asyncio.Event] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+
+    def _endpoint_wait(self, endpoint: str, priority: int) -> float:
+        """Сколько ждать сброса окна endpoint (0 — можно отправлять)"""
+        limit = self.limits.get(endpoint)
+        if limit is None:
+            return 0.0
+        remaining, reset_at, capacity = limit
+        wait = reset_at - time.monotonic()
+        if wait <= 0:
+            # Новое окно: полный лимит, иначе очередь после сброса уходит разом и снова упирается в лимит
+            self.limits[endpoint] = (capacity, time.monotonic() + LIMIT_WINDOW, capacity)
+            return 0.0 if capacity > 0 else LIMIT_WINDOW
+        floor = 0 if priority == PRIORITY_TRADE else self.reserve
+        return 0.0 if remaining > floor else min(wait, MAX_LIMIT_WAIT)
+
+    def _take(self, endpoint: str):
+        self.bucket.tokens -= 1
+        limit = self.limits.get(endpoint)
+        if limit is not None:
+            self.limits[endpoint] = (limit[0] - 1, limit[1], limit[2])
+
+    async def acquire(self, endpoint: str, priority: int = PRIORITY_MARKET):
+        """Ждет своей очереди на отправку запроса к endpoint"""
+        if not self._queue and not self.bucket.wait_time() and not self._endpoint_wait(endpoint, priority):
+            self._take(endpoint)
+            return
+        future = asyncio.get_running_loop().create_future()
+        self._queue.append((priority, next(self._seq), endpoint, future))
+        if self._dispatcher is None or self._dispatcher.done():
+            self._arrived = asyncio.Event()
+            self._dispatcher = asyncio.create_task(self._dispatch())
+        self._arrived.set()
+        await future
+
+    async def _dispatch(self):
+        """Выдает очередь по приоритету, пропуская endpoint, исчерпавшие окно"""
+        while self._queue:
+            self._arrived.clear()
+            wait = self.bucket.wait_time()
+            if not wait:
+                wait = self._release()
+            if wait is None:
+                continue
+            # Новый запрос (возможно, к свободному endpoint) прерывает ожидание
+            try:
+                await asyncio.wait_for(self._arrived.wait(), wait)
+            except asyncio.TimeoutError:
+                pass
+
+    def _release(self) -> Optional[float]:
+        """Отпускает первый запрос, который можно отправить; иначе — время до ближайшего сброса окна"""
+        # Отмененные ожидания (таймаут вызывающего) просто выбрасываются
+        self._queue = [entry for entry in self._queue if not entry[3].done()]
+        waits = []
+        for entry in sorted(self._queue):
+            priority, _, endpoint, future = entry
+            wait = self._endpoint_wait(endpoint, priority)
+            if wait:
+                waits.append(wait)
+                continue
+            self._queue.remove(entry)
+            self._take(endpoint)
+            future.set_result(None)
+            return None
+        return min(waits) if waits else None
+
+    def update(self, endpoint: str, headers) -> Optional[float]:
+        """Уточняет остаток окна endpoint по заголовкам ответа; возвращает время до сброса окна"""
+        remaining = headers.get("X-Bapi-Limit-Status") if headers else None
+        reset_ms = headers.get("X-Bapi-Limit-Reset-Timestamp") if headers else None
+        if remaining is None or reset_ms is None:
+            return None
+        capacity = int(headers.get("X-Bapi-Limit") or remaining)
+        # Время сброса приходит по часам биржи, ожидание ограничено на случай их расхождения
+        wait = min(max(0.0, int(reset_ms) / 1000 - time.time()), MAX_LIMIT_WAIT)
+        remaining, reset_at = int(remaining), time.monotonic() + wait
+        # Ответ мог обогнать запросы, отправленные после него: в том же окне локальный остаток точнее
+        current = self.limits.get(endpoint)
+        if current is not None and abs(current[1] - reset_at) < 0.5:
+            remaining = min(remaining, current[0])
+        self.limits[endpoint] = (remaining, reset_at, capacity)
+        return wait
+
+    def throttled(self, endpoint: str, headers) -> float:
+        """Биржа отклонила запрос по лимиту (10006): endpoint ждет сброса окна; возвращает ожидание"""
+        self.rate_limited += 1
+        wait = self.update(endpoint, headers)
+        if wait is None:
+            wait = LIMIT_WINDOW
+        capacity = self.limits[endpoint][2] if endpoint in self.limits else 1
+        self.limits[endpoint] = (0, time.monotonic() + wait, capacity)
+        return wait
@@ -0,0 +1,236 @@
+"""
+Свечи старших интервалов (3, 5, 15, 60 минут...) из свечей базового интервала или
+из сделок без запросов к бирже: история агрегируется векторно, живые обновления — за O(1).
+"""
+
+from collections import deque
+from typing import Dict, Iterable, List, Mapping, Optional
+
+import numpy as np
+
+from decoding import KLINE_DTYPE, to_candles
+from kline_cache import interval_to_ms
+
+
+def resample_ms(interval: str, base_interval: Optional[str] = None) -> int:
+    """Длительность старшего интервала (мс); он должен делиться на базовый и быть выровнен по эпохе"""
+    interval_ms = interval_to_ms(interval)
+    # Недельные свечи Bybit начинаются с понедельника, а месячные разной длины
+    if interval_ms is None or interval == "W":
+        raise ValueError(f"Интервал {interval} не поддерживается ресэмплером")
+    if base_interval is not None:
+        base_ms = interval_to_ms(base_interval)
+        if base_ms is None or interval_ms <= base_ms or interval_ms % base_ms:
+            raise ValueError(f"Интервал {interval} не кратен базовому {base_interval}")
+    return interval_ms
+
+
+def _merge(bar: Optional[Dict], candle: Dict, start: int) -> Dict:
+    """Свеча интервала start: bar, продолженная более поздней базовой свечой candle"""
+    if bar is None:
+        return dict(candle, start=start, confirm=False)
+    return {
+        "start": start,
+        "open": bar["open"],
+        "high": max(bar["high"], candle["high"]),
+        "low": min(bar["low"], candle["low"]),
+        "close": candle["close"],
+        "volume": bar["volume"] + candle["volume"],
+        "turnover": bar["turnover"] + candle["turnover"],
+        "confirm": False,
+    }
+
+
+def resample(candles: Mapping[str, np.ndarray], interval_ms: int, base_ms: int) -> np.ndarray:
+    """Свечи базового интервала (массив KLINE_DTYPE или колонки CandleStore, по возрастанию)
+    в свечи interval_ms; последняя закрыта, только если закрыта и заканчивает интервал ее последняя базовая
+    """
+    starts = np.asarray(candles["start"], dtype=np.int64)
+    if not len(starts):
+        return np.empty(0, dtype=KLINE_DTYPE)
+    buckets = starts - starts % interval_ms
+    first = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    last = np.r_[first[1:] - 1, len(starts) - 1]
+
+    bars = np.empty(len(first), dtype=KLINE_DTYPE)
+    bars["start"] = buckets[first]
+    bars["open"] = np.asarray(candles["open"])[first]
+    bars["high"] = np.maximum.reduceat(candles["high"], first)
+    bars["low"] = np.minimum.reduceat(candles["low"], first)
+    bars["close"] = np.asarray(candles["close"])[last]
+    bars["volume"] = np.add.reduceat(candles["volume"], first)
+    bars["turnover"] = np.add.reduceat(candles["turnover"], first)
+    bars["confirm"] = True
+    # У колонок хранилища нет confirm: там только закрытые свечи
+    names = candles.dtype.names if isinstance(candles, np.ndarray) else tuple(candles)
+    closed = bool(candles["confirm"][-1]) if "confirm" in names else True
+    bars["confirm"][-1] = closed and starts[-1] + base_ms == buckets[-1] + interval_ms
+    return bars
+
+
+def resample_trades(ts: np.ndarray, price: np.ndarray, size: np.ndarray, interval_ms: int,
+                    now_ms: Optional[int] = None) -> np.ndarray:
+    """Сделки (по возрастанию времени, мс) в свечи interval_ms; последняя закрыта, если now_ms прошел ее конец"""
+    ts = np.asarray(ts, dtype=np.int64)
+    if not len(ts):
+        return np.empty(0, dtype=KLINE_DTYPE)
+    price = np.asarray(price, dtype=np.float64)
+    size = np.asarray(size, dtype=np.float64)
+    buckets = ts - ts % interval_ms
+    first = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    last = np.r_[first[1:] - 1, len(ts) - 1]
+
+    bars = np.empty(len(first), dtype=KLINE_DTYPE)
+    bars["start"] = buckets[first]
+    bars["open"] = price[first]
+    bars["high"] = np.maximum.reduceat(price, first)
+    bars["low"] = np.minimum.reduceat(price, first)
+    bars["close"] = price[last]
+    bars["volume"] = np.add.reduceat(size, first)
+    bars["turnover"] = np.add.reduceat(price * size, first)
+    bars["confirm"] = True
+    bars["confirm"][-1] = now_ms is not None and now_ms >= buckets[-1] + interval_ms
+    return bars
+
+
+class TimeframeBuilder:
+    """Свечи одного старшего интервала: закрытые в буфере и формирующаяся текущая
+
+    Текущая свеча — агрегат закрытых базовых свечей ее интервала плюс последняя
+    незакрытая базовая, поэтому повторные обновления формирующейся базовой свечи
+    не накапливают объем. Builder питается либо базовыми свечами, либо сделками.
+    """
+
+    def __init__(self, interval: str, base_interval: str, maxlen: int = 200):
+        self.interval = interval
+        self.interval_ms = resample_ms(interval, base_interval)
+        self.base_ms = interval_to_ms(base_interval)
+        # Закрытые свечи по возрастанию времени
+        self.bars = deque(maxlen=maxlen)
+        self.current: Optional[Dict] = None
+        self._closed: Optional[Dict] = None
+        self._forming: Optional[Dict] = None
+        # Начало последней учтенной закрытой базовой свечи: ее повтор не добавляет объем
+        self._confirmed_start: Optional[int] = None
+
+    def seed(self, candles: Mapping[str, np.ndarray]):
+        """Заполняет буфер историей базовых свечей (по возрастанию) векторно"""
+        self.bars.clear()
+        self.current = self._closed = self._forming = self._confirmed_start = None
+        count = len(candles["start"])
+        if not count:
+            return
+        names = candles.dtype.names if isinstance(candles, np.ndarray) else tuple(candles)
+        forming = "confirm" in names and not candles["confirm"][-1]
+        # Незакрытая базовая свеча досчитывается через update, чтобы ее обновления не копились
+        closed = {name: candles[name][:count - 1] for name in names} if forming else candles
+        bars = to_candles(resample(closed, self.interval_ms, self.base_ms))
+        if bars and not bars[-1]["confirm"]:
+            self.current = self._closed = bars.pop()
+        self.bars.extend(bars)
+        if len(closed["start"]):
+            self._confirmed_start = int(closed["start"][-1])
+        if forming:
+            self.update({name: candles[name][-1].item() for name in names})
+
+    def update(self, candle: Dict) -> Optional[Dict]:
+        """Учитывает базовую свечу (закрытую или формирующуюся); возвращает свечу, которую она закрыла"""
+        start = candle["start"] - candle["start"] % self.interval_ms
+        if self.bars and start <= self.bars[-1]["start"]:
+            # Повтор уже закрытого интервала (переподключение)
+            return None
+        if self._confirmed_start is not None and candle["start"] <= self._confirmed_start:
+            # Повтор уже учтенной закрытой базовой свечи
+            return None
+        closed = None
+        if self.current is not None and start > self.current["start"]:
+            # Пришел новый интервал, а конец прошлого пропущен: закрываем тем, что есть
+            closed = self._close()
+        if self.current is None:
+            self._closed = self._forming = None
+        if self._forming is not None and candle["start"] > self._forming["start"]:
+            # Закрытие прошлой базовой свечи не пришло — учитываем ее последнее состояние
+            self._closed = _merge(self._closed, self._forming, start)
+            self._confirmed_start = self._forming["start"]
+        self._forming = None
+        if candle["confirm"]:
+            self._closed = _merge(self._closed, candle, start)
+            self.current = dict(self._closed)
+            self._confirmed_start = candle["start"]
+        else:
+            self._forming = candle
+            self.current = _merge(self._closed, candle, start)
+        if candle["confirm"] and candle["start"] + self.base_ms == start + self.interval_ms:
+            closed = self._close()
+        return closed
+
+    def update_trade(self, ts: int, price: float, size: float) -> Optional[Dict]:
+        """Учитывает сделку; возвращает свечу, закрытую сделкой следующего интервала"""
+        start = ts - ts % self.interval_ms
+        if self.bars and start <= self.bars[-1]["start"]:
+            return None
+        closed = None
+        if self.current is not None and start > self.current["start"]:
+            closed = self._close()
+        bar = self.current
+        if bar is None:
+            self.current = {"start": start, "open": price, "high": price, "low": price, "close": price,
+                            "volume": size, "turnover": price * size, "confirm": False}
+            return closed
+        bar["high"] = max(bar["high"], price)
+        bar["low"] = min(bar["low"], price)
+        bar["close"] = price
+        bar["volume"] += size
+        bar["turnover"] += price * size
+        return closed
+
+    def close_due(self, now_ms: int) -> Optional[Dict]:
+        """Закрывает текущую свечу, если ее интервал истек (сделок следующего интервала еще не было)"""
+        if self.current is not None and now_ms >= self.current["start"] + self.interval_ms:
+            return self._close()
+        return None
+
+    def _close(self) -> Dict:
+        bar = self.current
+        bar["confirm"] = True
+        self.bars.append(bar)
+        self.current = self._closed = self._forming = None
+        return bar
+
+    def candles(self) -> List[Dict]:
+        """Свечи по возрастанию времени; последняя может формироваться (как MarketDataFeed.get_kline_data)"""
+        candles = list(self.bars)
+        if self.current is not None:
+            candles.append(self.current)
+        return candles
+
+
+class Resampler:
+    """Старшие интервалы одного символа из общего потока базовых свечей или сделок"""
+
+    def __init__(self, intervals: Iterable[str], base_interval: str, maxlen: int = 200):
+        self.frames = {interval: TimeframeBuilder(interval, base_interval, maxlen) for interval in intervals}
+
+    def seed(self, candles: Mapping[str, np.ndarray]):
+        for frame in self.frames.values():
+            frame.seed(candles)
+
+    def update(self, candle: Dict) -> Dict[str, Dict]:
+        """Обновляет все интервалы базовой свечой; возвращает закрытые ею свечи по интервалу"""
+        closed = {}
+        for interval, frame in self.frames.items():
+            bar = frame.update(candle)
+            if bar is not None:
+                closed[interval] = bar
+        return closed
+
+    def update_trade(self, ts: int, price: float, size: float) -> Dict[str, Dict]:
+        closed = {}
+        for interval, frame in self.frames.items():
+            bar = frame.update_trade(ts, price, size)
+            if bar is not None:
+                closed[interval] = bar
+        return closed
+
+    def candles(self, interval: str) -> List[Dict]:
+        return self.frames[interval].candles()
@@ -1,25 +1,70 @@
 import asyncio
 import logging
+import time
 import numpy as np
 import pandas as pd
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, List, Mapping, Optional, Sequence, Tuple, Union
 from datetime import datetime, timedelta
-from bybit_client import BybitClient
+from bybit_client import BybitClient, round_to_tick
 from config import Config
+from decoding import as_klines, columns
+from indicators import IndicatorEngine
+from latency import recorder
+from market_data import interval_to_ms
+from signal_graph import BOOK, Rule, SignalGraph, SignalPipeline
+
+# Причины выхода из позиции
+EXIT_TAKE_PROFIT = "take_profit"
+EXIT_STOP_LOSS = "stop_loss"
+EXIT_TIMEOUT = "timeout"
+
+# Типы условных ордеров выхода, которые биржа создает по TP/SL ордера входа
+EXIT_ORDER_TYPES = {
+    "TakeProfit": EXIT_TAKE_PROFIT,
+    "PartialTakeProfit": EXIT_TAKE_PROFIT,
+    "StopLoss": EXIT_STOP_LOSS,
+    "PartialStopLoss": EXIT_STOP_LOSS,
+}
+# Ордер TP/SL создается при исполнении входа; допуск на расхождение времени исполнения и создания, мс
+EXIT_ORDER_CLOCK_SKEW_MS = 1000
 
 class ScalpingStrategy:
-    def __init__(self):
-        self.config = Config()
-        self.client = BybitClient()
+    def __init__(self, client: Optional[BybitClient] = None, symbol: Optional[str] = None,
+                 config: Optional[Config] = None):
+        self.config = config or Config()
+        # Без явного клиента — общий клиент процесса (соединения, бюджет запросов, книга позиций)
+        self.client = client or BybitClient.shared()
+        self.symbol = symbol or self.config.SYMBOL
         self.logger = logging.getLogger(__name__)
         
-        # Состояние стратегии
-        self.active_positions = []
+        # Состояние стратегии: позиции символа по orderId входа в книге позиций клиента
+        # (книга общая для символов клиента и сверяется с биржей приватными потоками)
+        self.book = self.client.positions
+        self.positions = self.book.symbol_entries(self.symbol)
+        # Ожидающие срабатывания ордера TP/SL на бирже по orderId
+        self.exit_orders: Dict[str, Dict] = {}
+        # Ордера входа, исполнение которых не подтвердилось ни потоком, ни REST: orderId → параметры входа
+        self.pending_entries: Dict[str, Dict] = {}
         self.last_signal_time = None
-        self.signal_cooldown = 60  # 60 секунд между сигналами
+        # Последние анализ и цена — для API статуса без запросов к бирже
+        self.last_analysis = None
+        self.last_price = None
+        self.signal_cooldown = self.config.SIGNAL_COOLDOWN  # секунд между сигналами
+        
+        # Источник времени; бэктест подменяет его симулированными часами
+        self.clock = datetime.now
+        
+        # Инкрементальные индикаторы для потока данных
+        self.indicator_engine = IndicatorEngine(self.config)
+        self.interval_ms = interval_to_ms(self.config.CANDLE_INTERVAL)
+        
+        # Граф индикаторов символа (общий для стратегий символа) и правила сигнала поверх него
+        self.graph = SignalGraph.shared(self.symbol)
+        self.nodes = self.define_indicators(self.graph)
+        self.pipeline = self.build_pipeline()
         
     def calculate_rsi(self, prices: List[float], period: int = 14) -> float:
-        """Вычисляет RSI индикатор"""
+        """Вычисляет RSI индикатор (сглаживание Уайлдера)"""
         if len(prices) < period + 1:
             return 50.0
         
@@ -30,6 +75,11 @@ class ScalpingStrategy:
         avg_gains = np.mean(gains[:period])
         avg_losses = np.mean(losses[:period])
         
+        # Сглаживаем оставшиеся изменения
+        for gain, loss in zip(gains[period:], losses[period:]):
+            avg_gains = (avg_gains * (period - 1) + gain) / period
+            avg_losses = (avg_losses * (period - 1) + loss) / period
+        
         if avg_losses == 0:
             return 100.0
         
@@ -56,24 +106,30 @@ class ScalpingStrategy:
         if len(prices) < slow:
             return 0.0, 0.0, 0.0
         
-        # Быстрая EMA
-        ema_fast = self.calculate_ema(prices, fast)
-        
-        # Медленная EMA
-        ema_slow = self.calculate_ema(prices, slow)
-        
-        # MACD линия
-        macd_line = ema_fast - ema_slow
+        # Ряд MACD: разность быстрой и медленной EMA на каждой свече
+        macd_values = self.calculate_ema_series(prices, fast) - self.calculate_ema_series(prices, slow)
+        macd_line = macd_values[-1]
         
         # Сигнальная линия (EMA от MACD)
-        macd_values = [macd_line]
-        signal_line = self.calculate_ema(macd_values, signal)
+        signal_line = self.calculate_ema(list(macd_values), signal)
         
         # Гистограмма
         histogram = macd_line - signal_line
         
         return macd_line, signal_line, histogram
     
+    def calculate_ema_series(self, prices: List[float], period: int) -> np.ndarray:
+        """Вычисляет ряд EMA, инициализированный первой ценой"""
+        multiplier = 2 / (period + 1)
+        series = np.empty(len(prices))
+        ema = prices[0]
+        
+        for i, price in enumerate(prices):
+            ema = (price * multiplier) + (ema * (1 - multiplier))
+            series[i] = ema
+        
+        return series
+    
     def calculate_ema(self, prices: List[float], period: int) -> float:
         """Вычисляет экспоненциальную скользящую среднюю"""
         if len(prices) < period:
@@ -87,176 +143,386 @@ class ScalpingStrategy:
         
         return ema
     
-    def analyze_market(self, kline_data: List[Dict]) -> Dict:
-        """Анализирует рыночные данные и возвращает сигналы"""
-        if not kline_data or len(kline_data) < 50:
+    def analyze_market(self, kline_data: Union[np.ndarray, Sequence], book: Optional[Dict] = None) -> Dict:
+        """Анализирует свечи в любом формате decoding.as_klines (строки REST, словари, массив)"""
+        if kline_data is None or len(kline_data) < 50:
+            return {"signal": "HOLD", "strength": 0, "reason": "Недостаточно данных"}
+        
+        return self.analyze_window(columns(as_klines(kline_data)), book)
+    
+    def analyze_window(self, window: Dict[str, np.ndarray], book: Optional[Dict] = None) -> Dict:
+        """Анализирует окно свечей по колонкам из кэша свечей BybitClient"""
+        if not window or len(window["close"]) < 50:
             return {"signal": "HOLD", "strength": 0, "reason": "Недостаточно данных"}
         
-        # Извлекаем цены закрытия
-        close_prices = [float(candle['close']) for candle in kline_data]
-        high_prices = [float(candle['high']) for candle in kline_data]
-        low_prices = [float(candle['low']) for candle in kline_data]
-        volumes = [float(candle['volume']) for candle in kline_data]
-        
-        # Вычисляем индикаторы
-        rsi = self.calculate_rsi(close_prices, self.config.RSI_PERIOD)
-        upper_bb, middle_bb, lower_bb = self.calculate_bollinger_bands(close_prices)
-        macd_line, signal_line, histogram = self.calculate_macd(close_prices)
-        
-        # Текущая цена
-        current_price = close_prices[-1]
-        
-        # Анализ сигналов
-        signals = []
-        signal_strength = 0
-        
-        # RSI сигналы
-        if rsi < self.config.RSI_OVERSOLD:
-            signals.append(f"RSI перепродан ({rsi:.2f})")
-            signal_strength += 2
-        elif rsi > self.config.RSI_OVERBOUGHT:
-            signals.append(f"RSI перекуплен ({rsi:.2f})")
-            signal_strength -= 2
-        
-        # Полосы Боллинджера
-        if current_price < lower_bb:
-            signals.append(f"Цена ниже нижней полосы Боллинджера")
-            signal_strength += 1
-        elif current_price > upper_bb:
-            signals.append(f"Цена выше верхней полосы Боллинджера")
-            signal_strength -= 1
-        
-        # MACD сигналы
-        if macd_line > signal_line and histogram > 0:
-            signals.append("MACD выше сигнальной линии")
-            signal_strength += 1
-        elif macd_line < signal_line and histogram < 0:
-            signals.append("MACD ниже сигнальной линии")
-            signal_strength -= 1
-        
-        # Анализ объема
-        avg_volume = np.mean(volumes[-20:])
-        current_volume = volumes[-1]
-        if current_volume > avg_volume * 1.5:
-            signals.append("Повышенный объем")
-            signal_strength += 0.5
-        
-        # Определение сигнала
-        if signal_strength >= 2:
-            signal = "BUY"
-        elif signal_strength <= -2:
-            signal = "SELL"
+        return self.analyze_prices(window["close"], window["volume"], book, window.get("start"))
+    
+    def analyze_prices(self, close_prices: Sequence[float], volumes: Sequence[float],
+                       book: Optional[Dict] = None, starts: Optional[Sequence[int]] = None) -> Dict:
+        """Сигнал по ценам закрытия и объемам (от старых к новым); индикаторы считаются по мере надобности
+        
+        starts — время начала свечей окна: по нему стратегии символа узнают то же окно.
+        Без него значения считаются заново при каждом вызове.
+        """
+        close_prices = np.asarray(close_prices, dtype=np.float64)
+        volumes = np.asarray(volumes, dtype=np.float64)
+        # Стратегии символа с тем же окном получают значения, посчитанные первой из них:
+        # окно задают первая и последняя свеча, формирующаяся меняет close и volume
+        if starts is not None and len(starts):
+            bar = (int(starts[0]), int(starts[-1]), close_prices[-1], volumes[-1])
         else:
-            signal = "HOLD"
+            bar = object()
+        self.graph.bind(bar, close=close_prices, volume=volumes)
+        return self.evaluate_signals(self.graph, book)
+    
+    def define_indicators(self, graph: SignalGraph) -> Dict[str, str]:
+        """Объявляет индикаторы стратегии в графе символа; возвращает их имена по роли
+        
+        Входы графа — ряды close и volume окна свечей. EMA объявлены отдельными узлами,
+        чтобы их ряды делили MACD и любые новые правила на тех же периодах.
+        """
+        config = self.config
+        fast, slow, signal = 12, 26, 9
+        
+        def macd(close, fast_ema, slow_ema):
+            if len(close) < slow:
+                return 0.0, 0.0, 0.0
+            macd_values = fast_ema - slow_ema
+            signal_line = self.calculate_ema(list(macd_values), signal)
+            return macd_values[-1], signal_line, macd_values[-1] - signal_line
+        
+        fast_ema = graph.define(f"ema({fast})", lambda close: self.calculate_ema_series(close, fast), "close")
+        slow_ema = graph.define(f"ema({slow})", lambda close: self.calculate_ema_series(close, slow), "close")
+        return {
+            "price": graph.define("price", lambda close: close[-1], "close"),
+            "volume": graph.define("last_volume", lambda volume: volume[-1], "volume"),
+            "volume_avg": graph.define(f"volume_avg({IndicatorEngine.VOLUME_PERIOD})",
+                                       lambda volume: np.mean(volume[-IndicatorEngine.VOLUME_PERIOD:]), "volume"),
+            "rsi": graph.define(f"rsi({config.RSI_PERIOD})",
+                                lambda close: self.calculate_rsi(close, config.RSI_PERIOD), "close"),
+            "bollinger": graph.define("bollinger(20,2)", self.calculate_bollinger_bands, "close"),
+            "macd": graph.define(f"macd({fast},{slow},{signal})", macd, "close", fast_ema, slow_ema),
+        }
+    
+    def build_pipeline(self) -> SignalPipeline:
+        """Правила сигнала от дешевых к дорогим: стакан и объем, Боллинджер, RSI, MACD"""
+        config, nodes = self.config, self.nodes
+        
+        def imbalance(book):
+            value = book["imbalance"]
+            if value >= config.IMBALANCE_THRESHOLD:
+                return 1, f"Перевес покупок в стакане ({value:.2f})"
+            if value <= -config.IMBALANCE_THRESHOLD:
+                return -1, f"Перевес продаж в стакане ({value:.2f})"
+            return None
+        
+        def volume(current, average):
+            return (1, "Повышенный объем") if current > average * 1.5 else None
+        
+        def bollinger(price, bands):
+            upper, _, lower = bands
+            if price < lower:
+                return 1, "Цена ниже нижней полосы Боллинджера"
+            if price > upper:
+                return -1, "Цена выше верхней полосы Боллинджера"
+            return None
+        
+        def rsi(value):
+            if value < config.RSI_OVERSOLD:
+                return 1, f"RSI перепродан ({value:.2f})"
+            if value > config.RSI_OVERBOUGHT:
+                return -1, f"RSI перекуплен ({value:.2f})"
+            return None
+        
+        def macd(values):
+            line, signal, histogram = values
+            if line > signal and histogram > 0:
+                return 1, "MACD выше сигнальной линии"
+            if line < signal and histogram < 0:
+                return -1, "MACD ниже сигнальной линии"
+            return None
+        
+        def spread(book):
+            # На широком спреде вход съедает заметную часть цели по прибыли
+            spread_bps = book["spread_bps"] if book is not None else None
+            if spread_bps is not None and spread_bps > config.MAX_SPREAD_BPS:
+                return f"Широкий спред ({spread_bps:.1f} bps), вход отложен"
+            return None
+        
+        return SignalPipeline([
+            Rule("imbalance", 1, (BOOK,), imbalance),
+            Rule("volume", 0.5, (nodes["volume"], nodes["volume_avg"]), volume),
+            Rule("bollinger", 1, (nodes["price"], nodes["bollinger"]), bollinger),
+            Rule("rsi", 2, (nodes["rsi"],), rsi),
+            Rule("macd", 1, (nodes["macd"],), macd),
+        ], threshold=2, veto=spread)
+    
+    def evaluate_signals(self, indicators: Mapping, book: Optional[Dict] = None) -> Dict:
+        """Формирует торговый сигнал по индикаторам (граф символа или словарь по именам узлов)
+        и признакам стакана (OrderBook.features)"""
+        analysis = self.pipeline.evaluate(indicators, book)
+        analysis["indicators"] = indicators.scalars() if isinstance(indicators, SignalGraph) else indicators
+        if book is not None:
+            analysis["orderbook"] = book
+        return analysis
+    
+    def analyze_stream(self, candles: Sequence[Dict], book: Optional[Dict] = None) -> Dict:
+        """Анализирует живой буфер свечей через инкрементальный движок индикаторов"""
+        engine = self.indicator_engine
+        
+        # Свечи, еще не учтенные движком (от новых к старым)
+        pending = []
+        for candle in reversed(candles):
+            if engine.last_start is not None and candle['start'] <= engine.last_start:
+                break
+            pending.append(candle)
+        
+        # Разрыв между состоянием движка и буфером — пересчитываем по всему буферу
+        if (engine.last_start is not None and pending and self.interval_ms and
+                pending[-1]['start'] - engine.last_start > self.interval_ms):
+            engine.reset()
+            pending = list(reversed(candles))
+        
+        forming = None
+        for candle in reversed(pending):
+            if candle['confirm']:
+                engine.update(candle['close'], candle['volume'], candle['start'])
+            else:
+                forming = candle
+        
+        if forming is not None:
+            indicators = engine.preview(forming['close'], forming['volume'])
+        else:
+            indicators = engine.snapshot
         
+        if indicators is None or indicators["candles"] < 50:
+            return {"signal": "HOLD", "strength": 0, "reason": "Недостаточно данных"}
+        
+        return self.evaluate_signals(self.stream_values(indicators), book)
+    
+    def stream_values(self, snapshot: Dict) -> Dict:
+        """Снимок IndicatorEngine по именам узлов графа (движок считает все индикаторы за O(1))"""
+        nodes = self.nodes
+        bands, macd = snapshot["bollinger_bands"], snapshot["macd"]
         return {
-            "signal": signal,
-            "strength": abs(signal_strength),
-            "reason": "; ".join(signals) if signals else "Нет четких сигналов",
-            "indicators": {
-                "rsi": rsi,
-                "bollinger_bands": {"upper": upper_bb, "middle": middle_bb, "lower": lower_bb},
-                "macd": {"line": macd_line, "signal": signal_line, "histogram": histogram},
-                "current_price": current_price
-            }
+            nodes["price"]: snapshot["current_price"],
+            nodes["volume"]: snapshot["volume"]["current"],
+            nodes["volume_avg"]: snapshot["volume"]["average"],
+            nodes["rsi"]: snapshot["rsi"],
+            nodes["bollinger"]: (bands["upper"], bands["middle"], bands["lower"]),
+            nodes["macd"]: (macd["line"], macd["signal"], macd["histogram"]),
+            "candles": snapshot["candles"],
         }
     
-    async def should_open_position(self, symbol: str) -> Tuple[bool, str]:
-        """Определяет, следует ли открывать позицию"""
+    async def should_open_position(self, symbol: str, kline_data: Optional[List[Dict]] = None,
+                                   orderbook=None) -> Tuple[bool, str]:
+        """Определяет, следует ли открывать позицию (свечи и стакан можно передать из потока данных)"""
+        can_open, reason = self.can_open_position()
+        if not can_open:
+            return False, reason
+        
+        # Стакан после разрыва последовательности не используется до нового снимка
+        book = orderbook.features(self.config.ORDERBOOK_LEVELS) if orderbook is not None and orderbook.ready else None
+        
+        if kline_data is not None:
+            # Живой буфер из потока данных — инкрементальный расчет
+            with recorder.measure("analyze"):
+                analysis = self.analyze_stream(kline_data, book)
+        else:
+            # Окно свечей из кэша клиента: догружаются только новые свечи
+            window = await self.client.get_kline_window(
+                symbol, 
+                self.config.CANDLE_INTERVAL, 
+                100
+            )
+            
+            if not window:
+                return False, "Не удалось получить данные свечей"
+            
+            # Анализируем рынок
+            with recorder.measure("analyze"):
+                analysis = self.analyze_window(window, book)
+        
+        self.last_analysis = analysis
+        
+        if analysis["signal"] in ["BUY", "SELL"] and analysis["strength"] >= 2:
+            self.last_signal_time = self.clock()
+            return True, f"{analysis['signal']}: {analysis['reason']}"
+        
+        return False, f"Нет сигнала: {analysis['reason']}"
+    
+    def can_open_position(self) -> Tuple[bool, str]:
+        """Проверяет лимит позиций и кулдаун между сигналами"""
         # Проверяем количество активных позиций
-        if len(self.active_positions) >= self.config.MAX_POSITIONS:
+        if len(self.positions) + len(self.pending_entries) >= self.config.MAX_POSITIONS:
             return False, "Достигнут лимит позиций"
         
         # Проверяем кулдаун между сигналами
         if (self.last_signal_time and 
-            datetime.now() - self.last_signal_time < timedelta(seconds=self.signal_cooldown)):
+            self.clock() - self.last_signal_time < timedelta(seconds=self.signal_cooldown)):
             return False, "Кулдаун между сигналами"
         
-        # Получаем данные свечей
-        kline_data = await self.client.get_kline_data(
-            symbol, 
-            self.config.CANDLE_INTERVAL, 
-            100
-        )
+        return True, ""
+    
+    async def should_close_position(self, position: Dict, current_price: float) -> Tuple[bool, str]:
+        """Определяет, следует ли закрыть позицию"""
+        return self.check_exit(position, current_price)
+    
+    def check_exit(self, position: Dict, current_price: float) -> Tuple[bool, str]:
+        """Проверяет условия выхода из позиции: take profit, stop loss, timeout"""
+        if float(position['size']) == 0:
+            return False, "Позиция уже закрыта"
         
-        if not kline_data:
-            return False, "Не удалось получить данные свечей"
+        reason, pnl_percent = self.exit_reason(position, current_price)
         
-        # Анализируем рынок
-        analysis = self.analyze_market(kline_data)
+        if position.get('exchange_tpsl') and reason in (EXIT_TAKE_PROFIT, EXIT_STOP_LOSS):
+            # Уровни стоят на бирже: закрытие придет исполнением условного ордера
+            return False, f"P&L: {pnl_percent:.4f}, выход на бирже"
         
-        if analysis["signal"] in ["BUY", "SELL"] and analysis["strength"] >= 2:
-            self.last_signal_time = datetime.now()
-            return True, f"{analysis['signal']}: {analysis['reason']}"
+        if reason == EXIT_TAKE_PROFIT:
+            return True, f"Take Profit достигнут: {pnl_percent:.4f}"
+        if reason == EXIT_STOP_LOSS:
+            return True, f"Stop Loss достигнут: {pnl_percent:.4f}"
+        if reason == EXIT_TIMEOUT:
+            return True, f"Timeout позиции: {self.config.POSITION_TIMEOUT} секунд"
         
-        return False, f"Нет сигнала: {analysis['reason']}"
+        return False, f"P&L: {pnl_percent:.4f}"
     
-    async def should_close_position(self, position: Dict, current_price: float) -> Tuple[bool, str]:
-        """Определяет, следует ли закрыть позицию"""
+    def exit_reason(self, position: Dict, current_price: float) -> Tuple[Optional[str], float]:
+        """Возвращает код причины выхода (или None) и текущий P&L в долях"""
         entry_price = float(position['entry_price'])
-        side = position['side']
-        size = float(position['size'])
-        
-        if size == 0:
-            return False, "Позиция уже закрыта"
         
         # Вычисляем P&L
-        if side == "Buy":
+        if position['side'] == "Buy":
             pnl_percent = (current_price - entry_price) / entry_price
         else:
             pnl_percent = (entry_price - current_price) / entry_price
         
         # Проверяем take profit
         if pnl_percent >= self.config.PROFIT_TARGET:
-            return True, f"Take Profit достигнут: {pnl_percent:.4f}"
+            return EXIT_TAKE_PROFIT, pnl_percent
         
         # Проверяем stop loss
         if pnl_percent <= -self.config.STOP_LOSS:
-            return True, f"Stop Loss достигнут: {pnl_percent:.4f}"
+            return EXIT_STOP_LOSS, pnl_percent
         
         # Проверяем timeout
         if 'open_time' in position:
             open_time = datetime.fromisoformat(position['open_time'].replace('Z', '+00:00'))
-            if datetime.now() - open_time > timedelta(seconds=self.config.POSITION_TIMEOUT):
-                return True, f"Timeout позиции: {self.config.POSITION_TIMEOUT} секунд"
+            if self.clock() - open_time > timedelta(seconds=self.config.POSITION_TIMEOUT):
+                return EXIT_TIMEOUT, pnl_percent
         
-        return False, f"P&L: {pnl_percent:.4f}"
+        return None, pnl_percent
+    
+    async def exit_levels(self, symbol: str, side: str) -> Tuple[Optional[float], Optional[float]]:
+        """Уровни take profit и stop loss от последней цены, округленные до шага цены"""
+        # Без приватного потока бот не узнает о срабатывании уровней на бирже
+        if not self.config.EXCHANGE_TPSL or not self.client.orders.streaming or not self.last_price:
+            return None, None
+        tick = await self.client.get_tick_size(symbol)
+        if not tick:
+            return None, None
+        direction = 1 if side == "Buy" else -1
+        take_profit = self.last_price * (1 + direction * self.config.PROFIT_TARGET)
+        stop_loss = self.last_price * (1 - direction * self.config.STOP_LOSS)
+        return round_to_tick(take_profit, tick), round_to_tick(stop_loss, tick)
     
     async def execute_trade(self, symbol: str, side: str, quantity: float) -> bool:
         """Выполняет торговую операцию"""
         try:
-            # Размещаем ордер
-            order = await self.client.place_order(
-                symbol=symbol,
-                side=side,
-                quantity=quantity,
-                order_type="Market"
-            )
+            take_profit, stop_loss = await self.exit_levels(symbol, side)
             
-            if order and 'result' in order:
-                # Добавляем позицию в активные
-                position_info = {
-                    'symbol': symbol,
-                    'side': side,
-                    'size': quantity,
-                    'entry_price': await self.client.get_market_price(symbol),
-                    'open_time': datetime.now().isoformat(),
-                    'order_id': order['result']['order_id']
-                }
-                
-                self.active_positions.append(position_info)
-                self.logger.info(f"Позиция открыта: {position_info}")
-                return True
+            # Размещаем ордер; выходы по TP/SL срабатывают на бирже без опроса
+            with recorder.measure("place_order"):
+                order = await self.client.place_order(
+                    symbol=symbol,
+                    side=side,
+                    quantity=quantity,
+                    order_type="Market",
+                    take_profit=take_profit,
+                    stop_loss=stop_loss
+                )
             
-            return False
+            order_id = order.get('result', {}).get('orderId') if order else None
+            if not order_id:
+                return False
+            
+            # Цена входа, комиссия и время — из исполнения ордера (приватный поток)
+            entry = {'symbol': symbol, 'side': side, 'take_profit': take_profit, 'stop_loss': stop_loss,
+                     'checked': time.monotonic()}
+            with recorder.measure("fill"):
+                fill = await self.client.wait_for_fill(symbol, order_id)
+            if fill is None:
+                # Ордер мог исполниться: позиция добавится по исполнению из потока или по повторной проверке
+                self.pending_entries[order_id] = entry
+                self.logger.warning(f"Исполнение ордера {order_id} не подтверждено, ордер ожидает проверки")
+                if self.book.streaming:
+                    asyncio.ensure_future(self.client.sync_account())
+                return False
+            if not fill['qty']:
+                self.logger.error(f"Ордер {order_id} не исполнен: {fill}")
+                return False
+            
+            self.add_position(order_id, entry, fill)
+            return True
             
         except Exception as e:
             self.logger.error(f"Ошибка при выполнении торговой операции: {e}")
             return False
     
+    def add_position(self, order_id: str, entry: Dict, fill: Dict):
+        """Добавляет исполненный вход в книгу позиций"""
+        # Таймаут считается по локальным часам, время исполнения на бирже сохраняется отдельно
+        position_info = {
+            'symbol': entry['symbol'],
+            'side': entry['side'],
+            'size': fill['qty'],
+            'entry_price': fill['avg_price'],
+            'entry_fee': fill['fee'],
+            'open_time': self.clock().isoformat(),
+            'fill_time': fill['time'],
+            'order_id': order_id,
+            'exchange_tpsl': bool(entry['take_profit'] and entry['stop_loss']),
+            'take_profit': entry['take_profit'],
+            'stop_loss': entry['stop_loss']
+        }
+        
+        self.book.add(position_info)
+        # Ордера TP/SL входа могли прийти из потока раньше его исполнения
+        self.bind_exit_orders(position_info)
+        self.logger.info("Позиция открыта: %s", position_info)
+    
+    async def resolve_pending_entries(self):
+        """Добавляет позиции по входам с неподтвержденным исполнением, когда оно становится известно
+        
+        Исполнение берется из трекера ордеров (поток); без него состояние ордера
+        запрашивается через REST не чаще раза в FILL_TIMEOUT.
+        """
+        for order_id, entry in list(self.pending_entries.items()):
+            fill = self.client.orders.fill(order_id)
+            if fill is None and time.monotonic() - entry['checked'] >= self.config.FILL_TIMEOUT:
+                entry['checked'] = time.monotonic()
+                order = await self.client.get_order(entry['symbol'], order_id)
+                if order:
+                    self.client.orders.apply_orders([order])
+                fill = self.client.orders.fill(order_id)
+            if fill is None:
+                continue
+            del self.pending_entries[order_id]
+            if fill['qty']:
+                self.add_position(order_id, entry, fill)
+            else:
+                self.logger.info(f"Ордер {order_id} завершен без исполнения: {fill['status']}")
+    
     async def close_position_by_id(self, position: Dict) -> bool:
         """Закрывает конкретную позицию"""
         try:
+            # Условные ордера выхода этой позиции иначе закрыли бы чужой объем
+            exit_orders = self.exit_orders_of(position)
+            if exit_orders:
+                await asyncio.gather(*(self.client.cancel_order(position['symbol'], order_id)
+                                       for order_id in exit_orders))
+            
             success = await self.client.close_position(
                 symbol=position['symbol'],
                 side=position['side'],
@@ -265,8 +531,8 @@ class ScalpingStrategy:
             
             if success:
                 # Удаляем из активных позиций
-                self.active_positions = [p for p in self.active_positions if p != position]
-                self.logger.info(f"Позиция закрыта: {position}")
+                self.book.remove(position['order_id'])
+                self.logger.info("Позиция закрыта: %s", position)
                 return True
             
             return False
@@ -275,24 +541,101 @@ class ScalpingStrategy:
             self.logger.error(f"Ошибка при закрытии позиции: {e}")
             return False
     
-    async def update_positions(self, symbol: str):
-        """Обновляет информацию о позициях"""
+    def exit_orders_of(self, position: Dict) -> List[str]:
+        """orderId ожидающих на бирже ордеров выхода позиции: не больше одного TP и одного SL"""
+        self.bind_exit_orders(position)
+        return [order_id for order_id in position.get('exit_order_ids', {}).values() if order_id in self.exit_orders]
+    
+    @staticmethod
+    def is_exit_order_of(position: Dict, order: Dict) -> bool:
+        """Условный ордер выхода подходит позиции: встречная сторона, уровень TP/SL и объем входа"""
+        exit_reason = EXIT_ORDER_TYPES.get(order.get('stopOrderType'))
+        if exit_reason is None or not position.get('exchange_tpsl') or position['side'] == order.get('side'):
+            return False
+        level = position['take_profit' if exit_reason == EXIT_TAKE_PROFIT else 'stop_loss']
+        trigger_price = float(order.get('triggerPrice') or 0)
+        qty = float(order.get('qty') or 0)
+        return abs(level - trigger_price) <= trigger_price * 1e-9 and abs(qty - float(position['size'])) <= qty * 1e-9
+    
+    def bind_exit_orders(self, position: Dict):
+        """Закрепляет за позицией ее ордера TP/SL из ожидающих, еще не закрепленных за другими входами
+        
+        Биржа выставляет их при исполнении входа, поэтому ордер, созданный раньше
+        исполнения, позиции не подходит. У входов с одинаковыми уровнями и объемом
+        ордера различаются только так, поэтому их orderId хранятся в позиции.
+        """
+        bound = position.setdefault('exit_order_ids', {})
+        if len(bound) == len(set(EXIT_ORDER_TYPES.values())):
+            return
+        claimed = {order_id for entry in self.positions.values() for order_id in entry.get('exit_order_ids', {}).values()}
+        fill_time = position.get('fill_time') or 0
+        for order_id, order in sorted(self.exit_orders.items(), key=lambda item: int(item[1].get('createdTime') or 0)):
+            exit_reason = EXIT_ORDER_TYPES[order['stopOrderType']]
+            if exit_reason in bound or order_id in claimed or not self.is_exit_order_of(position, order):
+                continue
+            if int(order.get('createdTime') or fill_time) < fill_time - EXIT_ORDER_CLOCK_SKEW_MS:
+                continue
+            bound[exit_reason] = order_id
+            claimed.add(order_id)
+    
+    def position_of_exit_order(self, order: Dict) -> Optional[Dict]:
+        """Позиция, за которой закреплен ордер выхода (ордера незакрепленных позиций закрепляются сейчас)"""
+        # Старые входы — первыми: их ордера выхода выставлены раньше
+        for position in sorted(self.positions.values(), key=lambda entry: entry.get('fill_time') or 0):
+            self.bind_exit_orders(position)
+            if order['orderId'] in position['exit_order_ids'].values():
+                return position
+        # Ожидающий ордер мог не прийти из потока: подходит вход без закрепленного ордера этого типа
+        exit_reason = EXIT_ORDER_TYPES[order['stopOrderType']]
+        return next((position for position in self.positions.values()
+                     if exit_reason not in position['exit_order_ids'] and self.is_exit_order_of(position, order)), None)
+    
+    def on_order_update(self, order: Dict):
+        """Сверяет позиции с условными ордерами выхода из приватного потока order"""
+        exit_reason = EXIT_ORDER_TYPES.get(order.get('stopOrderType'))
+        if order.get('symbol') != self.symbol or exit_reason is None:
+            return
+        
+        # Ожидающие ордера выхода нужны, чтобы отменить их при закрытии позиции по таймауту;
+        # они могут прийти раньше, чем позиция будет записана после исполнения входа
+        status = order.get('orderStatus')
+        if status == 'Untriggered':
+            self.exit_orders[order['orderId']] = order
+            return
+        
+        position = self.position_of_exit_order(order) if status == 'Filled' else None
+        self.exit_orders.pop(order['orderId'], None)
+        if position is None:
+            return
+        exit_price = float(order.get('avgPrice') or order.get('triggerPrice') or 0)
+        self.book.remove(position['order_id'])
+        self.logger.info("Позиция закрыта на бирже (%s) по %s: %s", exit_reason, exit_price, position)
+    
+    async def update_positions(self, symbol: str, current_price: Optional[float] = None):
+        """Проверяет выходы по позициям (цену можно передать из потока данных)
+        
+        Состав позиций сверяется с биржей приватными потоками, здесь запросов позиций нет.
+        """
         try:
-            current_positions = await self.client.get_open_positions(symbol)
-            current_price = await self.client.get_market_price(symbol)
+            if current_price is None:
+                current_price = await self.client.get_market_price(symbol)
             
             if not current_price:
                 return
+            self.last_price = current_price
+            
+            if self.pending_entries:
+                await self.resolve_pending_entries()
             
             # Обновляем активные позиции
-            for pos in self.active_positions[:]:
+            for pos in list(self.positions.values()):
                 should_close, reason = await self.should_close_position(pos, current_price)
                 
                 if should_close:
-                    self.logger.info(f"Закрытие позиции: {reason}")
+                    self.logger.info("Закрытие позиции: %s", reason)
                     await self.close_position_by_id(pos)
                 else:
-                    self.logger.debug(f"Позиция активна: {reason}")
+                    self.logger.debug("Позиция активна: %s", reason)
                     
         except Exception as e:
             self.logger.error(f"Ошибка при обновлении позиций: {e}")
@@ -300,8 +643,11 @@ class ScalpingStrategy:
     def get_strategy_status(self) -> Dict:
         """Возвращает текущий статус стратегии"""
         return {
-            "active_positions": len(self.active_positions),
+            "symbol": self.symbol,
+            "active_positions": len(self.positions),
             "max_positions": self.config.MAX_POSITIONS,
             "last_signal_time": self.last_signal_time.isoformat() if self.last_signal_time else None,
-            "positions": self.active_positions
+            "last_price": self.last_price,
+            "last_signal": self.last_analysis["signal"] if self.last_analysis else None,
+            "positions": list(self.positions.values())
         }
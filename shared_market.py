@@ -0,0 +1,309 @@
+"""
+Рыночные данные символов в общей памяти: процесс потоков пишет, процессы
+стратегий читают без сериализации сообщений: свечи — одним срезом под seqlock за цикл.
+"""
+
+import asyncio
+import time
+from collections.abc import Sequence
+from multiprocessing.shared_memory import SharedMemory
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from config import Config
+from decoding import KLINE_DTYPE
+
+# Ячейки заголовка символа (float64)
+SEQ = 0          # счетчик seqlock: нечетный, пока писатель обновляет символ
+HEAD = 1         # позиция следующей записи в кольце
+SIZE = 2         # свечей в кольце
+PRICE = 3        # последняя цена тикера
+EVENT = 4        # perf_counter прихода события (CLOCK_MONOTONIC общий для процессов)
+BOOK_READY = 5   # стакан валиден
+BEST_BID = 6
+BEST_ASK = 7
+SPREAD_BPS = 8
+IMBALANCE = 9
+MICROPRICE = 10
+UPDATE_ID = 11
+GAPS = 12
+HEADER_SLOTS = 16
+
+# Сколько раз читатель повторяет чтение под записью, прежде чем считать писателя упавшим
+SPIN_LIMIT = 10000
+
+# Колонки кольца: поля свечи MarketDataFeed
+COLUMNS = KLINE_DTYPE.names
+FEATURES = {"best_bid": BEST_BID, "best_ask": BEST_ASK, "spread_bps": SPREAD_BPS,
+            "imbalance": IMBALANCE, "microprice": MICROPRICE}
+
+
+class SharedMarket:
+    """Кольца свечей, цена и признаки стакана всех символов в одном блоке общей памяти
+
+    Кольцо устроено как KlineRing: каждая свеча пишется дважды, поэтому последние
+    capacity свечей лежат подряд. Согласованность чтения — seqlock: писатель делает
+    счетчик символа нечетным на время записи, читатель повторяет чтение, если счетчик
+    изменился. Отдельно хранятся heartbeat процессов (time.monotonic) для супервизора.
+    """
+
+    def __init__(self, shm: SharedMemory, symbols: List[str], capacity: int, processes: int, owner: bool):
+        self.shm = shm
+        self.symbols = list(symbols)
+        self.index = {symbol: i for i, symbol in enumerate(self.symbols)}
+        self.capacity = capacity
+        self.owner = owner
+        count = len(self.symbols)
+        header_size = count * HEADER_SLOTS * 8
+        data_size = count * len(COLUMNS) * 2 * capacity * 8
+        self.header = np.ndarray((count, HEADER_SLOTS), dtype=np.float64, buffer=shm.buf)
+        self.data = np.ndarray((count, len(COLUMNS), 2 * capacity), dtype=np.float64,
+                               buffer=shm.buf, offset=header_size)
+        self.heartbeats = np.ndarray(processes, dtype=np.float64, buffer=shm.buf,
+                                     offset=header_size + data_size)
+        # Писатель: поколение буфера свечей и начало последней записанной свечи по символу
+        self._written: Dict[int, tuple] = {}
+        self._feeds: Dict[str, "SharedFeed"] = {}
+        self._watcher: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def size(symbols: int, capacity: int, processes: int) -> int:
+        return (symbols * HEADER_SLOTS + symbols * len(COLUMNS) * 2 * capacity + processes) * 8
+
+    @classmethod
+    def create(cls, symbols: List[str], capacity: int, processes: int) -> "SharedMarket":
+        """Создает блок (супервизор); он же удаляет его в close()"""
+        shm = SharedMemory(create=True, size=cls.size(len(symbols), capacity, processes))
+        market = cls(shm, symbols, capacity, processes, owner=True)
+        market.header[:] = 0
+        market.heartbeats[:] = time.monotonic()
+        return market
+
+    @classmethod
+    def attach(cls, name: str, symbols: List[str], capacity: int, processes: int) -> "SharedMarket":
+        """Подключается к блоку супервизора из дочернего процесса
+
+        Дочерние процессы делят трекер ресурсов с супервизором, поэтому повторная
+        регистрация блока при подключении ничего не меняет: удаляет его только супервизор.
+        """
+        shm = SharedMemory(name=name)
+        return cls(shm, symbols, capacity, processes, owner=False)
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    def close(self):
+        # Представления numpy держат буфер: без них закрытие падает с BufferError
+        self.header = self.data = self.heartbeats = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+    def repair(self):
+        """Завершает записи, оборванные падением прошлого процесса потоков (нечетный seq)"""
+        self.header[:, SEQ] += self.header[:, SEQ] % 2
+
+    def beat(self, slot: int):
+        """Отметка живости процесса slot"""
+        self.heartbeats[slot] = time.monotonic()
+
+    # Писатель (процесс потоков)
+
+    def publish(self, symbol: str, feed):
+        """Переносит состояние MarketDataFeed символа в общую память: только новые и обновленные свечи"""
+        index = self.index[symbol]
+        header, ring = self.header[index], self.data[index]
+        candles = feed.candles
+        header[SEQ] += 1
+        try:
+            generation, last_start = self._written.get(index, (None, None))
+            if generation != feed.resyncs or last_start is None:
+                # Буфер свечей пересобран (старт, переподключение): кольцо пишется заново
+                header[HEAD] = header[SIZE] = 0
+                pending = list(candles)
+            else:
+                pending = []
+                for candle in reversed(candles):
+                    if candle["start"] < last_start:
+                        break
+                    pending.append(candle)
+                pending.reverse()
+            for candle in pending:
+                self._write(header, ring, candle)
+            if candles:
+                self._written[index] = (feed.resyncs, candles[-1]["start"])
+            if feed.last_price:
+                header[PRICE] = feed.last_price
+            header[EVENT] = feed.event_time or time.perf_counter()
+            feed.event_time = None
+            book = feed.book
+            if book is not None:
+                header[BOOK_READY] = book.ready
+                header[GAPS] = book.gaps
+                if book.ready:
+                    features = book.features(feed.config.ORDERBOOK_LEVELS)
+                    header[UPDATE_ID] = features["update_id"]
+                    for name, slot in FEATURES.items():
+                        header[slot] = features[name] if features[name] is not None else np.nan
+        finally:
+            header[SEQ] += 1
+
+    def _write(self, header: np.ndarray, ring: np.ndarray, candle: Dict):
+        capacity = self.capacity
+        head, size = int(header[HEAD]), int(header[SIZE])
+        row = [candle[column] for column in COLUMNS]
+        if size and ring[0, (head - 1) % capacity] == candle["start"]:
+            position = (head - 1) % capacity
+        else:
+            position = head
+            header[HEAD] = (head + 1) % capacity
+            header[SIZE] = min(size + 1, capacity)
+        ring[:, position] = row
+        ring[:, position + capacity] = row
+
+    # Читатель (процессы стратегий)
+
+    def feed(self, symbol: str) -> "SharedFeed":
+        """Поток символа для ScalpingBot процесса стратегий"""
+        if symbol not in self._feeds:
+            self._feeds[symbol] = SharedFeed(self, self.index[symbol])
+        return self._feeds[symbol]
+
+    def start(self, poll_interval: float):
+        """Запускает опрос счетчиков символов процесса: изменение будит цикл символа"""
+        if self._watcher is None:
+            self._watcher = asyncio.create_task(self._watch(poll_interval))
+
+    def stop(self):
+        if self._watcher is not None:
+            self._watcher.cancel()
+            self._watcher = None
+
+    def snapshot(self, index: int) -> Tuple[float, np.ndarray]:
+        """Счетчик seqlock и копия свечей символа, сделанная без записи посередине"""
+        header = self.header[index]
+        for _ in range(SPIN_LIMIT):
+            seq = header[SEQ]
+            if seq % 2:
+                continue
+            block = self._tail(header, index)
+            if header[SEQ] == seq:
+                return seq, block
+        # Писатель упал посреди записи: берем как есть
+        return header[SEQ], self._tail(header, index)
+
+    def _tail(self, header: np.ndarray, index: int) -> np.ndarray:
+        size = int(header[SIZE])
+        end = int(header[HEAD]) + self.capacity
+        return self.data[index, :, end - size:end].copy()
+
+    async def _watch(self, poll_interval: float):
+        feeds = list(self._feeds.values())
+        rows = np.array([feed.index for feed in feeds], dtype=np.int64)
+        seen = np.full(len(rows), -1.0)
+        while True:
+            # Один векторный просмотр счетчиков всех символов процесса
+            seqs = self.header[rows, SEQ]
+            for i in np.flatnonzero((seqs != seen) & (seqs % 2 == 0)):
+                seen[i] = seqs[i]
+                feeds[i].notify()
+            await asyncio.sleep(poll_interval)
+
+
+class RingCandles(Sequence):
+    """Снимок свечей символа из общей памяти как последовательность свечей-словарей MarketDataFeed
+
+    Колонки скопированы под seqlock одним срезом, поэтому за цикл стратегии свечи не
+    сдвигаются, даже если процесс потоков успел записать новую. Словарь собирается
+    только для запрошенной свечи: analyze_stream читает по одной-две свечи за цикл.
+    """
+
+    def __init__(self, block: np.ndarray):
+        # Колонки × свечи по возрастанию времени
+        self.block = block
+
+    def __len__(self) -> int:
+        return self.block.shape[1]
+
+    def __getitem__(self, i: int) -> Dict:
+        candle = dict(zip(COLUMNS, self.block[:, i].tolist()))
+        candle["start"] = int(candle["start"])
+        candle["confirm"] = bool(candle["confirm"])
+        return candle
+
+
+class SharedBook:
+    """Признаки стакана из общей памяти с интерфейсом OrderBook, который нужен стратегии и статусу"""
+
+    def __init__(self, market: SharedMarket, index: int):
+        self.market = market
+        self.index = index
+
+    @property
+    def ready(self) -> bool:
+        return bool(self.market.header[self.index, BOOK_READY])
+
+    @property
+    def gaps(self) -> int:
+        return int(self.market.header[self.index, GAPS])
+
+    def features(self, levels: int = 5) -> Dict:
+        """Признаки, посчитанные процессом потоков (для ORDERBOOK_LEVELS уровней)"""
+        header = self.market.header[self.index]
+        features = {name: None if np.isnan(header[slot]) else float(header[slot])
+                    for name, slot in FEATURES.items()}
+        features["update_id"] = int(header[UPDATE_ID])
+        return features
+
+
+class SharedFeed:
+    """Поток символа в процессе стратегий: тот же интерфейс, что у MarketDataFeed"""
+
+    def __init__(self, market: SharedMarket, index: int):
+        self.market = market
+        self.index = index
+        self.symbol = market.symbols[index]
+        self._candles: Tuple[Optional[float], Optional[RingCandles]] = (None, None)
+        self.book = SharedBook(market, index) if Config.ORDERBOOK_DEPTH > 0 else None
+        self.event_time = None
+        self._updated = asyncio.Event()
+
+    @property
+    def candles(self) -> RingCandles:
+        """Согласованный снимок свечей; пока процесс потоков ничего не записал, тот же объект"""
+        seq, candles = self._candles
+        if seq is None or self.market.header[self.index, SEQ] != seq:
+            seq, block = self.market.snapshot(self.index)
+            candles = RingCandles(block)
+            self._candles = (seq, candles)
+        return candles
+
+    @property
+    def last_price(self) -> Optional[float]:
+        price = self.market.header[self.index, PRICE]
+        return float(price) if price else None
+
+    def notify(self):
+        if not self._updated.is_set():
+            self.event_time = float(self.market.header[self.index, EVENT]) or None
+        self._updated.set()
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    async def wait_for_update(self, timeout: Optional[float] = None) -> bool:
+        """Ждет записи процесса потоков по символу"""
+        try:
+            await asyncio.wait_for(self._updated.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        self._updated.clear()
+        return True
+
+    def get_kline_data(self) -> List[Dict]:
+        return list(self.candles)
@@ -0,0 +1,120 @@
+from typing import Any, Callable, Dict, Iterable, Mapping, Optional, Tuple
+
+import numpy as np
+
+# Имя входа графа со стакановыми признаками (OrderBook.features); он обновляется
+# чаще свечей, поэтому передается при оценке правил, а не при смене бара
+BOOK = "book"
+
+
+class SignalGraph:
+    """Граф индикаторов символа: узлы считаются лениво и не больше раза на бар
+
+    Узел — функция от значений своих зависимостей (других узлов или входов бара).
+    Параметры входят в имя узла ("ema(12)"), поэтому стратегии на одном символе с
+    одинаковыми параметрами делят узлы и их значения, а с разными получают свои.
+    Значения кэшируются до bind() следующего бара.
+    """
+
+    _shared: Dict[str, "SignalGraph"] = {}
+
+    @classmethod
+    def shared(cls, symbol: str) -> "SignalGraph":
+        """Общий граф символа для всех стратегий процесса"""
+        graph = cls._shared.get(symbol)
+        if graph is None:
+            graph = cls._shared[symbol] = cls()
+        return graph
+
+    def __init__(self):
+        self.nodes: Dict[str, Tuple[Callable, Tuple[str, ...]]] = {}
+        self.values: Dict[str, Any] = {}
+        self.bar = None
+        # Сколько раз узлы действительно вычислялись (остальные запросы — из кэша бара)
+        self.computed = 0
+
+    def define(self, name: str, compute: Callable, *deps: str) -> str:
+        """Объявляет узел, если его еще нет; возвращает имя для зависимостей и правил"""
+        if name not in self.nodes:
+            self.nodes[name] = (compute, deps)
+        return name
+
+    def bind(self, bar, **inputs) -> bool:
+        """Переходит к бару bar со входами inputs; False — бар тот же и значения кэша в силе"""
+        if bar == self.bar:
+            return False
+        self.bar = bar
+        self.values = dict(inputs)
+        return True
+
+    def __getitem__(self, name: str):
+        values = self.values
+        if name in values:
+            return values[name]
+        compute, deps = self.nodes[name]
+        value = values[name] = compute(*(self[dep] for dep in deps))
+        self.computed += 1
+        return value
+
+    def scalars(self) -> Dict[str, Any]:
+        """Вычисленные на этом баре узлы без рядов — для анализа и API статуса"""
+        return {name: value for name, value in self.values.items()
+                if name in self.nodes and not isinstance(value, np.ndarray)}
+
+
+class Rule:
+    """Правило сигнала: check(*значения deps) -> (направление +1/-1, причина) или None
+
+    Вклад в силу сигнала — weight * направление. Правила без срабатывания ничего не добавляют.
+    """
+
+    def __init__(self, name: str, weight: float, deps: Iterable[str], check: Callable):
+        self.name = name
+        self.weight = weight
+        self.deps = tuple(deps)
+        self.check = check
+
+
+class SignalPipeline:
+    """Правила стратегии над графом индикаторов
+
+    Правила проверяются по порядку (дешевые — раньше), узлы графа считаются только для
+    правил, которым они нужны. Сила и причины всегда учитывают все правила, как в
+    batch_indicators.compute_signals: бэктест, оптимизатор, статус и логи видят одни
+    и те же значения. veto проверяется до правил: сработавший запрет сразу дает HOLD.
+    """
+
+    def __init__(self, rules: Iterable[Rule], threshold: float = 2.0,
+                 veto: Optional[Callable[[Optional[Dict]], Optional[str]]] = None):
+        self.rules = list(rules)
+        self.threshold = threshold
+        self.veto = veto
+
+    def evaluate(self, values: Mapping, book: Optional[Dict] = None) -> Dict:
+        """Сигнал по значениям узлов (SignalGraph или готовый словарь) и признакам стакана"""
+        vetoed = self.veto(book) if self.veto is not None else None
+        if vetoed is not None:
+            return {"signal": "HOLD", "strength": 0, "reason": vetoed}
+
+        signals = []
+        strength = 0.0
+        for rule in self.rules:
+            if BOOK in rule.deps and book is None:
+                continue
+            result = rule.check(*(book if dep == BOOK else values[dep] for dep in rule.deps))
+            if result is not None:
+                direction, reason = result
+                strength += rule.weight * direction
+                signals.append(reason)
+
+        if strength >= self.threshold:
+            signal = "BUY"
+        elif strength <= -self.threshold:
+            signal = "SELL"
+        else:
+            signal = "HOLD"
+        return {
+            "signal": signal,
+            "strength": abs(strength),
+            "reason": "; ".join(signals) if signals else "Нет четких сигналов",
+        }
@@ -0,0 +1,182 @@
+import asyncio
+import json
+import logging
+from collections import deque
+from datetime import datetime
+from typing import Dict, List
+
+import numpy as np
+from aiohttp import web
+
+from config import Config
+from latency import recorder
+
+# Счетчики ScalpingBot.get_metrics для Prometheus: имя → (тип, описание); у counter суффикс _total
+PROMETHEUS_METRICS = {
+    "cycles": ("counter", "Циклы стратегии"),
+    "trades_opened": ("counter", "Открытые сделки"),
+    "trades_failed": ("counter", "Неудачные попытки открыть сделку"),
+    "uptime": ("gauge", "Время работы бота, секунды"),
+    "active_positions": ("gauge", "Открытые позиции"),
+    "rate_limited": ("counter", "Ответы биржи о превышении лимита запросов"),
+    "recorded": ("counter", "Сообщения рынка, записанные на диск"),
+    "recorder_dropped": ("counter", "Сообщения рынка, отброшенные при переполнении очереди записи"),
+    "log_dropped": ("counter", "Записи лога, отброшенные при переполнении очереди"),
+    "orderbook_gaps": ("counter", "Разрывы последовательности стакана"),
+}
+
+
+def to_json(data) -> str:
+    """JSON со значениями NumPy и datetime"""
+    def default(value):
+        if isinstance(value, np.generic):
+            return value.item()
+        if isinstance(value, np.ndarray):
+            return value.tolist()
+        if isinstance(value, datetime):
+            return value.isoformat()
+        return str(value)
+    return json.dumps(data, default=default, ensure_ascii=False)
+
+
+class MemoryLogHandler(logging.Handler):
+    """Последние записи лога в памяти для /api/logs"""
+
+    def __init__(self, capacity: int = 200):
+        super().__init__()
+        self.records = deque(maxlen=capacity)
+
+    def emit(self, record: logging.LogRecord):
+        self.records.append(record)
+
+    def entries(self, limit: int) -> List[Dict]:
+        records = list(self.records)[-limit:]
+        return [{"timestamp": datetime.fromtimestamp(record.created).isoformat(timespec="seconds"),
+                 "level": record.levelname, "message": record.getMessage()} for record in records]
+
+
+class StatusServer:
+    """HTTP API статуса в event loop бота: ответы строятся из состояния в памяти, без запросов к бирже
+
+    API только читает состояние. В ответах есть данные счета и кошелька, поэтому по
+    умолчанию сервер слушает 127.0.0.1 (STATUS_API_HOST).
+
+    /api/stream отдает статус через Server-Sent Events: снимок сериализуется один раз
+    за период и только пока есть подписчики.
+    """
+
+    def __init__(self, bot, host: str = None, port: int = None, push_interval: float = None):
+        self.config = Config()
+        self.bot = bot
+        self.host = host or self.config.STATUS_API_HOST
+        self.port = port or self.config.STATUS_API_PORT
+        self.push_interval = push_interval or self.config.STATUS_PUSH_INTERVAL
+        self.logger = logging.getLogger(__name__)
+
+        self.log_handler = MemoryLogHandler()
+        self._runner = None
+        self._publisher_task = None
+        self._clients = 0
+        self._closing = False
+        self._payload = b""
+        self._published = asyncio.Condition()
+
+    def make_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/api/status", self._status)
+        app.router.add_get("/api/positions", self._positions)
+        app.router.add_get("/api/indicators", self._indicators)
+        app.router.add_get("/api/metrics", self._metrics)
+        app.router.add_get("/api/logs", self._logs)
+        app.router.add_get("/api/stream", self._stream)
+        app.router.add_get("/metrics", self._prometheus)
+        return app
+
+    async def start(self):
+        logging.getLogger().addHandler(self.log_handler)
+        self._runner = web.AppRunner(self.make_app(), access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        self._publisher_task = asyncio.create_task(self._publisher())
+        self.logger.info(f"API статуса слушает {self.host}:{self.port}")
+
+    async def stop(self):
+        logging.getLogger().removeHandler(self.log_handler)
+        if self._publisher_task:
+            self._publisher_task.cancel()
+        # Открытые потоки иначе держат cleanup до таймаута остановки сервера
+        self._closing = True
+        async with self._published:
+            self._published.notify_all()
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    @staticmethod
+    def _json(data) -> web.Response:
+        return web.Response(text=to_json(data), content_type="application/json")
+
+    async def _status(self, request):
+        return self._json(await self.bot.get_bot_status())
+
+    async def _positions(self, request):
+        return self._json({symbol: list(strategy.positions.values())
+                           for symbol, strategy in self.bot.strategies.items()})
+
+    async def _indicators(self, request):
+        return self._json({symbol: strategy.last_analysis for symbol, strategy in self.bot.strategies.items()})
+
+    async def _metrics(self, request):
+        return self._json(self.bot.get_metrics())
+
+    async def _prometheus(self, request):
+        """Счетчики бота и гистограммы задержек в текстовом формате Prometheus"""
+        lines = []
+        for name, value in self.bot.get_metrics().items():
+            if not isinstance(value, (int, float)):
+                continue
+            kind, description = PROMETHEUS_METRICS.get(name, ("untyped", name))
+            metric = f"scalping_{name}_total" if kind == "counter" else f"scalping_{name}"
+            lines += [f"# HELP {metric} {description}", f"# TYPE {metric} {kind}", f"{metric} {value}"]
+        body = "\n".join(lines) + "\n" + recorder.prometheus()
+        return web.Response(body=body.encode(), headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+    async def _logs(self, request):
+        try:
+            limit = int(request.query.get("limit", 100))
+        except ValueError:
+            raise web.HTTPBadRequest(text="limit должен быть целым числом")
+        limit = min(max(limit, 1), self.log_handler.records.maxlen)
+        return self._json(self.log_handler.entries(limit))
+
+    async def _publisher(self):
+        """Раз в период сериализует статус, если кто-то подписан на поток"""
+        while True:
+            await asyncio.sleep(self.push_interval)
+            if not self._clients:
+                continue
+            self._payload = b"data: " + to_json(await self.bot.get_bot_status()).encode() + b"\n\n"
+            async with self._published:
+                self._published.notify_all()
+
+    async def _stream(self, request):
+        response = web.StreamResponse(headers={
+            "Content-Type": "text/event-stream",
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+        })
+        await response.prepare(request)
+        self._clients += 1
+        try:
+            await response.write(b"data: " + to_json(await self.bot.get_bot_status()).encode() + b"\n\n")
+            while True:
+                async with self._published:
+                    await self._published.wait()
+                if self._closing:
+                    break
+                await response.write(self._payload)
+        except ConnectionResetError:
+            pass
+        finally:
+            self._clients -= 1
+        return response
@@ -0,0 +1,260 @@
+"""
+Режим нескольких процессов (SHARD_WORKERS > 1): символы делятся между процессами
+стратегий, рыночные данные пишет один процесс потоков в общую память, а к бирже
+процессы стратегий обращаются через процесс шлюза ордеров.
+"""
+
+import asyncio
+import logging
+import multiprocessing as mp
+import os
+import shutil
+import signal
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+from config import Config
+from order_gateway import GatewayClient, process_config, run_gateway
+from shared_market import SharedMarket
+
+# Ячейки heartbeat: процесс потоков, шлюз, дальше процессы стратегий
+FEED_SLOT = 0
+GATEWAY_SLOT = 1
+WORKER_SLOT = 2
+
+# Пауза перед перезапуском упавшего процесса растет вдвое до этого предела, секунды
+MAX_RESTART_DELAY = 60.0
+# Сколько ждать завершения процесса стратегий (закрытие позиций), секунды
+WORKER_STOP_TIMEOUT = 60.0
+# Сколько ждать завершения шлюза и процесса потоков, секунды
+SERVICE_STOP_TIMEOUT = 10.0
+
+
+async def _heartbeat(market: SharedMarket, slot: int):
+    while True:
+        market.beat(slot)
+        await asyncio.sleep(1)
+
+
+def run_feed(market_name: str, symbols: List[str], capacity: int, processes: int):
+    """Точка входа процесса потоков: MarketDataFeed всех символов пишут в общую память; останавливается по SIGTERM"""
+    from log_pipeline import setup_logging
+
+    # Ctrl+C получает вся группа процессов: данные нужны процессам стратегий до их остановки
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    listener = setup_logging(process_config("feed"))
+    market = SharedMarket.attach(market_name, symbols, capacity, processes)
+    # Прошлый процесс потоков мог упасть посреди записи
+    market.repair()
+    try:
+        asyncio.run(_run_feed(market, symbols))
+    finally:
+        market.close()
+        if listener:
+            listener.stop()
+
+
+async def _run_feed(market: SharedMarket, symbols: List[str]):
+    from bybit_client import BybitClient
+    from candle_store import CandleStore
+    from market_data import MarketDataFeed
+    from market_recorder import MarketRecorder
+
+    config = Config()
+    logger = logging.getLogger(__name__)
+    stop = asyncio.Event()
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stop.set)
+    beat = asyncio.create_task(_heartbeat(market, FEED_SLOT))
+    client = BybitClient.shared()
+    store = CandleStore() if config.USE_CANDLE_STORE else None
+    recorder = MarketRecorder() if config.RECORD_MARKET_DATA else None
+    if recorder:
+        recorder.start()
+    # Буфер свечей равен кольцу общей памяти: процессы стратегий видят его целиком
+    feeds = {symbol: MarketDataFeed(client, symbol, config.CANDLE_INTERVAL, market.capacity,
+                                    store=store, recorder=recorder) for symbol in symbols}
+    tasks = []
+    try:
+        for symbol, feed in feeds.items():
+            await feed.start()
+            market.publish(symbol, feed)
+            tasks.append(asyncio.create_task(_publish(market, symbol, feed)))
+        logger.info(f"Процесс потоков запущен: {', '.join(feeds)}")
+        await stop.wait()
+    finally:
+        for task in tasks + [beat]:
+            task.cancel()
+        for feed in feeds.values():
+            await feed.stop()
+        if recorder:
+            await asyncio.to_thread(recorder.stop)
+        client.close_connection()
+
+
+async def _publish(market: SharedMarket, symbol: str, feed):
+    logger = logging.getLogger(__name__)
+    while True:
+        if not await feed.wait_for_update(timeout=1):
+            continue
+        try:
+            market.publish(symbol, feed)
+        except Exception as e:
+            logger.error(f"Ошибка при записи {symbol} в общую память: {e}")
+
+
+def run_worker(worker: int, symbols: List[str], all_symbols: List[str], market_name: str, capacity: int,
+               processes: int, address: str, authkey: bytes):
+    """Точка входа процесса стратегий: ScalpingBot по своим символам поверх общей памяти и шлюза"""
+    asyncio.run(_run_worker(worker, symbols, all_symbols, market_name, capacity, processes, address, authkey))
+
+
+async def _run_worker(worker: int, symbols: List[str], all_symbols: List[str], market_name: str, capacity: int,
+                      processes: int, address: str, authkey: bytes):
+    from main import ScalpingBot
+
+    market = SharedMarket.attach(market_name, all_symbols, capacity, processes)
+    client = GatewayClient(worker, address, authkey)
+    # ScalpingBot ставит обработчики SIGINT и SIGTERM: процесс закрывает позиции и выходит сам
+    bot = ScalpingBot(symbols, client, market, process_config(f"worker{worker}"))
+    beat = asyncio.create_task(_heartbeat(market, WORKER_SLOT + worker))
+    try:
+        await bot.run()
+    finally:
+        beat.cancel()
+        bot.stop_logging()
+        market.close()
+
+
+class Supervisor:
+    """Запускает процессы потоков, шлюза и стратегий и перезапускает упавшие и зависшие
+
+    Символы распределяются по процессам стратегий по кругу. Зависшим считается процесс,
+    который дольше SHARD_HEARTBEAT_TIMEOUT не отмечался в общей памяти (его event loop
+    заблокирован). При остановке процессы стратегий закрывают позиции через еще
+    работающий шлюз, после этого останавливаются шлюз и процесс потоков.
+    """
+
+    def __init__(self, symbols: Optional[List[str]] = None, workers: Optional[int] = None):
+        self.config = Config()
+        self.symbols = list(symbols or self.config.SYMBOLS)
+        workers = min(workers or self.config.SHARD_WORKERS, len(self.symbols))
+        self.shards = [self.symbols[i::workers] for i in range(workers)]
+        self.owners = {symbol: i for i, shard in enumerate(self.shards) for symbol in shard}
+        # spawn: дочерние процессы не наследуют потоки и сокеты родителя
+        self.context = mp.get_context("spawn")
+        # Сокет шлюза ордеров и ключ, которым процессы стратегий подтверждают подключение
+        self.socket_dir = tempfile.mkdtemp(prefix="skalping-")
+        self.address = os.path.join(self.socket_dir, "gateway.sock")
+        self.authkey = os.urandom(16)
+        self.slots = WORKER_SLOT + len(self.shards)
+        self.market: Optional[SharedMarket] = None
+        self.processes: Dict[int, mp.Process] = {}
+        self.started: Dict[int, float] = {}
+        self.restarts: Dict[int, int] = {}
+        self.restart_at: Dict[int, float] = {}
+        self.running = False
+        self.log_listener = None
+        self.logger = logging.getLogger(__name__)
+
+    def _target(self, slot: int):
+        market, capacity = self.market.name, self.market.capacity
+        if slot == FEED_SLOT:
+            return "feed", run_feed, (market, self.symbols, capacity, self.slots)
+        if slot == GATEWAY_SLOT:
+            return "gateway", run_gateway, (self.address, self.authkey, self.owners, market, self.symbols,
+                                            capacity, self.slots, GATEWAY_SLOT)
+        worker = slot - WORKER_SLOT
+        return f"worker{worker}", run_worker, (worker, self.shards[worker], self.symbols, market, capacity,
+                                               self.slots, self.address, self.authkey)
+
+    def _spawn(self, slot: int):
+        name, target, args = self._target(slot)
+        # Отметка при запуске: новый процесс получает полный таймаут на импорт и старт
+        self.market.beat(slot)
+        process = self.context.Process(target=target, args=args, name=name)
+        process.start()
+        self.processes[slot] = process
+        self.started[slot] = time.monotonic()
+        self.logger.info(f"Процесс {name} запущен (pid {process.pid})")
+
+    def _check(self, slot: int):
+        """Перезапускает процесс slot, если он упал или завис; пауза перед перезапуском растет вдвое"""
+        process = self.processes[slot]
+        now = time.monotonic()
+        if process.is_alive():
+            if now - self.market.heartbeats[slot] <= self.config.SHARD_HEARTBEAT_TIMEOUT:
+                # Проработал дольше предельной паузы — отсчет перезапусков заново
+                if now - self.started[slot] > MAX_RESTART_DELAY:
+                    self.restarts[slot] = 0
+                return
+            self.logger.error(f"Процесс {process.name} не отвечает {self.config.SHARD_HEARTBEAT_TIMEOUT} с")
+            process.kill()
+            process.join()
+        if slot not in self.restart_at:
+            restarts = self.restarts.get(slot, 0)
+            self.restarts[slot] = restarts + 1
+            self.restart_at[slot] = now + min(2 ** restarts, MAX_RESTART_DELAY)
+            self.logger.error(f"Процесс {process.name} завершился с кодом {process.exitcode}, "
+                              f"перезапуск через {self.restart_at[slot] - now:.0f} с")
+        if now >= self.restart_at[slot]:
+            del self.restart_at[slot]
+            self._spawn(slot)
+
+    def _signal_handler(self, signum, frame):
+        self.logger.info(f"Получен сигнал {signum}, завершаем работу...")
+        self.running = False
+
+    def run(self):
+        """Запускает процессы и следит за ними до сигнала остановки"""
+        from log_pipeline import setup_logging
+
+        self.log_listener = setup_logging(self.config)
+        signal.signal(signal.SIGINT, self._signal_handler)
+        signal.signal(signal.SIGTERM, self._signal_handler)
+        self.market = SharedMarket.create(self.symbols, self.config.SHARD_RING_SIZE, self.slots)
+        self.running = True
+        try:
+            self.logger.info(f"Символы по процессам: {self.shards}")
+            for slot in range(self.slots):
+                self._spawn(slot)
+            while self.running:
+                time.sleep(1)
+                for slot in range(self.slots):
+                    if self.running:
+                        self._check(slot)
+        finally:
+            self.shutdown()
+
+    def shutdown(self):
+        """Останавливает процессы стратегий, затем шлюз и процесс потоков, и удаляет общую память"""
+        workers = [self.processes[slot] for slot in range(WORKER_SLOT, self.slots) if slot in self.processes]
+        for process in workers:
+            if process.is_alive():
+                # Тот же путь, что у Ctrl+C: ScalpingBot закрывает позиции через шлюз
+                process.terminate()
+        deadline = time.monotonic() + WORKER_STOP_TIMEOUT
+        for process in workers:
+            process.join(max(deadline - time.monotonic(), 0))
+            if process.is_alive():
+                self.logger.error(f"Процесс {process.name} не завершился, останавливаем принудительно")
+                process.kill()
+                process.join()
+        services = [self.processes[slot] for slot in (GATEWAY_SLOT, FEED_SLOT) if slot in self.processes]
+        for process in services:
+            if process.is_alive():
+                process.terminate()
+        for process in services:
+            process.join(SERVICE_STOP_TIMEOUT)
+            if process.is_alive():
+                process.kill()
+                process.join()
+        self.processes = {}
+        if self.market is not None:
+            self.market.close()
+            self.market = None
+        shutil.rmtree(self.socket_dir, ignore_errors=True)
+        self.logger.info("Все процессы остановлены")
+        if self.log_listener:
+            self.log_listener.stop()
+            self.log_listener = None
@@ -15,7 +15,7 @@ async def test_connection():
     print("🔌 Тестирование подключения к Bybit API...")
     
     try:
-        client = BybitClient()
+        client = BybitClient.shared()
         
         # Тест получения информации об аккаунте
         account_info = await client.get_account_info()
@@ -55,8 +55,8 @@ async def test_strategy():
     try:
         strategy = ScalpingStrategy()
         
-        # Получаем данные для анализа
-        client = BybitClient()
+        # Получаем данные для анализа через общий клиент стратегии
+        client = strategy.client
         kline_data = await client.get_kline_data(Config.SYMBOL, Config.CANDLE_INTERVAL, 100)
         
         if not kline_data:
@@ -72,9 +72,9 @@ async def test_strategy():
         print(f"   Причина: {analysis['reason']}")
         
         if 'indicators' in analysis:
-            indicators = analysis['indicators']
-            print(f"   RSI: {indicators.get('rsi', 'N/A'):.2f}")
-            print(f"   Текущая цена: {indicators.get('current_price', 'N/A'):.2f}")
+            # Только индикаторы, которые понадобились правилам на этой свече
+            for name, value in analysis['indicators'].items():
+                print(f"   {name}: {value}")
         
         # Тест проверки открытия позиции
         should_open, reason = await strategy.should_open_position(Config.SYMBOL)